@@ -1,13 +1,38 @@
 import os
 import logging
+import click
 import json
-import re
-import requests
-from datetime import datetime
-from flask import Flask, render_template, request, jsonify
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, inspect
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from werkzeug.middleware.proxy_fix import ProxyFix
-from mistral_recipe_bot import get_mistral_recipes
-from models import db, User, Product, Budget, CartItem, SharedCartSession, SharedCartItem, RecommendationLog
+from mistral_recipe_bot import (MISTRAL_TIMEOUT, mistral_dependency, recipe_cache,
+                                recipe_requests, stream_mistral_recipes)
+from models import db, User, Product, ProductTag, Budget, CartItem, SharedCartSession, SharedCartItem, SharedCartEvent, RecommendationLog
+from catalog_index import catalog_version, get_catalog_index, parse_tags, split_keywords
+from batch_scoring import score_batch
+from basket_optimizer import basket_candidates, optimize_basket
+from context_index import match_terms, rank_matches
+from cart_events import (ITEM_ADDED, ITEM_REMOVED, QUANTITY_CHANGED,
+                         add_event_revisions, cart_event_broker, events_since,
+                         latest_revision, record_cart_event)
+from cart_items import (MAX_BATCH_ITEMS, add_cart_item_prices, merge_duplicate_cart_items,
+                        upsert_cart_items)
+from cart_totals import adjust_cart_total, cart_totals, check_cart_totals
+from catalog_export import gzip_stream, iter_catalog_ndjson
+from catalog_snapshot import PRODUCT_FIELDS, get_catalog_snapshot, product_to_dict
+from image_prewarm import prewarm_images
+from product_tags import backfill_product_tags, tagged_product_ids
+from recommendation_log import RecommendationLogWriter
+from recipe_jobs import RecipeJobRunner, RecipeJobsBusy, recipe_job_dict
+from image_cache import NEGATIVE_TTL, POSITIVE_TTL, ImageCache
+from resilience import DependencyUnavailable, dependency_stats
+from search_analytics import (DAY, GRANULARITIES, HOUR, compact_search_logs,
+                              prune_search_logs, search_analytics)
+from suggest_index import DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS, suggestion_index
+from ttl_cache import TTLCache
+from walmart_images import image_lookups, resolve_image, resolve_images, walmart_dependency
 
 # Configure logging for debugging
 logging.basicConfig(level=logging.DEBUG)
@@ -40,6 +65,67 @@ app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 # Initialize database
 db.init_app(app)
 
+# Number of results /api/recommend returns by default, and the most a
+# caller may ask for with the `limit` parameter
+DEFAULT_RECOMMEND_LIMIT = 12
+MAX_RECOMMEND_LIMIT = 100
+
+# Most prompts accepted by one /api/recommend/batch call
+MAX_BATCH_QUERIES = 5000
+
+# Basket optimizer limits: needs per request, units of one product,
+# distinct products per category and the DP time box (seconds) before
+# falling back to the greedy fill
+MAX_BASKET_NEEDS = 20
+MAX_BASKET_QUANTITY = 10
+DEFAULT_BASKET_QUANTITY = 3
+DEFAULT_BASKET_PER_CATEGORY = 3
+MAX_BASKET_PER_CATEGORY = 10
+BASKET_TIME_BUDGET = float(os.environ.get("BASKET_TIME_BUDGET", 0.05))
+
+# Image lookups shared by all workers on the host through a SQLite file
+image_cache = ImageCache(
+    os.environ.get("IMAGE_CACHE_PATH",
+                   os.path.join(app.instance_path, "image_cache.db")),
+    positive_ttl=int(os.environ.get("IMAGE_CACHE_TTL", POSITIVE_TTL)),
+    negative_ttl=int(os.environ.get("IMAGE_CACHE_NEGATIVE_TTL", NEGATIVE_TTL)))
+
+# Size and deadline (seconds) of /walmart-image/batch requests
+MAX_IMAGE_BATCH_QUERIES = 60
+IMAGE_BATCH_TIMEOUT = 8
+MAX_IMAGE_BATCH_TIMEOUT = 15
+
+# Page size of /api/products when any filter or cursor is given
+DEFAULT_PRODUCTS_PAGE = 50
+MAX_PRODUCTS_PAGE = 500
+PRODUCT_QUERY_ARGS = ('cursor', 'limit', 'fields', 'category', 'in_stock',
+                      'min_price', 'max_price', 'tags')
+
+# Recent /api/recommend results, invalidated whenever the catalog changes
+recommend_cache = TTLCache(
+    maxsize=int(os.environ.get("RECOMMEND_CACHE_SIZE", 2048)),
+    ttl=int(os.environ.get("RECOMMEND_CACHE_TTL", 300)))
+
+# Searches are logged for analytics off the request path, in batches
+recommendation_logs = RecommendationLogWriter(
+    max_queue=int(os.environ.get("RECOMMEND_LOG_QUEUE", 10000)),
+    batch_size=int(os.environ.get("RECOMMEND_LOG_BATCH", 500)),
+    flush_interval=float(os.environ.get("RECOMMEND_LOG_FLUSH_SECONDS", 2)))
+
+# Recipe generations run on a bounded pool so slow upstream completions
+# never pin a request worker; unfinished jobs older than the Mistral
+# timeout are reported as expired
+recipe_jobs = RecipeJobRunner(
+    workers=int(os.environ.get("RECIPE_JOB_WORKERS", 4)),
+    max_pending=int(os.environ.get("RECIPE_JOB_QUEUE", 32)),
+    result_ttl=int(os.environ.get("RECIPE_CACHE_TTL", 6 * 3600)),
+    stale_after=sum(MISTRAL_TIMEOUT) + 30)
+
+# Seconds /api/recipe-bot waits for a new recipe before answering with a
+# job to poll, and the longest wait a job poll may ask for
+RECIPE_SYNC_WAIT = float(os.environ.get("RECIPE_SYNC_WAIT", 10))
+MAX_RECIPE_JOB_WAIT = 30
+
 # Comprehensive product catalog with proper categories (prices in rupees)
 SAMPLE_PRODUCTS = [
     # Fruits & Vegetables
@@ -496,76 +582,105 @@ def index():
         firebase_app_id=os.environ.get('FIREBASE_APP_ID'))
 
 
+def load_products_by_id(product_ids, chunk_size=500):
+    """Fetch Product rows keyed by id, keeping each IN list small"""
+    product_ids = list(product_ids)
+    products = {}
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        for product in Product.query.filter(Product.id.in_(chunk)):
+            products[product.id] = product
+    return products
+
+
+def recommendation_payload(top, products=None):
+    """Build response dicts for scored (entry, score) pairs, in order"""
+    # Load full rows only for the final top-k products. The rows, not the
+    # index entries, are the source of price and tags, and products sold
+    # out since the index was built are dropped.
+    if products is None:
+        products = load_products_by_id({entry.id for entry, _ in top})
+
+    recommended = []
+    for entry, score in top:
+        product = products.get(entry.id)
+        if not product or not product.in_stock:
+            continue
+        recommended.append({
+            'id': product.id,
+            'name': product.name,
+            'price': float(product.price),
+            'category': product.category,
+            'tags': parse_tags(product.tags),
+            'description': product.description,
+            'image_url': product.image_url,
+            'in_stock': product.in_stock,
+            'match_score': score
+        })
+    return recommended
+
+
 @app.route('/api/recommend', methods=['POST'])
 def recommend_products():
     """
     Smart recommendation endpoint that filters products based on user prompt and budget
     """
+    started = time.perf_counter()
     try:
         data = request.get_json()
         prompt = data.get('prompt', '').lower().strip()
         budget = float(data.get('budget', 0))
+        try:
+            limit = min(max(int(data.get('limit', DEFAULT_RECOMMEND_LIMIT)), 1),
+                        MAX_RECOMMEND_LIMIT)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Limit must be an integer"}), 400
 
         if not prompt:
             return jsonify({"error": "Prompt is required"}), 400
 
-        # Get products from database
-        products = Product.query.filter_by(in_stock=True).all()
-        recommended = []
-
-        # Split prompt into keywords for better matching
-        keywords = [
-            word.strip() for word in prompt.split() if len(word.strip()) > 2
-        ]
-
-        for product in products:
-            # Parse tags from JSON
-            tags = json.loads(product.tags) if product.tags else []
-
-            # Calculate match score
-            score = 0
-            product_text = f"{product.name.lower()} {product.category.lower()} {' '.join(tags).lower()}"
-
-            # Exact phrase match gets highest score
-            if prompt in product_text:
-                score += 10
-
-            # Keyword matching
-            for keyword in keywords:
-                if keyword in product.name.lower():
-                    score += 5
-                elif keyword in product.category.lower():
-                    score += 3
-                elif any(keyword in tag.lower() for tag in tags):
-                    score += 2
-
-            # Budget filter
-            if budget > 0 and float(product.price) > budget:
-                continue
-
-            if score > 0:
-                recommended.append({
-                    'id': product.id,
-                    'name': product.name,
-                    'price': float(product.price),
-                    'category': product.category,
-                    'tags': tags,
-                    'description': product.description,
-                    'image_url': product.image_url,
-                    'in_stock': product.in_stock,
-                    'match_score': score
-                })
-
-        # Sort by match score (descending) then by price (ascending)
-        recommended.sort(key=lambda x: (-x['match_score'], x['price']))
-        recommended = recommended[:12]  # Limit to top 12 results
+        keywords = split_keywords(prompt)
+        tags = data.get('tags') or []
+        if isinstance(tags, str):
+            tags = tags.split(',')
+        tags = tuple(sorted({tag.strip().lower() for tag in tags if tag.strip()}))
+        match_all = data.get('tag_match') != 'any'
+        fuzzy = parse_bool_arg(str(data.get('fuzzy', False)))
+
+        # Repeated prompts are answered without touching the database
+        cache_key = (tuple(sorted(keywords)), prompt, budget, limit, tags, match_all,
+                     fuzzy)
+        version = catalog_version()
+        recommended = recommend_cache.get(cache_key, version)
+
+        if recommended is None:
+            # With tags, the database narrows the candidates by tag
+            # membership first and only those products are scored
+            within = None
+            if tags:
+                within = db.session.execute(
+                    tagged_product_ids(tags, match_all)).scalars().all()
+
+            # Only visit products the catalog index says can match
+            index = get_catalog_index()
+            top = index.top_matches(prompt, keywords, budget, limit, within, fuzzy)
+            recommended = recommendation_payload(top)
+            recommend_cache.set(cache_key, recommended, version)
+
+        user_id = data.get('user_id')
+        recommendation_logs.start(app)
+        recommendation_logs.log(
+            prompt, budget, len(recommended),
+            round((time.perf_counter() - started) * 1000, 3),
+            user_id if isinstance(user_id, int) else None)
 
         return jsonify({
             "success": True,
             "products": recommended,
             "count": len(recommended),
             "query": prompt,
-            "budget": budget
+            "budget": budget,
+            "fuzzy": fuzzy
         })
 
     except Exception as e:
@@ -573,42 +688,357 @@ def recommend_products():
         return jsonify({"error": "Failed to get recommendations"}), 500
 
 
-@app.route('/api/products', methods=['GET'])
-def get_products():
-    """Get all available products"""
+@app.route('/api/recommend/cache', methods=['GET'])
+def recommend_cache_stats():
+    """Hit/miss/eviction counters of the recommendation result cache"""
+    return jsonify({
+        "success": True,
+        "catalog_version": catalog_version(),
+        "cache": recommend_cache.stats(),
+        "log_writer": recommendation_logs.stats()
+    })
+
+
+@app.route('/api/suggest', methods=['GET'])
+def suggest():
+    """
+    Type-ahead completions of ?q= from product names, categories, tags and
+    popular searches, served from the in-memory suggestion index
+    """
     try:
-        # Get products from database
-        products = Product.query.all()
-
-        # Convert to list of dictionaries
-        products_list = []
-        for product in products:
-            products_list.append({
-                'id':
-                product.id,
-                'name':
-                product.name,
-                'price':
-                float(product.price),
-                'category':
-                product.category,
-                'tags':
-                json.loads(product.tags) if product.tags else [],
-                'description':
-                product.description,
-                'image_url':
-                product.image_url,
-                'in_stock':
-                product.in_stock
+        query = request.args.get('q', '')
+        limit = min(max(int(request.args.get('limit', DEFAULT_SUGGESTIONS)), 1),
+                    MAX_SUGGESTIONS)
+
+        get_catalog_index()
+        suggestion_index.refresh_if_stale(app)
+        return jsonify({
+            "query": query,
+            "suggestions": suggestion_index.suggest(query, limit)
+        })
+
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    except Exception as e:
+        logging.error(f"Error in suggest: {str(e)}")
+        return jsonify({"error": "Failed to get suggestions"}), 500
+
+
+@app.route('/api/suggest/stats', methods=['GET'])
+def suggest_stats():
+    """Size and freshness of the suggestion index"""
+    return jsonify(suggestion_index.stats())
+
+
+@app.route('/api/basket/optimize', methods=['POST'])
+def optimize_basket_route():
+    """
+    Choose products and quantities that best match a prompt or list of
+    needs while the whole basket stays within the budget. Without a
+    budget, the user's Budget.amount for the current month is used.
+    """
+    try:
+        data = request.get_json()
+        needs = data.get('needs') or [data.get('prompt', '')]
+        needs = [need for need in needs if isinstance(need, str) and need.strip()]
+        if not needs:
+            return jsonify({"error": "Prompt or needs are required"}), 400
+        if len(needs) > MAX_BASKET_NEEDS:
+            return jsonify({"error": f"At most {MAX_BASKET_NEEDS} needs per basket"}), 400
+
+        budget = float(data.get('budget') or 0)
+        if budget <= 0 and data.get('user_id'):
+            now = datetime.utcnow()
+            monthly = Budget.query.filter_by(user_id=data['user_id'], month=now.month,
+                                             year=now.year).first()
+            budget = float(monthly.amount) if monthly else 0
+        if budget <= 0:
+            return jsonify({"error": "A positive budget is required"}), 400
+
+        max_quantity = min(max(int(data.get('max_quantity', DEFAULT_BASKET_QUANTITY)), 1),
+                           MAX_BASKET_QUANTITY)
+        max_per_category = min(max(int(data.get('max_per_category', DEFAULT_BASKET_PER_CATEGORY)), 1),
+                               MAX_BASKET_PER_CATEGORY)
+
+        started = time.perf_counter()
+        candidates = basket_candidates(get_catalog_index(), needs, budget)
+        basket = optimize_basket(candidates, budget, max_quantity=max_quantity,
+                                 max_per_category=max_per_category,
+                                 time_budget=BASKET_TIME_BUDGET)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        quantities = {entry.id: quantity for entry, quantity, _ in basket['items']}
+        items = recommendation_payload([(entry, score) for entry, _, score in basket['items']])
+        for item in items:
+            item['quantity'] = quantities[item['id']]
+            item['line_total'] = round(item['price'] * item['quantity'], 2)
+
+        return jsonify({
+            "success": True,
+            "items": items,
+            "total": basket['cost'],
+            "budget": budget,
+            "remaining": round(budget - basket['cost'], 2),
+            "total_score": basket['value'],
+            "candidates": len(candidates),
+            "method": basket['method'],
+            "elapsed_ms": round(elapsed_ms, 2)
+        })
+
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid basket parameters"}), 400
+    except Exception as e:
+        logging.error(f"Error in optimize_basket_route: {str(e)}")
+        return jsonify({"error": "Failed to optimize basket"}), 500
+
+
+def context_recommendations(terms, match_all, data):
+    """Ranked page of products fitting context or tag terms, shaped like
+    /api/recommend results"""
+    offset = max(int(data.get('offset', 0)), 0)
+    limit = min(max(int(data.get('limit', DEFAULT_RECOMMEND_LIMIT)), 1),
+                MAX_RECOMMEND_LIMIT)
+    budget = float(data.get('budget') or 0)
+
+    index = get_catalog_index()
+    ids, wanted = match_terms(index, terms, match_all)
+    page, total = rank_matches(index, ids, wanted, budget, offset, limit)
+    products = recommendation_payload(page)
+    return {
+        "success": True,
+        "products": products,
+        "count": len(products),
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "budget": budget
+    }
+
+
+@app.route("/recommend-smart", methods=["POST"])
+def recommend_smart():
+    """
+    Products for a shopping context such as 'biryani' or 'party'; several
+    comma-separated contexts match products fitting any of them
+    """
+    try:
+        data = request.get_json()
+        keyword = data.get("keyword", "").lower()
+        terms = [term for term in keyword.split(',') if term.strip()]
+        if not terms:
+            return jsonify({"error": "Keyword is required"}), 400
+
+        result = context_recommendations(terms, data.get('match') == 'all', data)
+        result["keyword"] = keyword
+        return jsonify(result)
+
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid recommendation parameters"}), 400
+    except Exception as e:
+        logging.error(f"Error in recommend_smart: {str(e)}")
+        return jsonify({"error": "Failed to get recommendations"}), 500
+
+
+@app.route("/recommend-nutrition", methods=["POST"])
+def recommend_nutrition():
+    """
+    Products matching nutrition preferences such as 'keto' or 'low sugar';
+    any preference by default, all of them with match=all
+    """
+    try:
+        data = request.get_json()
+        preferences = data.get("preferences") or []
+        if isinstance(preferences, str):
+            preferences = preferences.split(',')
+        preferences = [preference for preference in preferences
+                       if isinstance(preference, str) and preference.strip()]
+        if not preferences:
+            return jsonify({"error": "Preferences are required"}), 400
+
+        result = context_recommendations(preferences, data.get('match') == 'all', data)
+        result["preferences"] = preferences
+        return jsonify(result)
+
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid recommendation parameters"}), 400
+    except Exception as e:
+        logging.error(f"Error in recommend_nutrition: {str(e)}")
+        return jsonify({"error": "Failed to get recommendations"}), 500
+
+
+@app.route('/api/analytics/searches', methods=['GET'])
+def get_search_analytics():
+    """
+    Top prompts, zero-result prompts and budget distribution of searches
+    between ?start and ?end (ISO dates), from the hourly or daily rollups
+    """
+    try:
+        granularity = request.args.get('granularity', DAY)
+        if granularity not in GRANULARITIES:
+            return jsonify({"error": f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+
+        end = request.args.get('end')
+        end = datetime.fromisoformat(end) if end else datetime.utcnow()
+        start = request.args.get('start')
+        default_span = timedelta(days=1) if granularity == HOUR else timedelta(days=7)
+        start = datetime.fromisoformat(start) if start else end - default_span
+
+        return jsonify(dict(search_analytics(start, end, granularity, limit),
+                            success=True))
+
+    except ValueError:
+        return jsonify({"error": "start and end must be ISO dates"}), 400
+    except Exception as e:
+        logging.error(f"Error in get_search_analytics: {str(e)}")
+        return jsonify({"error": "Failed to get search analytics"}), 500
+
+
+@app.route('/api/recommend/batch', methods=['POST'])
+def recommend_products_batch():
+    """
+    Score many prompts at once with the vectorized engine; each result
+    matches what /api/recommend returns for the same prompt and budget
+    """
+    try:
+        data = request.get_json()
+        queries = data.get('queries', [])
+        try:
+            limit = min(max(int(data.get('limit', DEFAULT_RECOMMEND_LIMIT)), 1),
+                        MAX_RECOMMEND_LIMIT)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Limit must be an integer"}), 400
+
+        if not queries:
+            return jsonify({"error": "Queries are required"}), 400
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({
+                "error": f"At most {MAX_BATCH_QUERIES} queries per batch"
+            }), 400
+
+        pairs = [(query.get('prompt', ''), float(query.get('budget', 0)))
+                 for query in queries]
+        scored = score_batch(get_catalog_index(), pairs, limit)
+        products = load_products_by_id(
+            {entry.id for top in scored for entry, _ in top})
+
+        results = []
+        for (prompt, budget), top in zip(pairs, scored):
+            recommended = recommendation_payload(top, products)
+            results.append({
+                "products": recommended,
+                "count": len(recommended),
+                "query": prompt.lower().strip(),
+                "budget": budget
             })
 
-        return jsonify({'success': True, 'products': products_list})
+        return jsonify({"success": True, "results": results})
+
+    except Exception as e:
+        logging.error(f"Error in recommend_products_batch: {str(e)}")
+        return jsonify({"error": "Failed to get batch recommendations"}), 500
+
+
+def parse_bool_arg(value):
+    """Interpret a query-string flag such as in_stock=true"""
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def get_products_page():
+    """Filtered, projected page of products using keyset pagination on id"""
+    args = request.args
+    limit = min(max(int(args.get('limit', DEFAULT_PRODUCTS_PAGE)), 1),
+                MAX_PRODUCTS_PAGE)
+
+    fields = PRODUCT_FIELDS
+    if args.get('fields'):
+        requested = {field.strip() for field in args['fields'].split(',')}
+        unknown = requested - set(PRODUCT_FIELDS)
+        if unknown:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown fields: {', '.join(sorted(unknown))}"
+            }), 400
+        # id is always returned because it is the pagination cursor
+        fields = tuple(field for field in PRODUCT_FIELDS
+                       if field in requested or field == 'id')
+
+    query = db.session.query(*(getattr(Product, field) for field in fields))
+    if args.get('category'):
+        query = query.filter(Product.category == args['category'])
+    if args.get('in_stock'):
+        query = query.filter(Product.in_stock == parse_bool_arg(args['in_stock']))
+    if args.get('min_price'):
+        query = query.filter(Product.price >= float(args['min_price']))
+    if args.get('max_price'):
+        query = query.filter(Product.price <= float(args['max_price']))
+    if args.get('tags'):
+        # Products carrying every listed tag (any of them with tag_match=any)
+        query = query.filter(Product.id.in_(tagged_product_ids(
+            args['tags'].split(','), match_all=args.get('tag_match') != 'any')))
+    if args.get('cursor'):
+        query = query.filter(Product.id > args['cursor'])
+
+    # Fetch one extra row to learn whether another page exists
+    rows = query.order_by(Product.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return jsonify({
+        'success': True,
+        'products': [product_to_dict(row, fields) for row in rows],
+        'next_cursor': rows[-1].id if has_more else None
+    })
+
 
+@app.route('/api/products', methods=['GET'])
+def get_products():
+    """Get all available products"""
+    try:
+        # Filtered or paginated listings go straight to indexed SQL
+        if any(arg in request.args for arg in PRODUCT_QUERY_ARGS):
+            return get_products_page()
+
+        # Serve the cached, pre-serialized catalog; the snapshot is rebuilt
+        # only when Product rows change
+        snapshot = get_catalog_snapshot()
+        coding = request.accept_encodings.best_match(
+            snapshot.encodings() + ['identity'], default='identity')
+        body, etag = snapshot.representation(coding)
+
+        response = Response(body, mimetype='application/json')
+        if coding != 'identity':
+            response.headers['Content-Encoding'] = coding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache'
+        response.set_etag(etag)
+        if snapshot.last_modified:
+            response.last_modified = snapshot.last_modified
+
+        # Answers If-None-Match / If-Modified-Since with 304 Not Modified
+        return response.make_conditional(request)
+
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid limit or price filter'}), 400
     except Exception as e:
         logging.error(f"Error in get_products: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/products/export', methods=['GET'])
+def export_products():
+    """Stream the full catalog as NDJSON, optionally gzip-compressed"""
+    body = iter_catalog_ndjson()
+    headers = {'Content-Disposition': 'attachment; filename=products.ndjson'}
+
+    if parse_bool_arg(request.args.get('gzip', 'false')):
+        body = gzip_stream(body)
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_with_context(body), headers=headers,
+                    mimetype='application/x-ndjson')
+
+
 @app.route('/walmart-image')
 def walmart_image():
     """Get product image from Walmart website"""
@@ -617,56 +1047,59 @@ def walmart_image():
         return jsonify({"error": "Missing query"}), 400
 
     try:
-        # Use a search engine approach for better image results
-        search_url = f"https://www.google.com/search?q={query}+walmart&tbm=isch"
-        headers = {
-            "User-Agent":
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-
-        response = requests.get(search_url, headers=headers, timeout=10)
-        html = response.text
+        # Cached answers, including "no image found", skip the upstream
+        # fetch; concurrent identical lookups share a single one
+        image_url = resolve_image(query, image_cache)
+        return jsonify({"image": image_url})
+
+    except DependencyUnavailable:
+        # Answer at once with no image rather than wait on a degraded upstream
+        return jsonify({"image": "", "degraded": True})
+    except Exception as e:
+        logging.error(f"Error fetching image for {query}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Look for image URLs in the search results
-        image_patterns = [
-            r'https://i5\.walmartimages\.com/[^"&]+',
-            r'https://i5\.wimg\.com/[^"&]+',
-            r'https://walmart\.com/[^"]*\.jpg',
-            r'https://walmart\.com/[^"]*\.jpeg',
-            r'https://walmart\.com/[^"]*\.png'
-        ]
 
-        for pattern in image_patterns:
-            matches = re.findall(pattern, html)
-            if matches:
-                # Filter out very small images and select the first good one
-                for match in matches[:3]:  # Try first 3 matches
-                    if len(match) > 50:  # Basic quality filter
-                        logging.info(f"Found image for {query}: {match}")
-                        return jsonify({"image": match})
-
-        # If no images found, try a simple product search
-        simple_search = f"https://www.walmart.com/search?q={query.split()[0]}"
-        response = requests.get(simple_search, headers=headers, timeout=5)
-
-        walmart_patterns = [
-            r'"image":\s*"(https://i5\.walmartimages\.com/[^"]+)"',
-            r'"thumbnail":\s*"(https://i5\.walmartimages\.com/[^"]+)"'
-        ]
+@app.route('/walmart-image/batch', methods=['POST'])
+def walmart_image_batch():
+    """Resolve images for many product queries concurrently"""
+    try:
+        data = request.get_json()
+        queries = [query for query in data.get('queries', []) if query]
+        timeout = min(float(data.get('timeout', IMAGE_BATCH_TIMEOUT)),
+                      MAX_IMAGE_BATCH_TIMEOUT)
+
+        if not queries:
+            return jsonify({"error": "Queries are required"}), 400
+        if len(queries) > MAX_IMAGE_BATCH_QUERIES:
+            return jsonify({
+                "error": f"At most {MAX_IMAGE_BATCH_QUERIES} queries per batch"
+            }), 400
+
+        # Whatever is unresolved at the deadline is reported as pending
+        images, pending, failed = resolve_images(queries, image_cache, timeout)
+        return jsonify({
+            "success": True,
+            "images": images,
+            "pending": pending,
+            "failed": failed,
+            "degraded": not walmart_dependency.available()
+        })
 
-        for pattern in walmart_patterns:
-            matches = re.findall(pattern, response.text)
-            if matches:
-                image_url = matches[0].replace('\\/', '/')
-                logging.info(f"Found Walmart image for {query}: {image_url}")
-                return jsonify({"image": image_url})
+    except Exception as e:
+        logging.error(f"Error in walmart_image_batch: {str(e)}")
+        return jsonify({"error": "Failed to resolve images"}), 500
 
-        logging.warning(f"No image found for {query}")
-        return jsonify({"image": ""})
 
-    except Exception as e:
-        logging.error(f"Error fetching image for {query}: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+@app.route('/walmart-image/stats')
+def walmart_image_stats():
+    """Hit-rate counters of the image lookup cache"""
+    return jsonify({
+        "success": True,
+        "cache": image_cache.stats(),
+        "coalescing": image_lookups.stats(),
+        "upstream": walmart_dependency.stats()
+    })
 
 
 @app.route('/api/shared-cart/create', methods=['POST'])
@@ -735,6 +1168,41 @@ def join_shared_cart(session_id):
         return jsonify({"error": "Failed to join shared cart"}), 500
 
 
+# Shown for shared cart items whose contributor no longer exists
+UNKNOWN_CONTRIBUTOR = "unknown@example.com"
+
+# Longest a single SSE response stays open; EventSource then reconnects
+# with Last-Event-ID and resumes where it left off
+CART_STREAM_SECONDS = 300
+CART_HEARTBEAT_SECONDS = 15
+MAX_LONG_POLL_SECONDS = 30
+
+
+def shared_cart_item_tags(product_db):
+    """Tags of a cart product, already parsed in the catalog index for
+    in-stock products"""
+    entry = get_catalog_index().get(product_db.id)
+    return entry.tags if entry else parse_tags(product_db.tags)
+
+
+def shared_cart_item_dict(item, product_db, user_email):
+    """Shape of one shared cart item in listings and change events"""
+    return {
+        "id": item.id,
+        "product": {
+            "id": product_db.id,
+            "name": product_db.name,
+            "price": float(product_db.price),
+            "category": product_db.category,
+            "tags": shared_cart_item_tags(product_db)
+        },
+        "added_by": user_email,
+        "quantity": item.quantity,
+        "unit_price": float(item.unit_price),
+        "added_at": item.added_at.isoformat()
+    }
+
+
 @app.route('/api/shared-cart/<session_id>/items')
 def get_shared_cart_items(session_id):
     """Get all items in a shared cart session"""
@@ -743,42 +1211,20 @@ def get_shared_cart_items(session_id):
         if not session:
             return jsonify({"error": "Cart not found"}), 404
 
-        items_data = []
-        user_totals = {}
-
-        for item in session.items:
-            # Get product from database
-            product_db = Product.query.get(item.product_id)
-            if not product_db:
-                continue
-
-            # Get user info
-            user = User.query.get(item.added_by_user_id)
-            user_email = user.email if user else "unknown@example.com"
-
-            product_data = {
-                "id": product_db.id,
-                "name": product_db.name,
-                "price": float(product_db.price),
-                "category": product_db.category,
-                "tags": json.loads(product_db.tags) if product_db.tags else []
-            }
-
-            item_data = {
-                "id": item.id,
-                "product": product_data,
-                "added_by": user_email,
-                "quantity": item.quantity,
-                "added_at": item.added_at.isoformat()
-            }
-            items_data.append(item_data)
+        contributor = func.coalesce(User.email, UNKNOWN_CONTRIBUTOR)
+        rows = db.session.query(SharedCartItem, Product, contributor).join(
+            Product, Product.id == SharedCartItem.product_id).outerjoin(
+                User, User.id == SharedCartItem.added_by_user_id).filter(
+                    SharedCartItem.session_id == session_id).order_by(
+                        SharedCartItem.id).all()
 
-            # Calculate user totals
-            if user_email not in user_totals:
-                user_totals[user_email] = 0
-            user_totals[user_email] += product_data['price'] * item.quantity
+        items_data = [
+            shared_cart_item_dict(item, product_db, user_email)
+            for item, product_db, user_email in rows
+        ]
 
-        grand_total = sum(user_totals.values())
+        # Per-user totals are maintained incrementally on every cart change
+        user_totals, grand_total = cart_totals(session_id, UNKNOWN_CONTRIBUTOR)
 
         return jsonify({
             "success": True,
@@ -788,7 +1234,8 @@ def get_shared_cart_items(session_id):
             },
             "items": items_data,
             "user_totals": user_totals,
-            "grand_total": grand_total
+            "grand_total": grand_total,
+            "revision": latest_revision(session_id)
         })
 
     except Exception as e:
@@ -796,6 +1243,60 @@ def get_shared_cart_items(session_id):
         return jsonify({"error": "Failed to get shared cart items"}), 500
 
 
+def add_items_to_shared_cart(session_id, quantities):
+    """Merge {product_id: quantity} into a session in a single transaction.
+
+    Totals, change events and the items themselves commit together.
+    Returns (response dict, status code).
+    """
+    session = SharedCartSession.query.get(session_id)
+    if not session:
+        return {"error": "Cart not found"}, 404
+
+    products = load_products_by_id(quantities)
+    missing = sorted(set(quantities) - set(products))
+    if missing:
+        return {"error": "Product not found", "missing": missing}, 404
+
+    user_id = 1  # Placeholder
+    user = User.query.get(user_id)
+    user_email = user.email if user else UNKNOWN_CONTRIBUTOR
+
+    results = upsert_cart_items(session_id, user_id, quantities,
+                                {pid: product.price for pid, product in products.items()})
+
+    event = None
+    for row, inserted in results:
+        if inserted:
+            event = record_cart_event(
+                session_id, ITEM_ADDED,
+                shared_cart_item_dict(row, products[row.product_id], user_email))
+        else:
+            event = record_cart_event(session_id, QUANTITY_CHANGED, {
+                "id": row.id,
+                "quantity": row.quantity
+            })
+
+    adjust_cart_total(
+        session_id, user_id,
+        sum(row.unit_price * quantities[row.product_id] for row, _ in results),
+        sum(quantities.values()),
+        items=sum(1 for _, inserted in results if inserted))
+
+    db.session.commit()
+    cart_event_broker.notify()
+
+    return {
+        "success": True,
+        "items": [{
+            "item_id": row.id,
+            "product_id": row.product_id,
+            "quantity": row.quantity
+        } for row, _ in results],
+        "revision": event.revision
+    }, 200
+
+
 @app.route('/api/shared-cart/<session_id>/add', methods=['POST'])
 def add_to_shared_cart(session_id):
     """Add item to shared cart session"""
@@ -804,25 +1305,193 @@ def add_to_shared_cart(session_id):
         product_id = data.get('product_id')
         user_email = data.get('user_email', 'anonymous@example.com')
 
-        session = SharedCartSession.query.get(session_id)
-        if not session:
-            return jsonify({"error": "Cart not found"}), 404
+        # Repeat adds of a product increase the quantity of its row
+        result, status = add_items_to_shared_cart(session_id, {product_id: 1})
+        if status == 200:
+            item = result.pop("items")[0]
+            result["item_id"] = item["item_id"]
+            result["quantity"] = item["quantity"]
+        return jsonify(result), status
+
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error adding to shared cart: {str(e)}")
+        return jsonify({"error": "Failed to add to shared cart"}), 500
+
+
+@app.route('/api/shared-cart/<session_id>/add-batch', methods=['POST'])
+def add_batch_to_shared_cart(session_id):
+    """Add several products, with quantities, to a shared cart at once"""
+    try:
+        data = request.get_json()
+        items = data.get('items', [])
+
+        if not items:
+            return jsonify({"error": "Items are required"}), 400
+        if len(items) > MAX_BATCH_ITEMS:
+            return jsonify({
+                "error": f"At most {MAX_BATCH_ITEMS} items per batch"
+            }), 400
+
+        # Repeated products within the batch collapse into one row update
+        quantities = {}
+        for item in items:
+            quantity = int(item.get('quantity', 1))
+            if not item.get('product_id') or quantity < 1:
+                return jsonify({
+                    "error": "Each item needs a product_id and a quantity of at least 1"
+                }), 400
+            quantities[item['product_id']] = (
+                quantities.get(item['product_id'], 0) + quantity)
+
+        result, status = add_items_to_shared_cart(session_id, quantities)
+        return jsonify(result), status
+
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error adding batch to shared cart: {str(e)}")
+        return jsonify({"error": "Failed to add to shared cart"}), 500
+
+
+@app.route('/api/shared-cart/<session_id>/items/<int:item_id>', methods=['PATCH'])
+def update_shared_cart_item(session_id, item_id):
+    """Change the quantity of a shared cart item"""
+    try:
+        data = request.get_json()
+        quantity = int(data.get('quantity', 0))
+        if quantity < 1:
+            return jsonify({"error": "Quantity must be at least 1"}), 400
+
+        item = SharedCartItem.query.filter_by(id=item_id,
+                                              session_id=session_id).first()
+        if not item:
+            return jsonify({"error": "Item not found"}), 404
+
+        adjust_cart_total(session_id, item.added_by_user_id,
+                          item.unit_price * (quantity - item.quantity),
+                          quantity - item.quantity)
+        item.quantity = quantity
+        event = record_cart_event(session_id, QUANTITY_CHANGED, {
+            "id": item.id,
+            "quantity": quantity
+        })
+        db.session.commit()
+        cart_event_broker.notify()
+
+        return jsonify({"success": True, "revision": event.revision})
+
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error updating shared cart item: {str(e)}")
+        return jsonify({"error": "Failed to update shared cart item"}), 500
 
-        # Create new shared cart item
-        item = SharedCartItem()
-        item.session_id = session_id
-        item.product_id = product_id
-        item.added_by_user_id = 1  # Placeholder
-        item.quantity = 1
 
-        db.session.add(item)
+@app.route('/api/shared-cart/<session_id>/items/<int:item_id>', methods=['DELETE'])
+def remove_shared_cart_item(session_id, item_id):
+    """Remove an item from a shared cart session"""
+    try:
+        item = SharedCartItem.query.filter_by(id=item_id,
+                                              session_id=session_id).first()
+        if not item:
+            return jsonify({"error": "Item not found"}), 404
+
+        adjust_cart_total(session_id, item.added_by_user_id,
+                          -item.unit_price * item.quantity, -item.quantity, items=-1)
+        db.session.delete(item)
+        event = record_cart_event(session_id, ITEM_REMOVED, {"id": item_id})
         db.session.commit()
+        cart_event_broker.notify()
 
-        return jsonify({"success": True, "item_id": item.id})
+        return jsonify({"success": True, "revision": event.revision})
 
     except Exception as e:
-        logging.error(f"Error adding to shared cart: {str(e)}")
-        return jsonify({"error": "Failed to add to shared cart"}), 500
+        db.session.rollback()
+        logging.error(f"Error removing shared cart item: {str(e)}")
+        return jsonify({"error": "Failed to remove shared cart item"}), 500
+
+
+def requested_revision():
+    """Revision a feed client resumes from: Last-Event-ID or ?since="""
+    # EventSource reconnects to the original URL, so the Last-Event-ID
+    # header it sends must win over a stale ?since=
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    return int(since) if since else None
+
+
+@app.route('/api/shared-cart/<session_id>/events')
+def stream_shared_cart_events(session_id):
+    """Server-Sent Events feed of item changes in a shared cart session"""
+    if not SharedCartSession.query.get(session_id):
+        return jsonify({"error": "Cart not found"}), 404
+
+    try:
+        since = requested_revision()
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID and since must be integers"}), 400
+    if since is None:
+        since = latest_revision(session_id)
+    db.session.remove()
+    cart_event_broker.start(app)
+
+    def generate():
+        revision = since
+        deadline = time.monotonic() + CART_STREAM_SECONDS
+        yield "retry: 2000\n\n"
+
+        while time.monotonic() < deadline:
+            seen = cart_event_broker.latest()
+            events = events_since(session_id, revision)
+            for event in events:
+                revision = event['revision']
+                yield (f"id: {revision}\nevent: {event['type']}\n"
+                       f"data: {json.dumps(event)}\n\n")
+
+            if not events and not cart_event_broker.wait(
+                    seen, CART_HEARTBEAT_SECONDS):
+                yield ": keepalive\n\n"
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream', headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no'
+                    })
+
+
+@app.route('/api/shared-cart/<session_id>/changes')
+def poll_shared_cart_changes(session_id):
+    """Long-poll fallback for the shared cart event feed"""
+    try:
+        if not SharedCartSession.query.get(session_id):
+            return jsonify({"error": "Cart not found"}), 404
+
+        since = requested_revision()
+        if since is None:
+            since = latest_revision(session_id)
+        timeout = min(float(request.args.get('timeout', 25)),
+                      MAX_LONG_POLL_SECONDS)
+        db.session.remove()
+        cart_event_broker.start(app)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            seen = cart_event_broker.latest()
+            events = events_since(session_id, since)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                break
+            cart_event_broker.wait(seen, remaining)
+
+        return jsonify({
+            "success": True,
+            "events": events,
+            "revision": events[-1]['revision'] if events else since
+        })
+
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID, since and timeout must be numbers"}), 400
+    except Exception as e:
+        logging.error(f"Error polling shared cart changes: {str(e)}")
+        return jsonify({"error": "Failed to get shared cart changes"}), 500
 
 
 # Initialize database tables and seed data
@@ -832,6 +1501,49 @@ def init_database():
         # Create all tables
         db.create_all()
 
+        # Items now record the price they were added at; older databases
+        # get the column once and their totals recomputed from it below
+        priced_items = add_cart_item_prices()
+
+        # create_all skips existing tables, so add indexes introduced since
+        # those tables were first created. The shared cart unique index
+        # needs duplicate rows from before it existed merged first.
+        existing = {
+            index['name']
+            for index in inspect(db.engine).get_indexes('shared_cart_items')
+        }
+        if 'uq_shared_cart_items_session_product_user' not in existing:
+            merge_duplicate_cart_items()
+
+        # Event revisions became a per-session counter; older databases get
+        # the columns (and their unique index below) added once
+        if add_event_revisions():
+            logging.info("Added per-session revisions to shared cart events")
+
+        for model in (Product, SharedCartItem, SharedCartEvent):
+            for index in model.__table__.indexes:
+                index.create(db.engine, checkfirst=True)
+
+        # Tag memberships are derived from Product.tags; fill them once for
+        # catalogs that predate the product_tags table
+        if not db.session.query(ProductTag.query.exists()).scalar() and \
+                db.session.query(Product.query.exists()).scalar():
+            backfill_product_tags()
+
+        if priced_items:
+            drift = check_cart_totals(repair=True)
+            logging.info(f"Recomputed {len(drift)} shared cart total row(s)")
+
+        # Likewise for columns added to existing tables
+        log_columns = {
+            column['name']
+            for column in inspect(db.engine).get_columns('recommendation_logs')
+        }
+        if 'latency_ms' not in log_columns:
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(
+                    'ALTER TABLE recommendation_logs ADD COLUMN latency_ms FLOAT')
+
         # Check if products already exist
         if Product.query.count() == 0:
             # Seed products from SAMPLE_PRODUCTS
@@ -851,6 +1563,11 @@ def init_database():
             logging.info(
                 f"Seeded {len(SAMPLE_PRODUCTS)} products into database")
 
+        # Build the catalog index and the type-ahead suggestions up front
+        # rather than on the first search
+        suggestion_index.load_popularity()
+        get_catalog_index()
+
 
 @app.route('/api/init_database', methods=['POST'])
 def init_database_route():
@@ -863,74 +1580,220 @@ def init_database_route():
         return jsonify({"error": str(e)}), 500
 
 
-# Initialize database when app starts
-init_database()
+@app.cli.command('check-cart-totals')
+@click.option('--session', 'session_id', help='Only check one shared cart session.')
+@click.option('--repair', is_flag=True, help='Rewrite drifted totals from shared_cart_items.')
+def check_cart_totals_command(session_id, repair):
+    """Report (and optionally repair) drift in materialized cart totals"""
+    drift = check_cart_totals(session_id, repair=repair)
+    for record in drift:
+        click.echo(f"{record['session_id']} user {record['user_id']}: "
+                   f"expected {record['expected']} actual {record['actual']}")
+    status = 'repaired' if repair else 'found'
+    click.echo(f"{len(drift)} drifted total(s) {status}")
+
+
+@app.cli.command('prewarm-images')
+@click.option('--concurrency', default=8, show_default=True, help='Upstream lookups in flight at once.')
+@click.option('--rate', default=5.0, show_default=True, help='Upstream lookups per second.')
+@click.option('--batch-size', default=100, show_default=True, help='Products per checkpointed batch.')
+@click.option('--only-missing', is_flag=True, help='Only products without an image_url.')
+@click.option('--update-products', is_flag=True, help='Write found images to products lacking image_url.')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and start from the first product.')
+@click.option('--checkpoint', default=None, help='Checkpoint file (default: instance/image_prewarm.json).')
+@click.option('--max-pause', default=300, show_default=True, help='Seconds a lookup waits for an open breaker before counting as failed.')
+def prewarm_images_command(concurrency, rate, batch_size, only_missing,
+                           update_products, restart, checkpoint, max_pause):
+    """Resolve product images into the image cache before users ask"""
+    summary = prewarm_images(
+        image_cache,
+        checkpoint or os.path.join(app.instance_path, "image_prewarm.json"),
+        concurrency=concurrency, rate=rate, batch_size=batch_size,
+        only_missing=only_missing, update_products=update_products,
+        restart=restart, max_pause=max_pause, report=click.echo)
+    click.echo(f"Done: {summary}")
+
+
+@app.cli.command('backfill-tags')
+@click.option('--batch-size', default=1000, show_default=True, help='Products per page.')
+def backfill_tags_command(batch_size):
+    """Rebuild tags and product_tags from the Product.tags JSON column"""
+    products, links = backfill_product_tags(batch_size=batch_size)
+    click.echo(f"Linked {products} product(s) with {links} tag membership(s)")
+
+
+@app.cli.command('compact-search-analytics')
+@click.option('--batch-size', default=10000, show_default=True, help='Log rows folded per transaction.')
+@click.option('--prune', is_flag=True, help='Also apply the retention policy.')
+@click.option('--raw-days', default=30, show_default=True, help='Days of folded raw logs to keep.')
+@click.option('--hourly-days', default=90, show_default=True, help='Days of hourly rollups to keep.')
+def compact_search_analytics_command(batch_size, prune, raw_days, hourly_days):
+    """Fold new recommendation logs into the search rollups"""
+    folded = compact_search_logs(batch_size=batch_size)
+    click.echo(f"Folded {folded} log row(s) into search rollups")
+    if prune:
+        raw, hourly = prune_search_logs(raw_days=raw_days, hourly_days=hourly_days)
+        click.echo(f"Pruned {raw} raw log row(s) and {hourly} hourly rollup(s)")
+
+
+def recipe_request():
+    """(prompt, api key) of a recipe request, or an error response"""
+    data = request.get_json(silent=True) or request.args
+    prompt = (data.get("prompt") or "").strip()
+    if not prompt:
+        return None, (jsonify({"error": "Prompt required"}), 400)
+
+    mistral_key = os.getenv("MISTRAL_API_KEY", "1I0BiIiBuxpv8xXlposfEkrzx93rsZWO")
+    if not mistral_key:
+        logging.error("Missing MISTRAL_API_KEY in env")
+        return None, (jsonify({"error": "Mistral API key missing"}), 500)
+    return (prompt, mistral_key), None
+
+
+def recipe_bot_unavailable():
+    """Fast answer while Mistral is failing or saturated"""
+    response = jsonify({"error": "Recipe bot is temporarily unavailable, please retry shortly"})
+    response.headers['Retry-After'] = str(mistral_dependency.breaker.reset_timeout)
+    return response, 503
+
+
+def recipe_job_response(job):
+    data = recipe_job_dict(job, recipe_jobs.stale_after)
+    data['status_url'] = f"/api/recipe-bot/jobs/{job.id}"
+    return data
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
 
-# Sample product list used for Smart Search and NutriBasket
-sample_products = [
-    {"id": 1, "name": "Basmati Rice", "category": "Grocery", "price": 120, "tags": ["biryani", "rice"]},
-    {"id": 2, "name": "Chicken Masala", "category": "Spices", "price": 75, "tags": ["biryani", "spices"]},
-    {"id": 3, "name": "Sweets Box", "category": "Snacks", "price": 300, "tags": ["wedding", "sweets"]},
-    {"id": 4, "name": "Rose Bouquet", "category": "Flowers", "price": 200, "tags": ["wedding", "flowers"]},
-    {"id": 5, "name": "Avocados", "category": "Fruits", "price": 250, "tags": ["keto", "high protein"]},
-    {"id": 6, "name": "Spinach Leaves", "category": "Vegetables", "price": 55, "tags": ["low sodium", "keto", "high protein"]},
-    {"id": 7, "name": "Sugar-Free Biscuits", "category": "Snacks", "price": 85, "tags": ["low sugar"]},
-    {"id": 8, "name": "Cheddar Cheese", "category": "Dairy", "price": 190, "tags": ["keto", "high protein"]}
-]
+@app.route('/api/recipe-bot', methods=['POST'])
+def recipe_bot():
+    """Recipe for a prompt; answers 202 with a job to poll when generation
+    takes longer than RECIPE_SYNC_WAIT"""
+    try:
+        parsed, error = recipe_request()
+        if error:
+            return error
+        prompt, mistral_key = parsed
+
+        recipe = recipe_jobs.cached_recipe(prompt)
+        if recipe is not None:
+            return jsonify({"success": True, "recipe": recipe, "cached": True})
+        if not mistral_dependency.available():
+            return recipe_bot_unavailable()
+
+        recipe_jobs.start(app)
+        job = recipe_jobs.submit(prompt, mistral_key)
+        job = recipe_jobs.wait(job.id, RECIPE_SYNC_WAIT)
+        data = recipe_job_response(job)
+        if data['status'] == 'done':
+            return jsonify({"success": True, "recipe": data['recipe']})
+        if data['status'] in ('failed', 'expired'):
+            return jsonify({"error": data.get('error') or "Recipe generation failed"}), 502
+        return jsonify(data), 202
+
+    except RecipeJobsBusy:
+        return jsonify({"error": "Recipe bot is busy, please retry shortly"}), 503
+    except Exception as e:
+        logging.error(f"Error getting recipe: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
 
-@app.route("/recommend-smart", methods=["POST"])
-def recommend_smart():
-    data = request.get_json()
-    keyword = data.get("keyword", "").lower()
-
-    context_map = {
-        "biryani": ["rice", "spices", "chicken", "saffron", "yogurt"],
-        "wedding": ["sweets", "decorations", "flowers", "snacks", "juice"],
-        "keto": ["almonds", "avocados", "eggs", "cheese", "spinach"],
-        "party": ["chips", "soda", "cake", "cups", "snacks"]
-    }
+@app.route('/api/recipe-bot/jobs', methods=['POST'])
+def submit_recipe_job():
+    """Start generating a recipe and return its job id immediately"""
+    try:
+        parsed, error = recipe_request()
+        if error:
+            return error
+        prompt, mistral_key = parsed
+        if recipe_jobs.cached_recipe(prompt) is None and \
+                not mistral_dependency.available():
+            return recipe_bot_unavailable()
+
+        recipe_jobs.start(app)
+        job = recipe_jobs.submit(prompt, mistral_key)
+        data = recipe_job_response(job)
+        return jsonify(data), 200 if data['status'] == 'done' else 202
+
+    except RecipeJobsBusy:
+        return jsonify({"error": "Recipe bot is busy, please retry shortly"}), 503
+    except Exception as e:
+        logging.error(f"Error submitting recipe job: {str(e)}")
+        return jsonify({"error": "Failed to submit recipe job"}), 500
 
-    relevant_tags = context_map.get(keyword, [])
-    if not relevant_tags:
-        return jsonify([])
 
-    matching_products = [p for p in sample_products if "tags" in p and any(tag.lower() in p["tags"] for tag in relevant_tags)]
-    return jsonify(matching_products)
+@app.route('/api/recipe-bot/jobs/<job_id>')
+def get_recipe_job(job_id):
+    """Status of a recipe job; ?wait=N long-polls up to N seconds for it
+    to finish"""
+    try:
+        wait = min(float(request.args.get('wait', 0)), MAX_RECIPE_JOB_WAIT)
+        recipe_jobs.start(app)
+        job = recipe_jobs.wait(job_id, max(wait, 0))
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(recipe_job_response(job))
+
+    except ValueError:
+        return jsonify({"error": "wait must be a number"}), 400
+    except Exception as e:
+        logging.error(f"Error getting recipe job: {str(e)}")
+        return jsonify({"error": "Failed to get recipe job"}), 500
 
 
-@app.route("/recommend-nutrition", methods=["POST"])
-def recommend_nutrition():
-    data = request.get_json()
-    preferences = data.get("preferences", [])
-    matching_products = [p for p in sample_products if "tags" in p and any(tag.lower() in p["tags"] for tag in preferences)]
-    return jsonify(matching_products)
+@app.route('/api/recipe-bot/stats')
+def recipe_bot_stats():
+    """Recipe cache, coalescing and job queue counters for monitoring"""
+    return jsonify({
+        "cache": recipe_cache.stats(),
+        "coalescing": recipe_requests.stats(),
+        "jobs": recipe_jobs.stats(),
+        "upstream": mistral_dependency.stats(),
+    })
 
 
+@app.route('/api/recipe-bot/stream', methods=['GET', 'POST'])
+def stream_recipe():
+    """Server-Sent Events relay of the recipe as Mistral generates it.
 
-@app.route('/api/recipe-bot', methods=['POST'])
-def recipe_bot():
-    try:
-        data = request.get_json()
-        print("Received data:", data)
-        prompt = data.get("prompt", "").strip()
-        if not prompt:
-            print("Empty prompt")
-            return jsonify({"error": "Prompt required"}), 400
+    Emits `chunk` events carrying text, then `done` or `error`. When the
+    client goes away the server closes this generator, which closes the
+    upstream request too.
+    """
+    parsed, error = recipe_request()
+    if error:
+        return error
+    prompt, mistral_key = parsed
+
+    def generate():
+        chunks = stream_mistral_recipes(prompt, mistral_key)
+        try:
+            for text in chunks:
+                yield f"event: chunk\ndata: {json.dumps({'text': text})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except DependencyUnavailable:
+            yield (f"event: error\n"
+                   f"data: {json.dumps({'error': 'Recipe bot is temporarily unavailable'})}\n\n")
+        except Exception as e:
+            logging.error(f"Error streaming recipe: {str(e)}")
+            yield (f"event: error\n"
+                   f"data: {json.dumps({'error': 'Recipe generation failed'})}\n\n")
+        finally:
+            chunks.close()
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/api/dependencies')
+def dependencies_status():
+    """Circuit breaker state and call/rejection counters of every
+    outbound dependency"""
+    return jsonify(dependency_stats())
 
-        mistral_key = os.getenv("MISTRAL_API_KEY", "1I0BiIiBuxpv8xXlposfEkrzx93rsZWO")
-        if not mistral_key:
-            print("Missing MISTRAL_API_KEY in env")
-            return jsonify({"error": "Mistral API key missing"}), 500
 
-        result = get_mistral_recipes(prompt, mistral_key)
-        print("Mistral API responded with:", result)
-        return jsonify({"success": True, "recipe": result})
+# Initialize database when app starts
+init_database()
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,179 @@
+import math
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from batch_scoring import get_catalog_matrix, prompt_scores
+
+# Largest DP table width; bigger budgets are solved in coarser price units
+# (prices rounded up, so the basket still fits the budget)
+MAX_CAPACITY = 10000
+
+# Candidates kept per category by score and by score per rupee
+CANDIDATES_PER_CATEGORY = 12
+
+
+def unit_values(score, max_quantity):
+    """Value of taking 1..max_quantity units of a product: each extra unit
+    is worth less (score, score/2, score/3, ...) so baskets favour variety"""
+    values = []
+    total = 0.0
+    for unit in range(1, max_quantity + 1):
+        total += score / unit
+        values.append(total)
+    return values
+
+
+def basket_candidates(index, needs, budget, per_category=CANDIDATES_PER_CATEGORY):
+    """(entry, score) pairs worth considering for a basket.
+
+    Each need is scored like an /api/recommend prompt, all at once on the
+    catalog matrix; a product matching several needs keeps its best score.
+    Per category only the best matches and the best matches per rupee
+    survive, which bounds the DP size on broad prompts while keeping the
+    products an optimal basket is likely to use.
+    """
+    matrix = get_catalog_matrix(index)
+    prompts = [need.lower().strip() for need in needs]
+    if not matrix.entries or not any(prompts):
+        return []
+
+    scores = prompt_scores(matrix, prompts).max(axis=0)
+    matched = (scores > 0) & (matrix.prices > 0) & (matrix.prices <= budget)
+
+    kept = set()
+    for code in np.unique(matrix.categories[matched]):
+        columns = np.flatnonzero(matched & (matrix.categories == code))
+        prices = matrix.prices[columns]
+        for key in (-scores[columns], -scores[columns] / prices):
+            # Ties resolve by price, then catalog order
+            order = np.lexsort((columns, prices, key))
+            kept.update(columns[order[:per_category]].tolist())
+    return [(matrix.entries[column], int(scores[column])) for column in sorted(kept)]
+
+
+def optimize_basket(candidates, budget, max_quantity=3, max_per_category=3,
+                    time_budget=0.05):
+    """Pick products and quantities maximizing total score within budget.
+
+    Solves a bounded knapsack over prices in rupee units with at most
+    `max_per_category` distinct products per category. If the DP does not
+    finish within `time_budget` seconds a greedy fill by value per rupee is
+    returned instead. Returns {'items': [(entry, quantity, score)],
+    'cost', 'value', 'method'}.
+    """
+    deadline = time.perf_counter() + time_budget
+    unit = max(1, math.ceil(budget / MAX_CAPACITY))
+    capacity = int(budget // unit)
+    if capacity <= 0 or not candidates:
+        return _result([], 'dp')
+
+    chosen = _knapsack(candidates, capacity, unit, max_quantity,
+                       max_per_category, deadline)
+    if chosen is None:
+        return _result(_greedy(candidates, budget, max_quantity, max_per_category),
+                       'greedy')
+    return _result(chosen, 'dp')
+
+
+def _result(chosen, method):
+    return {
+        'items': chosen,
+        'cost': round(sum(entry.price * quantity for entry, quantity, _ in chosen), 2),
+        'value': round(sum(unit_values(score, quantity)[-1]
+                           for _, quantity, score in chosen), 4),
+        'method': method,
+    }
+
+
+def _knapsack(candidates, capacity, unit, max_quantity, max_per_category, deadline):
+    """Grouped bounded knapsack; None if the deadline passes first.
+
+    The deadline is checked before every product, so one large category
+    cannot overrun it.
+
+    dp[w] is the best value with cost at most w. Per category, layer k
+    holds the best value using exactly k products of that category, and
+    each product picks its quantity as one multiple-choice option.
+    """
+    by_category = defaultdict(list)
+    for entry, score in candidates:
+        by_category[entry.category].append((entry, score))
+
+    width = capacity + 1
+    dp = np.zeros(width)
+    history = []
+    for category, items in by_category.items():
+        # More layers than products in the category can never be filled
+        picks_allowed = min(max_per_category, len(items))
+        layers = np.full((picks_allowed + 1, width), -np.inf)
+        layers[0] = dp
+        decisions = []
+        for entry, score in items:
+            if time.perf_counter() > deadline:
+                return None
+
+            cost = math.ceil(entry.price / unit)
+            values = unit_values(score, max_quantity)
+            # taken[k, w]: quantity of this product behind layers[k][w]
+            taken = np.zeros((picks_allowed + 1, width), dtype=np.int8)
+            for k in range(picks_allowed, 0, -1):
+                best = layers[k]
+                for quantity in range(1, max_quantity + 1):
+                    spend = cost * quantity
+                    if spend > capacity:
+                        break
+                    option = np.full(width, -np.inf)
+                    option[spend:] = layers[k - 1][:width - spend] + values[quantity - 1]
+                    better = option > best
+                    if better.any():
+                        best = np.where(better, option, best)
+                        taken[k][better] = quantity
+                layers[k] = best
+            decisions.append((entry, score, cost, taken))
+
+        picks = np.argmax(layers, axis=0)
+        dp = layers[picks, np.arange(width)]
+        history.append((decisions, picks))
+
+    chosen = []
+    w = capacity
+    for decisions, picks in reversed(history):
+        k = int(picks[w])
+        for entry, score, cost, taken in reversed(decisions):
+            if k == 0:
+                break
+            quantity = int(taken[k][w])
+            if quantity:
+                chosen.append((entry, quantity, score))
+                w -= cost * quantity
+                k -= 1
+    chosen.reverse()
+    return chosen
+
+
+def _greedy(candidates, budget, max_quantity, max_per_category):
+    """Fill the basket unit by unit in order of marginal value per rupee"""
+    units = []
+    for entry, score in candidates:
+        for quantity in range(1, max_quantity + 1):
+            units.append((score / quantity / entry.price, quantity, entry, score))
+    units.sort(key=lambda u: (-u[0], u[1], u[2].position))
+
+    quantities = {}
+    per_category = defaultdict(int)
+    remaining = budget
+    for _, quantity, entry, score in units:
+        if entry.price > remaining or quantities.get(entry.id, 0) != quantity - 1:
+            continue
+        if quantity == 1:
+            if per_category[entry.category] >= max_per_category:
+                continue
+            per_category[entry.category] += 1
+        quantities[entry.id] = quantity
+        remaining -= entry.price
+
+    scores = {entry.id: (entry, score) for entry, score in candidates}
+    return [(scores[product_id][0], quantity, scores[product_id][1])
+            for product_id, quantity in quantities.items()]
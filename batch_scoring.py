@@ -0,0 +1,170 @@
+import threading
+
+import numpy as np
+
+from catalog_index import (CATEGORY_SCORE, NAME_SCORE, PHRASE_SCORE,
+                           TAG_SCORE, split_keywords, substrings)
+
+# Upper bound on prompts x products cells scored at once, which keeps the
+# dense score matrix of one chunk around 16 MB of float32
+MAX_CHUNK_CELLS = 4_000_000
+
+
+class CatalogMatrix:
+    """NumPy encoding of the in-stock catalog for scoring many prompts at once.
+
+    Columns follow catalog order, so a column index doubles as the same tie
+    breaker the per-request scorer uses. Each field keeps its own posting
+    arrays (substring -> columns), from which keyword x product incidence
+    matrices are assembled per batch.
+    """
+
+    def __init__(self, version, entries):
+        self.version = version
+        self.entries = entries
+        self.texts = [entry.text for entry in entries]
+        self.prices = np.array([entry.price for entry in entries],
+                               dtype=np.float64)
+        self.category_names = sorted({entry.category for entry in entries})
+        codes = {category: code for code, category in enumerate(self.category_names)}
+        self.categories = np.array([codes[entry.category] for entry in entries],
+                                   dtype=np.intp)
+        self._fields = (
+            self._postings(entry.name for entry in entries),
+            self._postings(entry.category for entry in entries),
+            self._postings(' '.join(entry.tags_lower) for entry in entries),
+        )
+
+    @staticmethod
+    def _postings(texts):
+        postings = {}
+        for column, text in enumerate(texts):
+            for key in substrings(text):
+                postings.setdefault(key, []).append(column)
+        return {
+            key: np.array(columns, dtype=np.intp)
+            for key, columns in postings.items()
+        }
+
+    def incidence(self, keywords):
+        """Boolean keyword x product hit matrices for name, category and tags"""
+        shape = (len(keywords), len(self.entries))
+        matrices = []
+        for postings in self._fields:
+            hits = np.zeros(shape, dtype=bool)
+            for row, keyword in enumerate(keywords):
+                columns = postings.get(keyword)
+                if columns is not None:
+                    hits[row, columns] = True
+            matrices.append(hits)
+        return matrices
+
+    def keyword_weights(self, keywords):
+        """Per-keyword score of every product, first matching field only,
+        plus the matrix of keywords hitting any field"""
+        name, category, tag = self.incidence(keywords)
+        category &= ~name
+        tag &= ~(name | category)
+        weights = (NAME_SCORE * name + CATEGORY_SCORE * category +
+                   TAG_SCORE * tag).astype(np.float32)
+        return weights, (name | category | tag).astype(np.float32)
+
+
+_matrix_lock = threading.Lock()
+_matrix = None
+
+
+def get_catalog_matrix(index):
+    """Matrix encoding of the index, rebuilt only when the catalog changed"""
+    global _matrix
+    version, entries = index.entries()
+    with _matrix_lock:
+        if _matrix is None or _matrix.version != version:
+            _matrix = CatalogMatrix(version, entries)
+        return _matrix
+
+
+def score_batch(index, queries, limit=12):
+    """Score many (prompt, budget) pairs against the catalog in one pass.
+
+    Returns one list of (entry, score) pairs per query, ordered and
+    truncated exactly like CatalogIndex.top_matches.
+    """
+    matrix = get_catalog_matrix(index)
+    prompts = [prompt.lower().strip() for prompt, _ in queries]
+    budgets = [float(budget or 0) for _, budget in queries]
+    results = [[] for _ in queries]
+    if not matrix.entries:
+        return results
+
+    chunk_size = max(1, MAX_CHUNK_CELLS // len(matrix.entries))
+    for start in range(0, len(queries), chunk_size):
+        stop = min(start + chunk_size, len(queries))
+        _score_chunk(matrix, prompts[start:stop], budgets[start:stop],
+                     limit, results[start:stop])
+    return results
+
+
+def prompt_scores(matrix, prompts):
+    """Dense prompts x products score matrix, phrase bonus included.
+
+    Prompts must already be lower-cased and stripped; an empty prompt
+    scores zero everywhere.
+    """
+    keyword_lists = [split_keywords(prompt) for prompt in prompts]
+    vocabulary = sorted({kw for keywords in keyword_lists for kw in keywords})
+    rows = {keyword: row for row, keyword in enumerate(vocabulary)}
+
+    # Prompt x keyword counts; repeated keywords score once per occurrence
+    queries = np.zeros((len(prompts), len(vocabulary)), dtype=np.float32)
+    for row, keywords in enumerate(keyword_lists):
+        for keyword in keywords:
+            queries[row, rows[keyword]] += 1
+
+    weights, hits = matrix.keyword_weights(vocabulary)
+    scores = queries @ weights
+    # Distinct keywords of each prompt found in each product
+    coverage = (queries > 0).astype(np.float32) @ hits
+
+    for row, prompt in enumerate(prompts):
+        if not prompt:
+            scores[row] = 0
+            continue
+        score = scores[row]
+        keywords = keyword_lists[row]
+
+        # Phrase bonus. A prompt that is a single keyword is contained in
+        # the product text exactly when that keyword hit some field.
+        if keywords == [prompt]:
+            score += PHRASE_SCORE * (score > 0)
+        else:
+            if keywords:
+                # The whole phrase can only occur where every keyword does
+                columns = np.flatnonzero(coverage[row] == len(set(keywords)))
+            else:
+                columns = range(len(matrix.texts))
+            for column in columns:
+                if prompt in matrix.texts[column]:
+                    score[column] += PHRASE_SCORE
+    return scores
+
+
+def _score_chunk(matrix, prompts, budgets, limit, results):
+    scores = prompt_scores(matrix, prompts)
+    for row, prompt in enumerate(prompts):
+        if not prompt:
+            continue
+        score = scores[row]
+        matched = score > 0
+        if budgets[row] > 0:
+            matched &= matrix.prices <= budgets[row]
+        columns = np.flatnonzero(matched)
+        if len(columns) > limit:
+            # Keep every column scoring at least the k-th best so ties on
+            # score still resolve by price and catalog order below
+            cutoff = np.partition(score[columns], -limit)[-limit]
+            columns = columns[score[columns] >= cutoff]
+        order = np.lexsort((columns, matrix.prices[columns], -score[columns]))
+        results[row].extend(
+            (matrix.entries[column], int(score[column]))
+            for column in columns[order[:limit]])
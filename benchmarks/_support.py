@@ -0,0 +1,48 @@
+"""Helpers shared by the benchmark and self-check scripts.
+
+Imported by the scripts as a sibling module, so they keep running from the
+repository root as `python benchmarks/<script>.py`.
+"""
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def timed(fn, *args, **kwargs):
+    """(result of fn, seconds it took)"""
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def check(label, ok, detail=''):
+    print(f'{"ok" if ok else "FAIL":4} {label} {detail}')
+    assert ok, label
+
+
+def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return predicate()
+
+
+class StubServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Connections the client aborts or times out are part of the checks
+        if not issubclass(sys.exc_info()[0], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_stub_server(handler):
+    """Serve `handler` on a free localhost port from a daemon thread;
+    returns the server's base URL"""
+    server = StubServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
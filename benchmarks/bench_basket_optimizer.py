@@ -0,0 +1,64 @@
+"""Latency of the budget basket optimizer across catalog sizes.
+
+Builds synthetic catalogs, then times candidate selection plus the
+knapsack DP for a few needs lists and budgets, alongside the greedy fill
+for comparison of basket score. Run from the repository root:
+
+    python benchmarks/bench_basket_optimizer.py [sizes] [time_budget_ms]
+
+where sizes is a comma-separated list such as 1000,5000,20000.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from basket_optimizer import _greedy, _result, basket_candidates, optimize_basket  # noqa: E402
+from catalog_index import CatalogIndex  # noqa: E402
+
+from _support import percentile  # noqa: E402
+from bench_batch_scoring import WORDS, synthetic_catalog  # noqa: E402
+
+SIZES = [int(size) for size in sys.argv[1].split(',')] if len(sys.argv) > 1 \
+    else [1000, 5000, 20000, 50000]
+TIME_BUDGET = (float(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+
+BUDGETS = [1000, 5000, 20000]
+
+
+def main():
+    rng = random.Random(11)
+    needs_lists = [rng.sample(WORDS, rng.randint(1, 4)) for _ in range(20)]
+
+    print(f'{"catalog":>8} {"budget":>7} {"cands":>6} {"p50 ms":>8} {"p95 ms":>8} '
+          f'{"greedy":>7} {"dp/greedy score":>16}')
+    for size in SIZES:
+        index = CatalogIndex()
+        index.build(synthetic_catalog(size, rng))
+        for budget in BUDGETS:
+            timings = []
+            candidates_seen = []
+            fallbacks = 0
+            gains = []
+            for needs in needs_lists:
+                started = time.perf_counter()
+                candidates = basket_candidates(index, needs, budget)
+                basket = optimize_basket(candidates, budget, time_budget=TIME_BUDGET)
+                timings.append((time.perf_counter() - started) * 1000)
+                candidates_seen.append(len(candidates))
+                fallbacks += basket['method'] == 'greedy'
+
+                greedy = _result(_greedy(candidates, budget, 3, 3), 'greedy')
+                assert basket['cost'] <= budget
+                if greedy['value']:
+                    gains.append(basket['value'] / greedy['value'])
+
+            print(f'{size:>8} {budget:>7} {max(candidates_seen):>6} '
+                  f'{percentile(timings, 0.5):>8.1f} {percentile(timings, 0.95):>8.1f} '
+                  f'{fallbacks:>7} {sum(gains) / len(gains):>16.3f}')
+
+
+if __name__ == '__main__':
+    main()
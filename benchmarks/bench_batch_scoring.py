@@ -0,0 +1,83 @@
+"""Throughput of the batch scoring engine against the per-request scorer.
+
+Run from the repository root:
+
+    python benchmarks/bench_batch_scoring.py [catalog_size] [prompt_count]
+"""
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_scoring import score_batch  # noqa: E402
+from catalog_index import CatalogIndex, split_keywords  # noqa: E402
+
+WORDS = [
+    'fresh', 'milk', 'organic', 'chips', 'rice', 'oil', 'baby', 'soap', 'tea',
+    'snack', 'green', 'red', 'bread', 'masala', 'paneer', 'curd', 'atta',
+    'sugar', 'salt', 'juice', 'biscuit', 'noodles', 'shampoo', 'detergent',
+]
+CATEGORIES = ['Dairy & Bakery', 'Snacks', 'Home Needs', 'Staples',
+              'Fruits & Vegetables', 'Personal Care']
+
+
+def synthetic_catalog(size, rng):
+    for i in range(size):
+        yield SimpleNamespace(
+            id=f'P{i:07d}',
+            name=' '.join(rng.sample(WORDS, 2)).title() + f' {i % 97}',
+            price=rng.randint(10, 2000),
+            category=rng.choice(CATEGORIES),
+            tags='["' + '", "'.join(rng.sample(WORDS, 4)) + '"]',
+            in_stock=True,
+        )
+
+
+def synthetic_prompts(count, rng):
+    return [(' '.join(rng.sample(WORDS, rng.randint(1, 3))),
+             rng.choice([0, 100, 250, 500]))
+            for _ in range(count)]
+
+
+def main():
+    catalog_size = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    prompt_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(7)
+
+    index = CatalogIndex()
+    index.build(synthetic_catalog(catalog_size, rng))
+    queries = synthetic_prompts(prompt_count, rng)
+
+    started = time.perf_counter()
+    looped = []
+    for prompt, budget in queries:
+        prompt = prompt.lower().strip()
+        looped.append(index.top_matches(prompt, split_keywords(prompt),
+                                        budget, 12))
+    loop_seconds = time.perf_counter() - started
+
+    # First call includes building the matrix encoding; time both
+    started = time.perf_counter()
+    batched = score_batch(index, queries, 12)
+    cold_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    batched = score_batch(index, queries, 12)
+    warm_seconds = time.perf_counter() - started
+
+    def ids(results):
+        return [[(entry.id, score) for entry, score in top] for top in results]
+
+    assert ids(looped) == ids(batched), 'batch results differ from loop'
+
+    print(f'catalog={catalog_size} prompts={prompt_count}')
+    for label, seconds in (('per-request loop', loop_seconds),
+                           ('batch (cold)', cold_seconds),
+                           ('batch (warm)', warm_seconds)):
+        print(f'{label:18} {seconds:8.3f}s  {prompt_count / seconds:10.0f} prompts/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Memory ceiling check for the streaming NDJSON catalog export.
+
+Builds a synthetic SQLite catalog (1M rows by default), streams it through
+GET /api/products/export and fails if peak RSS grows by more than the
+ceiling while exporting. Run from the repository root:
+
+    python benchmarks/bench_catalog_export.py [rows] [ceiling_mb]
+"""
+import json
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import zlib
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+CEILING_MB = float(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+workdir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'export.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def populate(path, rows):
+    connection = sqlite3.connect(path)
+    connection.execute('DELETE FROM products')
+    connection.executemany(
+        'INSERT INTO products (id, name, price, category, tags, description,'
+        ' image_url, in_stock) VALUES (?, ?, ?, ?, ?, ?, ?, 1)',
+        ((f'X{i:08d}', f'Synthetic Product {i}', 10 + i % 990,
+          f'Category {i % 40}', json.dumps(['synthetic', f'tag{i % 100}']),
+          f'Quality synthetic product number {i}',
+          f'https://example.com/images/{i}.jpg') for i in range(rows)))
+    connection.commit()
+    connection.close()
+
+
+def main():
+    populate(os.path.join(workdir, 'export.db'), ROWS)
+    client = app.test_client()
+
+    for compressed in (False, True):
+        baseline = peak_rss_mb()
+        started = time.perf_counter()
+        response = client.get('/api/products/export',
+                              query_string={'gzip': str(compressed).lower()},
+                              buffered=False)
+        decompressor = zlib.decompressobj(31) if compressed else None
+        lines = 0
+        size = 0
+        for chunk in response.response:
+            size += len(chunk)
+            if decompressor:
+                chunk = decompressor.decompress(chunk)
+            lines += chunk.count(b'\n')
+        response.close()
+        seconds = time.perf_counter() - started
+        growth = peak_rss_mb() - baseline
+
+        label = 'gzip' if compressed else 'plain'
+        print(f'{label:5} rows={lines} bytes={size} {seconds:.1f}s '
+              f'{lines / seconds:.0f} rows/s peak RSS growth={growth:.1f} MB')
+        assert lines == ROWS, f'expected {ROWS} rows, got {lines}'
+        assert growth < CEILING_MB, f'RSS grew {growth:.1f} MB > {CEILING_MB} MB'
+
+
+if __name__ == '__main__':
+    main()
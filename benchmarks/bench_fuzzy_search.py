@@ -0,0 +1,93 @@
+"""Latency of typo-tolerant recommendation lookups.
+
+Builds a synthetic catalog and times, per misspelled keyword, the trigram
+lookup of spelling alternatives on its own and the full fuzzy top_matches
+call, next to exact top_matches for the correctly spelled prompt. Run
+from the repository root:
+
+    python benchmarks/bench_fuzzy_search.py [catalog_size] [rounds]
+"""
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_index import CatalogIndex, split_keywords  # noqa: E402
+
+from _support import percentile  # noqa: E402
+from bench_batch_scoring import CATEGORIES  # noqa: E402
+
+CONSONANTS = 'bcdfghjklmnprstvwyz'
+VOWELS = 'aeiou'
+
+# (misspelling, intended word); the intended words are added to the catalog
+TYPOS = [('tomatoe', 'tomato'), ('shampo', 'shampoo'), ('banan', 'banana'),
+         ('chiken', 'chicken'), ('panner', 'paneer'), ('biscit', 'biscuit'),
+         ('detergant', 'detergent'), ('noodels', 'noodles')]
+
+
+def synthetic_vocabulary(size, rng):
+    """Pronounceable made-up words, like brand and product names, so the
+    trigram index holds a realistic number of distinct tokens"""
+    words = {word for _, word in TYPOS}
+    while len(words) < size:
+        length = rng.randint(4, 9)
+        words.add(''.join(rng.choice(CONSONANTS if i % 2 == 0 else VOWELS)
+                          for i in range(length)))
+    return sorted(words)
+
+
+def synthetic_catalog(size, vocabulary, rng):
+    for i in range(size):
+        yield SimpleNamespace(
+            id=f'P{i:07d}',
+            name=' '.join(rng.sample(vocabulary, 3)).title(),
+            price=rng.randint(10, 2000),
+            category=rng.choice(CATEGORIES),
+            tags='["' + '", "'.join(rng.sample(vocabulary, 3)) + '"]',
+            in_stock=True,
+        )
+
+
+def timed(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main():
+    catalog_size = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = random.Random(5)
+
+    vocabulary = synthetic_vocabulary(catalog_size // 5, rng)
+    index = CatalogIndex()
+    started = time.perf_counter()
+    index.build(synthetic_catalog(catalog_size, vocabulary, rng))
+    print(f'catalog={catalog_size} build={time.perf_counter() - started:.1f}s '
+          f'distinct tokens={len(index._trigrams)}')
+
+    print(f'{"query":>10} {"alts":>5} {"lookup p50":>11} {"lookup p99":>11} '
+          f'{"fuzzy p50":>10} {"fuzzy p99":>10} {"exact p50":>10} {"hit":>4}')
+    for typo, word in TYPOS:
+        keywords = split_keywords(typo)
+        alternatives = index.spelling_alternatives(keywords)
+        lookup = timed(lambda: index.spelling_alternatives(keywords), rounds)
+        fuzzy = timed(lambda: index.top_matches(typo, keywords, fuzzy=True), rounds)
+        exact = timed(lambda: index.top_matches(word, [word]), rounds)
+        top = index.top_matches(typo, keywords, fuzzy=True)
+        hit = bool(top) and word in top[0][0].text
+        print(f'{typo:>10} {len(alternatives[typo]):>5} '
+              f'{percentile(lookup, 0.5):>11.3f} {percentile(lookup, 0.99):>11.3f} '
+              f'{percentile(fuzzy, 0.5):>10.3f} {percentile(fuzzy, 0.99):>10.3f} '
+              f'{percentile(exact, 0.5):>10.3f} {"yes" if hit else "no":>4}')
+
+
+if __name__ == '__main__':
+    main()
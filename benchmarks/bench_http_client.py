@@ -0,0 +1,92 @@
+"""Socket and latency savings of the pooled, coalescing outbound HTTP layer.
+
+Starts a local stub of the image search upstream (with an artificial
+delay) and compares plain per-call requests.get with the shared pooled
+session plus single-flight coalescing. Run from the repository root:
+
+    python benchmarks/bench_http_client.py [concurrency] [delay_ms]
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+
+import requests
+
+from _support import start_stub_server
+
+CONCURRENCY = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+DELAY = (int(sys.argv[2]) if len(sys.argv) > 2 else 200) / 1000
+
+
+class StubUpstream(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    requests_seen = 0
+    sockets = set()
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with StubUpstream.lock:
+            StubUpstream.requests_seen += 1
+            StubUpstream.sockets.add(self.client_address)
+        time.sleep(DELAY)
+        body = ('<img src="https://i5.walmartimages.com/asr/' + 'x' * 60 +
+                '.jpg">').encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            seen, sockets = cls.requests_seen, len(cls.sockets)
+            cls.requests_seen = 0
+            cls.sockets = set()
+        return seen, sockets
+
+
+BASE = start_stub_server(StubUpstream)
+os.environ['IMAGE_SEARCH_URL'] = BASE + '/search?q={query}'
+os.environ['WALMART_SEARCH_URL'] = BASE + '/walmart?q={query}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from walmart_images import HEADERS, fetch_walmart_image, image_lookups  # noqa: E402
+
+
+def naive(query):
+    return requests.get(os.environ['IMAGE_SEARCH_URL'].format(query=query),
+                        headers=HEADERS, timeout=10).text
+
+
+def coalesced(query):
+    return image_lookups.do(query, lambda: fetch_walmart_image(query))
+
+
+def run(label, fn, queries):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        list(pool.map(fn, queries))
+    seconds = time.perf_counter() - started
+    seen, sockets = StubUpstream.reset()
+    print(f'{label:34} {seconds * 1000:8.0f} ms  upstream requests={seen:4}  sockets={sockets:4}')
+
+
+def main():
+    print(f'concurrency={CONCURRENCY} upstream delay={DELAY * 1000:.0f} ms')
+    same = ['fresh bananas'] * CONCURRENCY
+    run('identical lookups, requests.get', naive, same)
+    run('identical lookups, pooled+coalesced', coalesced, same)
+
+    distinct = [f'product {i}' for i in range(CONCURRENCY * 3)]
+    run('distinct lookups, requests.get', naive, distinct)
+    run('distinct lookups, pooled session', fetch_walmart_image, distinct)
+
+
+if __name__ == '__main__':
+    main()
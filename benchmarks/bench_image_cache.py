@@ -0,0 +1,149 @@
+"""Self-check of /walmart-image caching, timeouts and circuit breaking.
+
+Points the image lookups at a local stub upstream and checks that found
+and "no image" answers are cached in memory and on disk (a second cache on
+the same file stands in for another worker), that negative answers expire
+on their own TTL, that a slow upstream is cut off by the read timeout
+without being cached, and that repeated upstream errors open the breaker
+until a probe succeeds. Run from the repository root:
+
+    python benchmarks/bench_image_cache.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+from _support import check, start_stub_server
+
+READ_TIMEOUT = 0.5
+BREAKER_FAILURES = 3
+BREAKER_RESET = 1
+
+IMAGE = 'https://i5.walmartimages.com/asr/' + 'x' * 60 + '.jpg'
+
+
+class StubUpstream(BaseHTTPRequestHandler):
+    """Image search stub; the first word of the query picks the answer:
+    found, none, slow (outlives the read timeout) or fail (HTTP 500)"""
+    protocol_version = 'HTTP/1.1'
+    requests_seen = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with StubUpstream.lock:
+            StubUpstream.requests_seen += 1
+        url = urlparse(self.path)
+        mode = parse_qs(url.query).get('q', [''])[0].split()[0]
+        if mode == 'slow':
+            # The client has given up by now; drop the connection
+            time.sleep(READ_TIMEOUT * 3)
+            self.close_connection = True
+            return
+        status = 500 if mode == 'fail' else 200
+        body = f'<img src="{IMAGE}">' if mode == 'found' and url.path == '/search' else ''
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            seen, cls.requests_seen = cls.requests_seen, 0
+        return seen
+
+
+BASE = start_stub_server(StubUpstream)
+
+workdir = tempfile.mkdtemp()
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'images.db')}",
+    'IMAGE_CACHE_PATH': os.path.join(workdir, 'image_cache.db'),
+    'IMAGE_SEARCH_URL': BASE + '/search?q={query}',
+    'WALMART_SEARCH_URL': BASE + '/walmart?q={query}',
+    'IMAGE_READ_TIMEOUT': str(READ_TIMEOUT),
+    'IMAGE_BREAKER_FAILURES': str(BREAKER_FAILURES),
+    'IMAGE_BREAKER_RESET': str(BREAKER_RESET),
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, image_cache  # noqa: E402
+from image_cache import ImageCache  # noqa: E402
+from resilience import CLOSED, OPEN  # noqa: E402
+from walmart_images import resolve_image, walmart_dependency  # noqa: E402
+
+
+def lookup(client, query):
+    """(JSON answer, upstream requests made, milliseconds)"""
+    started = time.perf_counter()
+    response = client.get('/walmart-image', query_string={'q': query})
+    milliseconds = (time.perf_counter() - started) * 1000
+    return response.get_json(), StubUpstream.reset(), milliseconds
+
+
+def main():
+    client = app.test_client()
+
+    answer, upstream, cold = lookup(client, 'found Bananas')
+    check('found image fetched upstream', answer == {'image': IMAGE} and upstream == 1,
+          f'{cold:.1f} ms')
+    answer, upstream, warm = lookup(client, '  FOUND   bananas ')
+    check('normalized repeat served from memory', answer == {'image': IMAGE} and upstream == 0,
+          f'{warm:.2f} ms')
+
+    answer, upstream, _ = lookup(client, 'none chutney')
+    check('"no image" tries both upstream pages', answer == {'image': ''} and upstream == 2)
+    answer, upstream, _ = lookup(client, 'none chutney')
+    check('"no image" cached as well', answer == {'image': ''} and upstream == 0)
+
+    other_worker = ImageCache(image_cache.path)
+    check('disk tier shared with another worker',
+          other_worker.get('found bananas') == IMAGE and other_worker.get('none chutney') == '' and
+          other_worker.stats()['disk']['hits'] == 2)
+
+    short_lived = ImageCache(os.path.join(workdir, 'short.db'), negative_ttl=0.2)
+    resolve_image('none paneer', short_lived)
+    resolve_image('found paneer', short_lived)
+    StubUpstream.reset()
+    time.sleep(0.3)
+    resolve_image('none paneer', short_lived)
+    resolve_image('found paneer', short_lived)
+    check('negative answers expire on their shorter TTL', StubUpstream.reset() == 2)
+
+    answer, upstream, slow = lookup(client, 'slow saffron')
+    check('slow upstream cut off by the read timeout',
+          'error' in answer and slow < READ_TIMEOUT * 2 * 1000, f'{slow:.0f} ms')
+    check('timed-out lookup not cached', image_cache.get('slow saffron') is None)
+
+    # The timeout counted against the breaker; a success resets the run
+    answer, upstream, _ = lookup(client, 'found rice')
+    check('success after the timeout', answer == {'image': IMAGE} and upstream == 1)
+    for i in range(BREAKER_FAILURES):
+        answer, upstream, _ = lookup(client, f'fail item{i}')
+        check(f'upstream error {i + 1} reported', 'error' in answer and upstream == 1)
+    check('breaker opens after consecutive failures', walmart_dependency.breaker.state == OPEN)
+    answer, upstream, rejected = lookup(client, 'found ghee')
+    check('open breaker answers degraded without calling upstream',
+          answer == {'image': '', 'degraded': True} and upstream == 0, f'{rejected:.2f} ms')
+    check('degraded answer not cached', image_cache.get('found ghee') is None)
+
+    time.sleep(BREAKER_RESET + 0.1)
+    answer, upstream, _ = lookup(client, 'found ghee')
+    check('half-open probe succeeds and closes the breaker',
+          answer == {'image': IMAGE} and upstream == 1 and
+          walmart_dependency.breaker.state == CLOSED)
+
+    stats = client.get('/walmart-image/stats').get_json()
+    print(f'cache hit rate {stats["cache"]["hit_rate"]:.2f}, upstream {stats["upstream"]}')
+
+
+if __name__ == '__main__':
+    main()
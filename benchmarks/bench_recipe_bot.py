@@ -0,0 +1,177 @@
+"""Self-check of the recipe bot cache, job mode, timeouts and breaker.
+
+Points the recipe bot at a local stub of the Mistral chat completions
+endpoint and checks that equivalent prompts are answered from the
+content-addressed cache, that a slow generation turns into a job answered
+within RECIPE_SYNC_WAIT instead of holding the request, that job
+submissions return at once and identical ones share a job, that a bounded
+queue rejects overflow, that a stalled upstream fails its job at the read
+timeout, and that repeated failures open the breaker. Run from the
+repository root:
+
+    python benchmarks/bench_recipe_bot.py
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+
+from _support import check, start_stub_server, timed
+
+READ_TIMEOUT = 1
+SYNC_WAIT = 0.3
+SLOW = 0.8
+BREAKER_FAILURES = 2
+BREAKER_RESET = 1
+JOB_WORKERS = 2
+JOB_QUEUE = 4
+CACHE_SIZE = 4
+
+
+class StubMistral(BaseHTTPRequestHandler):
+    """Chat completions stub; the first word of the prompt picks the
+    answer: slow (SLOW seconds), stall (outlives the read timeout), fail
+    (HTTP 500) or anything else (immediate)"""
+    protocol_version = 'HTTP/1.1'
+    requests_seen = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        with StubMistral.lock:
+            StubMistral.requests_seen += 1
+        data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = data['messages'][-1]['content'].split(': ', 1)[1]
+        mode = prompt.split()[0]
+        if mode == 'stall':
+            # The client has given up by now; drop the connection
+            time.sleep(READ_TIMEOUT * 2)
+            self.close_connection = True
+            return
+        if mode == 'slow':
+            time.sleep(SLOW)
+        if mode == 'fail':
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps({
+            'choices': [{'message': {'content': f'Recipe for {prompt}'}}]
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            seen, cls.requests_seen = cls.requests_seen, 0
+        return seen
+
+
+BASE = start_stub_server(StubMistral)
+
+workdir = tempfile.mkdtemp()
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'recipes.db')}",
+    'MISTRAL_API_URL': BASE + '/v1/chat/completions',
+    'MISTRAL_API_KEY': 'stub',
+    'MISTRAL_READ_TIMEOUT': str(READ_TIMEOUT),
+    'MISTRAL_BREAKER_FAILURES': str(BREAKER_FAILURES),
+    'MISTRAL_BREAKER_RESET': str(BREAKER_RESET),
+    'RECIPE_SYNC_WAIT': str(SYNC_WAIT),
+    'RECIPE_JOB_WORKERS': str(JOB_WORKERS),
+    'RECIPE_JOB_QUEUE': str(JOB_QUEUE),
+    'RECIPE_CACHE_SIZE': str(CACHE_SIZE),
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from mistral_recipe_bot import mistral_dependency, recipe_cache  # noqa: E402
+from resilience import CLOSED, OPEN  # noqa: E402
+
+
+def main():
+    client = app.test_client()
+
+    response, seconds = timed(client.post, '/api/recipe-bot', json={'prompt': 'quick Poha'})
+    check('new prompt generated upstream',
+          response.status_code == 200 and response.get_json()['recipe'] == 'Recipe for quick Poha'
+          and StubMistral.reset() == 1, f'{seconds * 1000:.1f} ms')
+    response, seconds = timed(client.post, '/api/recipe-bot', json={'prompt': '  QUICK   poha '})
+    check('equivalent prompt served from the cache',
+          response.get_json().get('cached') is True and StubMistral.reset() == 0,
+          f'{seconds * 1000:.2f} ms')
+
+    response, seconds = timed(client.post, '/api/recipe-bot', json={'prompt': 'slow dal'})
+    job = response.get_json()
+    check('slow generation answers 202 with a job after RECIPE_SYNC_WAIT',
+          response.status_code == 202 and seconds < SLOW, f'{seconds * 1000:.0f} ms')
+    response = client.get(job['status_url'], query_string={'wait': 5})
+    check('job long-poll returns the recipe',
+          response.get_json()['status'] == 'done' and StubMistral.reset() == 1)
+
+    response, seconds = timed(client.post, '/api/recipe-bot/jobs', json={'prompt': 'slow khichdi'})
+    first = response.get_json()
+    check('job submission returns at once', response.status_code == 202 and seconds < SYNC_WAIT,
+          f'{seconds * 1000:.1f} ms')
+    second = client.post('/api/recipe-bot/jobs', json={'prompt': 'Slow Khichdi'}).get_json()
+    check('identical in-flight prompt shares the job', second['job_id'] == first['job_id'])
+    client.get(first['status_url'], query_string={'wait': 5})
+    check('shared job made one upstream call', StubMistral.reset() == 1)
+
+    # More distinct slow prompts at once than the queue holds
+    def submit(i):
+        return timed(client.post, '/api/recipe-bot/jobs', json={'prompt': f'slow batch {i}'})
+    with ThreadPoolExecutor(max_workers=JOB_QUEUE * 2) as pool:
+        results = list(pool.map(submit, range(JOB_QUEUE * 2)))
+    statuses = sorted(response.status_code for response, _ in results)
+    slowest = max(seconds for _, seconds in results)
+    check('bounded queue accepts its size and rejects the rest with 503',
+          statuses.count(202) == JOB_QUEUE and statuses.count(503) == JOB_QUEUE,
+          f'slowest answer {slowest * 1000:.0f} ms')
+    for response, _ in results:
+        if response.status_code == 202:
+            client.get(response.get_json()['status_url'], query_string={'wait': 10})
+    check('queued jobs ran within the worker pool', StubMistral.reset() == JOB_QUEUE)
+    stats = recipe_cache.stats()
+    check('response cache stays within its size', stats['size'] <= CACHE_SIZE and
+          stats['evictions'] > 0, str(stats))
+
+    response, seconds = timed(client.post, '/api/recipe-bot/jobs', json={'prompt': 'stall biryani'})
+    response = client.get(response.get_json()['status_url'], query_string={'wait': READ_TIMEOUT * 3})
+    check('stalled upstream fails its job at the read timeout',
+          response.get_json()['status'] == 'failed' and StubMistral.reset() == 1)
+
+    # The stall counted against the breaker; a success resets the run
+    client.post('/api/recipe-bot', json={'prompt': 'quick upma'})
+    for i in range(BREAKER_FAILURES):
+        response = client.post('/api/recipe-bot', json={'prompt': f'fail recipe {i}'})
+        check(f'upstream error {i + 1} reported', response.status_code == 502)
+    StubMistral.reset()
+    check('breaker opens after consecutive failures', mistral_dependency.breaker.state == OPEN)
+    response, seconds = timed(client.post, '/api/recipe-bot', json={'prompt': 'quick idli'})
+    check('open breaker answers 503 without calling upstream',
+          response.status_code == 503 and response.headers.get('Retry-After') and
+          StubMistral.reset() == 0, f'{seconds * 1000:.2f} ms')
+    response = client.post('/api/recipe-bot', json={'prompt': 'quick upma'})
+    check('cached recipes are still served while open', response.status_code == 200)
+
+    time.sleep(BREAKER_RESET + 0.1)
+    response = client.post('/api/recipe-bot', json={'prompt': 'quick idli'})
+    check('half-open probe succeeds and closes the breaker',
+          response.status_code == 200 and mistral_dependency.breaker.state == CLOSED)
+
+    print(json.dumps(client.get('/api/recipe-bot/stats').get_json(), sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""Self-check of the streaming recipe endpoint against a fake upstream.
+
+Serves chat completion chunks from a local fake of Mistral's stream mode,
+one token every TOKEN_DELAY seconds, and checks that /api/recipe-bot/stream
+relays the first chunk long before the generation ends, that a finished
+stream is cached, that closing the client stream aborts the upstream
+request, and that upstream errors, a stalled stream and an open breaker
+end the stream with an error event. Run from the repository root:
+
+    python benchmarks/bench_recipe_stream.py
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+from _support import check, start_stub_server, wait_for
+
+TOKENS = 20
+TOKEN_DELAY = 0.05
+READ_TIMEOUT = 0.5
+BREAKER_FAILURES = 2
+BREAKER_RESET = 1
+
+
+class FakeStreamingMistral(BaseHTTPRequestHandler):
+    """Chat completions in stream mode; the first word of the prompt picks
+    the behaviour: fail (HTTP 500), stall (stops after one token) or
+    anything else (TOKENS tokens, then [DONE])"""
+    protocol_version = 'HTTP/1.1'
+    requests_seen = 0
+    aborted = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def write_chunk(self, data):
+        line = f'data: {data}\n\n'.encode()
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+        self.wfile.flush()
+
+    def do_POST(self):
+        with FakeStreamingMistral.lock:
+            FakeStreamingMistral.requests_seen += 1
+        data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        assert data.get('stream') is True
+        mode = data['messages'][-1]['content'].split(': ', 1)[1].split()[0]
+        if mode == 'fail':
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for i in range(TOKENS):
+                self.write_chunk(json.dumps({
+                    'choices': [{'index': 0, 'delta': {'content': f'token{i} '}}]
+                }))
+                if mode == 'stall':
+                    time.sleep(READ_TIMEOUT * 3)
+                    self.close_connection = True
+                    return
+                time.sleep(TOKEN_DELAY)
+            self.write_chunk('[DONE]')
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            with FakeStreamingMistral.lock:
+                FakeStreamingMistral.aborted += 1
+            self.close_connection = True
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            seen, aborted = cls.requests_seen, cls.aborted
+            cls.requests_seen = cls.aborted = 0
+        return seen, aborted
+
+
+BASE = start_stub_server(FakeStreamingMistral)
+
+workdir = tempfile.mkdtemp()
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'stream.db')}",
+    'MISTRAL_API_URL': BASE + '/v1/chat/completions',
+    'MISTRAL_API_KEY': 'stub',
+    'MISTRAL_READ_TIMEOUT': str(READ_TIMEOUT),
+    'MISTRAL_BREAKER_FAILURES': str(BREAKER_FAILURES),
+    'MISTRAL_BREAKER_RESET': str(BREAKER_RESET),
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from mistral_recipe_bot import mistral_dependency  # noqa: E402
+from resilience import CLOSED, OPEN  # noqa: E402
+
+
+def events(response):
+    """Yield (event, data) pairs of a streamed SSE response"""
+    buffer = ''
+    for chunk in response.response:
+        buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+        while '\n\n' in buffer:
+            block, buffer = buffer.split('\n\n', 1)
+            fields = dict(line.split(': ', 1) for line in block.splitlines()
+                          if ': ' in line)
+            if 'event' in fields:
+                yield fields['event'], json.loads(fields['data'])
+
+
+def stream(client, prompt):
+    """(events, seconds to the first chunk, seconds in total)"""
+    started = time.perf_counter()
+    response = client.get('/api/recipe-bot/stream', query_string={'prompt': prompt},
+                          buffered=False)
+    received = []
+    first = None
+    for event in events(response):
+        if first is None:
+            first = time.perf_counter() - started
+        received.append(event)
+    response.close()
+    return received, first, time.perf_counter() - started
+
+
+def main():
+    client = app.test_client()
+    generation = TOKENS * TOKEN_DELAY
+
+    received, first, total = stream(client, 'paneer tikka')
+    text = ''.join(data['text'] for event, data in received if event == 'chunk')
+    check('tokens relayed as chunk events, then done',
+          received[-1][0] == 'done' and text == ''.join(f'token{i} ' for i in range(TOKENS)))
+    check('first chunk arrives long before the generation ends',
+          first < generation / 4 and total >= generation,
+          f'first {first * 1000:.0f} ms, total {total * 1000:.0f} ms')
+    check('one upstream request', FakeStreamingMistral.reset() == (1, 0))
+
+    received, first, total = stream(client, 'Paneer  Tikka')
+    check('finished stream cached for equivalent prompts',
+          [event for event, _ in received] == ['chunk', 'done'] and
+          FakeStreamingMistral.reset() == (0, 0), f'{total * 1000:.1f} ms')
+
+    response = client.get('/api/recipe-bot/stream', query_string={'prompt': 'aloo gobi'},
+                          buffered=False)
+    next(events(response))
+    response.close()
+    check('closing the client stream aborts the upstream request',
+          wait_for(lambda: FakeStreamingMistral.aborted == 1, generation),
+          f'in flight afterwards: {mistral_dependency.stats()["in_flight"]}')
+    check('abandoned stream not cached and its slot released',
+          mistral_dependency.stats()['in_flight'] == 0 and
+          FakeStreamingMistral.reset() == (1, 1))
+    received, _, _ = stream(client, 'aloo gobi')
+    check('abandoned prompt generated afresh next time',
+          received[-1][0] == 'done' and FakeStreamingMistral.reset() == (1, 0))
+
+    received, _, total = stream(client, 'stall rajma')
+    check('stalled upstream ends the stream with an error at the read timeout',
+          [event for event, _ in received] == ['chunk', 'error'] and total < READ_TIMEOUT * 2,
+          f'{total * 1000:.0f} ms')
+    received, _, _ = stream(client, 'chole')
+    check('success after the stall', received[-1][0] == 'done')
+
+    for i in range(BREAKER_FAILURES):
+        received, _, _ = stream(client, f'fail recipe {i}')
+        check(f'upstream error {i + 1} sent as an error event',
+              [event for event, _ in received] == ['error'])
+    FakeStreamingMistral.reset()
+    check('breaker opens after consecutive failures', mistral_dependency.breaker.state == OPEN)
+    received, _, total = stream(client, 'rasam')
+    check('open breaker ends the stream at once without calling upstream',
+          received == [('error', {'error': 'Recipe bot is temporarily unavailable'})] and
+          FakeStreamingMistral.reset() == (0, 0), f'{total * 1000:.2f} ms')
+
+    time.sleep(BREAKER_RESET + 0.1)
+    received, _, _ = stream(client, 'rasam')
+    check('half-open probe succeeds and closes the breaker',
+          received[-1][0] == 'done' and mistral_dependency.breaker.state == CLOSED)
+
+
+if __name__ == '__main__':
+    main()
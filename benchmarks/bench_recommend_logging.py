@@ -0,0 +1,61 @@
+"""Latency cost of the asynchronous RecommendationLog writer.
+
+Replays /api/recommend requests through the Flask test client, alternating
+rounds with the writer enabled and with logging stubbed out, and prints
+p50/p99 per round along with the writer's counters. Run from the
+repository root:
+
+    python benchmarks/bench_recommend_logging.py [requests_per_round] [rounds]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+ROUNDS = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+workdir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'logging.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _support import percentile  # noqa: E402
+from app import app, recommendation_logs  # noqa: E402
+
+PROMPTS = ['milk', 'rice for biryani', 'fresh fruits', 'snacks', 'paneer',
+           'healthy breakfast', 'party snacks and drinks', 'nothing matches']
+
+
+def run(client, count):
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        client.post('/api/recommend', json={
+            'prompt': f'{PROMPTS[i % len(PROMPTS)]} {i % 50}',
+            'budget': 500
+        })
+        latencies.append(time.perf_counter() - started)
+    return percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    client = app.test_client()
+    log = recommendation_logs.log
+    run(client, REQUESTS // 2)  # warm caches and the writer thread
+
+    for round_number in range(ROUNDS):
+        recommendation_logs.log = lambda *args, **kwargs: True
+        p50, p99 = run(client, REQUESTS)
+        print(f"round {round_number + 1} without logging: p50 {p50:.3f} ms  p99 {p99:.3f} ms")
+        recommendation_logs.log = log
+        p50, p99 = run(client, REQUESTS)
+        print(f"round {round_number + 1} with logging:    p50 {p50:.3f} ms  p99 {p99:.3f} ms")
+
+    recommendation_logs.stop()
+    print(recommendation_logs.stats())
+
+
+if __name__ == '__main__':
+    main()
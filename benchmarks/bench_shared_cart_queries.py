@@ -0,0 +1,103 @@
+"""Query-count check for the shared-cart item listing.
+
+Fills two shared carts on a temporary SQLite database, one with a single
+item and one with many items from several contributors, counts the SQL
+statements GET /api/shared-cart/<id>/items runs for each with a
+before_cursor_execute listener, and fails unless the counts are equal.
+Run from the repository root:
+
+    python benchmarks/bench_shared_cart_queries.py [items] [contributors]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+ITEMS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+CONTRIBUTORS = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+workdir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'carts.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from cart_items import MAX_BATCH_ITEMS  # noqa: E402
+from cart_totals import check_cart_totals  # noqa: E402
+from models import db, Product, SharedCartItem, User  # noqa: E402
+
+
+class StatementCounter:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+def populate(client):
+    """Ids of a one-item cart and an ITEMS-item cart"""
+    with app.app_context():
+        for i in range(ITEMS):
+            db.session.add(Product(id=f'Q{i:06d}', name=f'Query Count Product {i}',
+                                   price=10 + i % 90, category='Synthetic',
+                                   tags='["synthetic"]', in_stock=True))
+        for i in range(1, CONTRIBUTORS + 1):
+            if db.session.get(User, i) is None:
+                db.session.add(User(id=i, firebase_uid=f'query-count-{i}',
+                                    email=f'contributor{i}@example.com'))
+        db.session.commit()
+
+    carts = []
+    for size in (1, ITEMS):
+        session_id = client.post('/api/shared-cart/create',
+                                 json={'name': f'{size} items'}).get_json()['session_id']
+        for start in range(0, size, MAX_BATCH_ITEMS):
+            response = client.post(f'/api/shared-cart/{session_id}/add-batch', json={
+                'items': [{'product_id': f'Q{i:06d}', 'quantity': 1 + i % 3}
+                          for i in range(start, min(size, start + MAX_BATCH_ITEMS))]
+            })
+            assert response.status_code == 200, response.get_json()
+        carts.append(session_id)
+
+    # Spread the large cart over several contributors and recompute its
+    # per-user totals to match
+    with app.app_context():
+        for item in SharedCartItem.query.filter_by(session_id=carts[1]):
+            item.added_by_user_id = 1 + item.id % CONTRIBUTORS
+        db.session.commit()
+        check_cart_totals(repair=True)
+    return carts
+
+
+def main():
+    client = app.test_client()
+    carts = populate(client)
+
+    counter = StatementCounter()
+    counts = []
+    with app.app_context():
+        engine = db.engine
+    for session_id in carts:
+        counter.statements = []
+        event.listen(engine, 'before_cursor_execute', counter)
+        started = time.perf_counter()
+        try:
+            response = client.get(f'/api/shared-cart/{session_id}/items')
+        finally:
+            event.remove(engine, 'before_cursor_execute', counter)
+        seconds = time.perf_counter() - started
+        data = response.get_json()
+        assert response.status_code == 200, data
+
+        print(f'items={len(data["items"]):5} contributors={len(data["user_totals"]):3} '
+              f'statements={len(counter.statements):3} {seconds * 1000:.1f} ms')
+        counts.append(len(counter.statements))
+
+    assert counts[0] == counts[1], \
+        f'statement count grows with cart size: {counts[0]} for 1 item, {counts[1]} for {ITEMS}'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Per-keystroke latency of the type-ahead suggestion index.
+
+Builds a synthetic catalog (plus search popularity), then replays typing
+every prefix of sample product names, categories and tags against
+SuggestionIndex.suggest, and times single-product catalog patches. Run
+from the repository root:
+
+    python benchmarks/bench_suggest.py [catalog_size] [typed_terms]
+"""
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_index import CatalogIndex, _snapshot  # noqa: E402
+from suggest_index import SuggestionIndex, entry_terms  # noqa: E402
+
+from _support import percentile  # noqa: E402
+from bench_fuzzy_search import synthetic_catalog, synthetic_vocabulary  # noqa: E402
+
+
+def main():
+    catalog_size = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    typed_terms = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    rng = random.Random(9)
+
+    vocabulary = synthetic_vocabulary(catalog_size // 5, rng)
+    products = list(synthetic_catalog(catalog_size, vocabulary, rng))
+    suggestions = SuggestionIndex()
+    index = CatalogIndex()
+    index.listeners.append(suggestions)
+    index.build(products[:-100])
+
+    started = time.perf_counter()
+    suggestions._rebuild(searches=Counter({
+        word: rng.randint(1, 50) for word in rng.sample(vocabulary, len(vocabulary) // 10)
+    }))
+    print(f'catalog={catalog_size} rebuild={time.perf_counter() - started:.2f}s '
+          f'{suggestions.stats()}')
+
+    _, entries = index.entries()
+    terms = sorted({term for entry in rng.sample(entries, typed_terms)
+                    for term in entry_terms(entry)})
+    samples = []
+    for term in terms:
+        for length in range(1, len(term) + 1):
+            started = time.perf_counter()
+            suggestions.suggest(term[:length])
+            samples.append((time.perf_counter() - started) * 1000)
+    print(f'{len(samples)} keystrokes: p50={percentile(samples, 0.5):.3f}ms '
+          f'p99={percentile(samples, 0.99):.3f}ms max={max(samples):.3f}ms')
+
+    # Catalog patches: new products, then the same products going out of stock
+    patches = []
+    for product in products[-100:]:
+        started = time.perf_counter()
+        index.apply([_snapshot(product)], ())
+        patches.append((time.perf_counter() - started) * 1000)
+    for product in products[-100:]:
+        started = time.perf_counter()
+        index.apply([], [product.id])
+        patches.append((time.perf_counter() - started) * 1000)
+    print(f'{len(patches)} catalog patches (whole index): '
+          f'p50={percentile(patches, 0.5):.3f}ms p99={percentile(patches, 0.99):.3f}ms')
+
+
+if __name__ == '__main__':
+    main()
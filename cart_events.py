@@ -0,0 +1,173 @@
+import json
+import logging
+import threading
+
+from sqlalchemy import func, inspect, select, update
+
+from models import db, SharedCartEvent, SharedCartSession
+
+ITEM_ADDED = 'item_added'
+ITEM_REMOVED = 'item_removed'
+QUANTITY_CHANGED = 'quantity_changed'
+
+# Events returned by one read of the feed
+EVENT_BATCH_SIZE = 200
+
+
+def next_revision(session_id):
+    """Take the session's next revision in the current transaction.
+
+    The UPDATE locks the session row until commit, so a session's events
+    commit in revision order; autoincrement ids give no such guarantee on
+    Postgres, where a reader could pass id N before N-1 commits.
+    """
+    statement = update(SharedCartSession).where(
+        SharedCartSession.id == session_id).values(
+            revision=SharedCartSession.revision + 1).returning(
+                SharedCartSession.revision)
+    return db.session.execute(
+        statement, execution_options={'synchronize_session': False}).scalar_one()
+
+
+def record_cart_event(session_id, event_type, payload):
+    """Add a change event to the current transaction.
+
+    The event commits together with the cart change it describes, so
+    subscribers never see one without the other.
+    """
+    event = SharedCartEvent()
+    event.session_id = session_id
+    event.revision = next_revision(session_id)
+    event.event_type = event_type
+    event.payload = json.dumps(payload)
+    db.session.add(event)
+    return event
+
+
+def add_event_revisions():
+    """Add the per-session revision columns to tables that predate them.
+
+    Each table is checked on its own: create_all may have just created
+    shared_cart_events with the column while shared_cart_sessions still
+    lacks it. Existing events keep their id as revision, so a client
+    resuming from an old id misses nothing, and each session counts on
+    from its highest. Returns whether anything was added.
+    """
+    def has_revision(connection, table):
+        return 'revision' in {column['name'] for column in
+                              inspect(connection).get_columns(table)}
+
+    added = False
+    with db.engine.begin() as connection:
+        if not has_revision(connection, 'shared_cart_events'):
+            connection.exec_driver_sql(
+                'ALTER TABLE shared_cart_events ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+            connection.execute(update(SharedCartEvent).values(revision=SharedCartEvent.id))
+            added = True
+        if not has_revision(connection, 'shared_cart_sessions'):
+            connection.exec_driver_sql(
+                'ALTER TABLE shared_cart_sessions ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+            latest = select(func.max(SharedCartEvent.revision)).where(
+                SharedCartEvent.session_id == SharedCartSession.id).scalar_subquery()
+            connection.execute(update(SharedCartSession).values(
+                revision=func.coalesce(latest, 0)))
+            added = True
+    return added
+
+
+def event_to_dict(event):
+    return {
+        'revision': event.revision,
+        'type': event.event_type,
+        'data': json.loads(event.payload)
+    }
+
+
+def events_since(session_id, revision, limit=EVENT_BATCH_SIZE):
+    """Events of a session after `revision`, oldest first.
+
+    Uses its own short-lived connection so long-running streams never hold
+    a transaction open.
+    """
+    statement = select(SharedCartEvent.revision, SharedCartEvent.event_type,
+                       SharedCartEvent.payload).where(
+                           SharedCartEvent.session_id == session_id,
+                           SharedCartEvent.revision > revision).order_by(
+                               SharedCartEvent.revision).limit(limit)
+    with db.engine.connect() as connection:
+        return [event_to_dict(row) for row in connection.execute(statement)]
+
+
+def latest_revision(session_id):
+    """Revision a client should resume from after loading the full cart"""
+    return db.session.query(SharedCartSession.revision).filter(
+        SharedCartSession.id == session_id).scalar() or 0
+
+
+class CartEventBroker:
+    """Per-process fan-out of shared cart events.
+
+    The database is the broker between gunicorn workers: one background
+    thread per process polls the sum of all session revisions, which every
+    committed event raises by one, and wakes every local subscriber when it
+    changes, so N open streams cost one cheap query per poll interval
+    instead of N. (The highest event id would miss an event whose id was
+    taken earlier but committed later.)
+    """
+
+    def __init__(self, poll_interval=0.5):
+        self.poll_interval = poll_interval
+        self._condition = threading.Condition()
+        self._latest = 0
+        self._thread = None
+        self._app = None
+
+    def start(self, app):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._app = app
+            with app.app_context():
+                self._latest = self._read_latest()
+            self._thread = threading.Thread(target=self._run,
+                                            name='cart-event-broker',
+                                            daemon=True)
+            self._thread.start()
+
+    def latest(self):
+        with self._condition:
+            return self._latest
+
+    def notify(self):
+        """Wake subscribers now; used right after committing an event"""
+        with self._condition:
+            self._condition.notify_all()
+
+    def wait(self, seen, timeout):
+        """Block until events were committed after `seen` or timeout passes"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._latest != seen,
+                                            timeout)
+
+    def _read_latest(self):
+        with db.engine.connect() as connection:
+            return connection.execute(
+                select(func.sum(SharedCartSession.revision))).scalar() or 0
+
+    def _run(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    latest = self._read_latest()
+                with self._condition:
+                    if latest != self._latest:
+                        self._latest = latest
+                        self._condition.notify_all()
+                    else:
+                        self._condition.wait(self.poll_interval)
+            except Exception as e:
+                logging.error(f"Cart event broker poll failed: {str(e)}")
+                threading.Event().wait(self.poll_interval)
+
+
+cart_event_broker = CartEventBroker()
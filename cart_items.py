@@ -0,0 +1,91 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, inspect, select, update
+
+from db_utils import dialect_insert
+from models import db, Product, SharedCartItem
+
+# Most distinct products accepted by one batch add
+MAX_BATCH_ITEMS = 100
+
+
+def upsert_cart_items(session_id, user_id, quantities, prices):
+    """Merge {product_id: quantity} into a session with one statement.
+
+    Each product lands in the contributor's single row for it, inserted or
+    incremented via INSERT .. ON CONFLICT DO UPDATE. New rows take their
+    unit price from `prices`; merged rows keep the price they were first
+    added at. Returns (row, inserted) pairs where row has id, product_id,
+    quantity, unit_price and added_at.
+    """
+    now = datetime.utcnow()
+    insert = dialect_insert(SharedCartItem).values([
+        {
+            'session_id': session_id,
+            'product_id': product_id,
+            'added_by_user_id': user_id,
+            'quantity': quantity,
+            'unit_price': prices[product_id],
+            'added_at': now,
+        }
+        for product_id, quantity in quantities.items()
+    ])
+    statement = insert.on_conflict_do_update(
+        index_elements=['session_id', 'product_id', 'added_by_user_id'],
+        set_={'quantity': SharedCartItem.quantity + insert.excluded.quantity},
+    ).returning(SharedCartItem.id, SharedCartItem.product_id, SharedCartItem.quantity,
+                SharedCartItem.unit_price, SharedCartItem.added_at)
+
+    rows = db.session.execute(statement).all()
+    # Existing rows hold at least 1, so a row whose quantity equals what we
+    # just added was inserted by this statement
+    return [(row, row.quantity == quantities[row.product_id]) for row in rows]
+
+
+def merge_duplicate_cart_items():
+    """Collapse rows sharing (session, product, contributor) into one.
+
+    Needed once before the unique index can be created on a database that
+    predates it. Quantities are summed into the oldest row.
+    """
+    key = (SharedCartItem.session_id, SharedCartItem.product_id,
+           SharedCartItem.added_by_user_id)
+    groups = db.session.query(*key, func.min(SharedCartItem.id),
+                              func.sum(SharedCartItem.quantity)).group_by(
+                                  *key).having(func.count() > 1).all()
+
+    for session_id, product_id, user_id, keep_id, quantity in groups:
+        SharedCartItem.query.filter(
+            SharedCartItem.session_id == session_id,
+            SharedCartItem.product_id == product_id,
+            SharedCartItem.added_by_user_id == user_id,
+            SharedCartItem.id != keep_id).delete(synchronize_session=False)
+        SharedCartItem.query.filter_by(id=keep_id).update(
+            {'quantity': quantity}, synchronize_session=False)
+
+    db.session.commit()
+    if groups:
+        logging.info(f"Merged duplicate shared cart items in {len(groups)} groups")
+
+
+def add_cart_item_prices():
+    """Add shared_cart_items.unit_price to a table that predates it.
+
+    Existing items are priced at the product's current price, the closest
+    record left of what they were added at. Returns whether the column was
+    added, in which case the materialized totals need recomputing.
+    """
+    with db.engine.begin() as connection:
+        columns = {column['name'] for column in
+                   inspect(connection).get_columns('shared_cart_items')}
+        if 'unit_price' in columns:
+            return False
+        connection.exec_driver_sql(
+            'ALTER TABLE shared_cart_items ADD COLUMN unit_price NUMERIC(10, 2) NOT NULL DEFAULT 0')
+        price = select(Product.price).where(
+            Product.id == SharedCartItem.product_id).scalar_subquery()
+        connection.execute(update(SharedCartItem).values(
+            unit_price=func.coalesce(price, 0)))
+    logging.info("Added unit prices to shared cart items")
+    return True
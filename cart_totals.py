@@ -0,0 +1,114 @@
+from decimal import Decimal
+
+from sqlalchemy import func
+
+from db_utils import dialect_insert
+from models import db, SharedCartItem, SharedCartTotal, User
+
+CENT = Decimal('0.01')
+
+
+def _money(value):
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def adjust_cart_total(session_id, user_id, amount, quantity, items=0):
+    """Add deltas to a contributor's materialized totals.
+
+    Runs as a single INSERT .. ON CONFLICT DO UPDATE inside the caller's
+    transaction, so concurrent adds never lose an increment and the totals
+    commit together with the cart change.
+    """
+    amount = _money(amount)
+    insert = dialect_insert(SharedCartTotal).values(
+        session_id=session_id, user_id=user_id, item_count=items,
+        quantity=quantity, amount=amount)
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['session_id', 'user_id'],
+        set_={
+            'item_count': SharedCartTotal.item_count + insert.excluded.item_count,
+            'quantity': SharedCartTotal.quantity + insert.excluded.quantity,
+            'amount': SharedCartTotal.amount + insert.excluded.amount,
+            'updated_at': func.now(),
+        }))
+
+
+def cart_totals(session_id, unknown_email):
+    """(user_totals by email, grand_total) read from the materialized rows"""
+    rows = db.session.query(
+        func.coalesce(User.email, unknown_email), SharedCartTotal.amount).outerjoin(
+            User, User.id == SharedCartTotal.user_id).filter(
+                SharedCartTotal.session_id == session_id,
+                SharedCartTotal.item_count > 0).all()
+
+    user_totals = {}
+    for email, amount in rows:
+        user_totals[email] = user_totals.get(email, 0) + float(amount)
+    return user_totals, sum(user_totals.values())
+
+
+def _expected_totals(session_id=None):
+    query = db.session.query(
+        SharedCartItem.session_id, SharedCartItem.added_by_user_id,
+        func.count(SharedCartItem.id), func.sum(SharedCartItem.quantity),
+        func.sum(SharedCartItem.unit_price * SharedCartItem.quantity))
+    if session_id:
+        query = query.filter(SharedCartItem.session_id == session_id)
+    rows = query.group_by(SharedCartItem.session_id,
+                          SharedCartItem.added_by_user_id).all()
+    return {
+        (sid, uid): (count, quantity, _money(amount))
+        for sid, uid, count, quantity, amount in rows
+    }
+
+
+def _write_cart_total(session_id, user_id, item_count, quantity, amount):
+    """Set a contributor's totals outright, inserting the row if missing"""
+    insert = dialect_insert(SharedCartTotal).values(
+        session_id=session_id, user_id=user_id, item_count=item_count,
+        quantity=quantity, amount=amount)
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['session_id', 'user_id'],
+        set_={
+            'item_count': insert.excluded.item_count,
+            'quantity': insert.excluded.quantity,
+            'amount': insert.excluded.amount,
+            'updated_at': func.now(),
+        }))
+
+
+def check_cart_totals(session_id=None, repair=False):
+    """Compare materialized totals with shared_cart_items and report drift.
+
+    Totals are recomputed from the unit prices items were added at. With
+    repair=True drifted rows are overwritten; each write is an upsert, so a
+    repair racing a concurrent first add cannot collide on the primary key.
+    Returns a list of drift records.
+    """
+    expected = _expected_totals(session_id)
+    query = SharedCartTotal.query
+    if session_id:
+        query = query.filter(SharedCartTotal.session_id == session_id)
+    actual = {(row.session_id, row.user_id): row for row in query}
+
+    drift = []
+    zero = (0, 0, _money(0))
+    for key in sorted(set(expected) | set(actual), key=str):
+        want = expected.get(key, zero)
+        row = actual.get(key)
+        have = (row.item_count, row.quantity, _money(row.amount)) if row else zero
+        if have == want:
+            continue
+
+        drift.append({
+            'session_id': key[0],
+            'user_id': key[1],
+            'expected': {'items': want[0], 'quantity': want[1], 'amount': float(want[2])},
+            'actual': {'items': have[0], 'quantity': have[1], 'amount': float(have[2])},
+        })
+        if repair:
+            _write_cart_total(*key, *want)
+
+    if repair and drift:
+        db.session.commit()
+    return drift
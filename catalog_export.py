@@ -0,0 +1,36 @@
+import json
+import zlib
+
+from sqlalchemy import select
+
+from catalog_snapshot import PRODUCT_FIELDS, product_to_dict
+from models import db, Product
+
+# Rows fetched per round trip, and lines joined into each emitted chunk
+EXPORT_BATCH_SIZE = 1000
+
+
+def iter_catalog_ndjson(batch_size=EXPORT_BATCH_SIZE):
+    """Yield the whole products table as newline-delimited JSON chunks.
+
+    Rows are streamed with yield_per (a server-side cursor on PostgreSQL),
+    so memory use depends on batch_size, not on the size of the table.
+    """
+    columns = [getattr(Product, field) for field in PRODUCT_FIELDS]
+    statement = (select(*columns).order_by(Product.id)
+                 .execution_options(yield_per=batch_size))
+
+    for partition in db.session.execute(statement).partitions():
+        yield ''.join(
+            json.dumps(product_to_dict(row), separators=(',', ':')) + '\n'
+            for row in partition).encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip-compress an iterable of byte chunks as it is consumed"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,456 @@
+import heapq
+import json
+import logging
+import threading
+import time
+from itertools import count
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from fuzzy_index import TrigramIndex
+from models import db, Product
+
+# Keywords shorter than this are dropped by the recommender, so shorter
+# substrings never need to be indexed.
+MIN_KEYWORD_LENGTH = 3
+
+PHRASE_SCORE = 10
+NAME_SCORE = 5
+CATEGORY_SCORE = 3
+TAG_SCORE = 2
+
+# Seconds between checks of the products table for writes made by other
+# processes (other workers, CLI jobs); each check is one count and one
+# max(updated_at) read from the index
+CATALOG_RECHECK_SECONDS = 2
+
+
+def parse_tags(raw_tags):
+    """Decode the JSON tags column of a product"""
+    return json.loads(raw_tags) if raw_tags else []
+
+
+def normalize_tag(tag):
+    """Stored form of a tag: lower-cased, single-spaced"""
+    return ' '.join(str(tag).lower().split())[:100]
+
+
+def split_keywords(prompt):
+    """Split a normalized prompt into the keywords used for matching"""
+    return [
+        word.strip() for word in prompt.split()
+        if len(word.strip()) >= MIN_KEYWORD_LENGTH
+    ]
+
+
+def text_tokens(text):
+    """Distinct whitespace tokens long enough to be keywords"""
+    return {token for token in text.split() if len(token) >= MIN_KEYWORD_LENGTH}
+
+
+def substrings(text):
+    """All substrings of each whitespace token that a keyword could equal"""
+    found = set()
+    for token in text.split():
+        for start in range(len(token) - MIN_KEYWORD_LENGTH + 1):
+            for end in range(start + MIN_KEYWORD_LENGTH, len(token) + 1):
+                found.add(token[start:end])
+    return found
+
+
+class CatalogEntry:
+    """Pre-parsed, lower-cased view of one in-stock product"""
+
+    __slots__ = ('id', 'position', 'price', 'name', 'category', 'tags',
+                 'tags_lower', 'tag_set', 'text')
+
+    def __init__(self, product_id, position, name, price, category, tags):
+        self.id = product_id
+        self.position = position
+        self.price = float(price)
+        self.name = name.lower()
+        self.category = category.lower()
+        self.tags = tags
+        self.tags_lower = [tag.lower() for tag in tags]
+        self.tag_set = frozenset(map(normalize_tag, tags)) - {''}
+        self.text = f"{self.name} {self.category} {' '.join(tags).lower()}"
+
+    def score(self, prompt, keywords):
+        """Match score for a prompt, identical to the original full scan"""
+        score = 0
+
+        # Exact phrase match gets highest score
+        if prompt in self.text:
+            score += PHRASE_SCORE
+
+        for keyword in keywords:
+            score += self.field_score(keyword)
+
+        return score
+
+    def field_score(self, keyword):
+        """Score of one keyword, from the first field containing it"""
+        if keyword in self.name:
+            return NAME_SCORE
+        if keyword in self.category:
+            return CATEGORY_SCORE
+        if any(keyword in tag for tag in self.tags_lower):
+            return TAG_SCORE
+        return 0
+
+    def fuzzy_score(self, prompt, keywords, alternatives):
+        """Match score where a keyword missing from the product counts
+        through its closest spelling in the product, weighted by trigram
+        similarity; exact matches score as in score()"""
+        score = PHRASE_SCORE if prompt in self.text else 0
+        for keyword in keywords:
+            best = self.field_score(keyword) if keyword in self.text else 0
+            if not best:
+                # Alternatives come most similar first; tokens hold no
+                # spaces, so one check against the text finds any field
+                for token, similarity in alternatives.get(keyword, ()):
+                    if similarity * NAME_SCORE <= best:
+                        break
+                    if token in self.text:
+                        best = max(best, self.field_score(token) * similarity)
+            score += best
+        return round(score, 2)
+
+
+class CatalogIndex:
+    """Process-local inverted index over in-stock products.
+
+    Every substring (of at least MIN_KEYWORD_LENGTH characters) of every
+    token in a product's name, category and tags maps to the product id, so
+    a keyword lookup returns exactly the products whose substring scan
+    would have matched. Whole normalized tags get posting lists of their
+    own for exact tag lookups, and whole tokens have posting lists plus a
+    trigram index over them for typo-tolerant lookups.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._postings = {}
+        self._tag_postings = {}
+        self._token_postings = {}
+        self._trigrams = TrigramIndex()
+        self._positions = count()
+        self.built = False
+        # Bumped on every rebuild or patch so derived structures can tell
+        # when they are stale
+        self.version = 0
+        # Objects kept in step incrementally: catalog_built(entries) after
+        # a rebuild and catalog_changed(removed, added) after each patch
+        self.listeners = []
+
+    def build(self, products):
+        """Rebuild the whole index from an iterable of Product rows"""
+        with self._lock:
+            self._entries = {}
+            self._postings = {}
+            self._tag_postings = {}
+            self._token_postings = {}
+            self._trigrams = TrigramIndex()
+            self._positions = count()
+            for product in products:
+                self._add(_snapshot(product))
+            self.built = True
+            self.version += 1
+            for listener in self.listeners:
+                listener.catalog_built(list(self._entries.values()))
+        logging.info(f"Catalog index built with {len(self._entries)} products")
+
+    def invalidate(self):
+        """Force a full rebuild on next use"""
+        with self._lock:
+            self.built = False
+
+    def apply(self, snapshots, deleted_ids):
+        """Patch the index with changed product snapshots and deletions"""
+        with self._lock:
+            if not self.built:
+                return
+            removed = [self._remove(product_id) for product_id in deleted_ids]
+            added = []
+            for snapshot in snapshots:
+                # Updated products keep their place in catalog order
+                previous = self._remove(snapshot['id'])
+                removed.append(previous)
+                added.append(self._add(snapshot, previous.position if previous else None))
+            self.version += 1
+            removed = [entry for entry in removed if entry is not None]
+            added = [entry for entry in added if entry is not None]
+            for listener in self.listeners:
+                listener.catalog_changed(removed, added)
+
+    def candidates(self, prompt, keywords):
+        """Entries that can score above zero for the prompt, in catalog order"""
+        matched = self._candidates(prompt, keywords)
+        matched.sort(key=lambda entry: entry.position)
+        return matched
+
+    def _candidates(self, prompt, keywords, within=None, tokens=()):
+        """Entries containing a keyword or one of the whole `tokens`"""
+        with self._lock:
+            if within is not None:
+                # Check only the given ids, so the cost follows the size of
+                # `within` rather than of the keyword postings
+                postings = [self._postings.get(keyword, ()) for keyword in keywords] + \
+                    [self._token_postings.get(token, ()) for token in tokens]
+                matched = []
+                for product_id in within:
+                    entry = self._entries.get(product_id)
+                    if entry is None:
+                        continue
+                    if keywords:
+                        hit = any(product_id in posting for posting in postings)
+                    else:
+                        hit = prompt in entry.text
+                    if hit:
+                        matched.append(entry)
+            elif not keywords:
+                # No indexable keyword; only the phrase bonus can apply
+                matched = [entry for entry in self._entries.values()
+                           if prompt in entry.text]
+            else:
+                ids = set()
+                for keyword in keywords:
+                    ids.update(self._postings.get(keyword, ()))
+                for token in tokens:
+                    ids.update(self._token_postings.get(token, ()))
+                matched = [self._entries[product_id] for product_id in ids]
+        return matched
+
+    def spelling_alternatives(self, keywords):
+        """Catalog tokens spelled like each keyword, as {keyword:
+        [(token, similarity)]}; tokens containing the keyword are left out
+        since the keyword already matches them exactly"""
+        with self._lock:
+            return {
+                keyword: [(token, similarity)
+                          for token, similarity in self._trigrams.similar(keyword)
+                          if keyword not in token]
+                for keyword in keywords
+            }
+
+    def top_matches(self, prompt, keywords, budget=0, limit=12, within=None,
+                    fuzzy=False):
+        """Best `limit` (entry, score) pairs ordered by score desc, price asc.
+
+        The budget ceiling is applied before scoring and a bounded min-heap
+        holds only the current top `limit`, so broad prompts never sort the
+        full candidate list. `within` restricts matches to a set of product
+        ids, such as the result of a tag query. With `fuzzy`, products
+        containing a close spelling of a keyword are matched too.
+        """
+        alternatives = self.spelling_alternatives(keywords) if fuzzy else {}
+        tokens = [token for options in alternatives.values() for token, _ in options]
+
+        heap = []
+        for entry in self._candidates(prompt, keywords, within, tokens):
+            # Budget filter
+            if budget > 0 and entry.price > budget:
+                continue
+
+            if fuzzy:
+                score = entry.fuzzy_score(prompt, keywords, alternatives)
+            else:
+                score = entry.score(prompt, keywords)
+            if score <= 0:
+                continue
+
+            # Smallest key is the worst kept match: lowest score, then
+            # highest price, then latest in catalog order
+            key = (score, -entry.price, -entry.position)
+            if len(heap) < limit:
+                heapq.heappush(heap, (key, entry))
+            elif key > heap[0][0]:
+                heapq.heapreplace(heap, (key, entry))
+
+        heap.sort(reverse=True)
+        return [(entry, key[0]) for key, entry in heap]
+
+    def get(self, product_id):
+        with self._lock:
+            return self._entries.get(product_id)
+
+    def lookup(self, product_ids):
+        """Entries of the given ids that are in the index"""
+        with self._lock:
+            entries = (self._entries.get(product_id) for product_id in product_ids)
+            return [entry for entry in entries if entry is not None]
+
+    def tagged(self, tags):
+        """Ids of products carrying any of the normalized tags"""
+        with self._lock:
+            ids = set()
+            for tag in tags:
+                ids.update(self._tag_postings.get(tag, ()))
+            return ids
+
+    def entries(self):
+        """Consistent (version, entries in catalog order) snapshot"""
+        with self._lock:
+            entries = list(self._entries.values())
+            version = self.version
+        entries.sort(key=lambda entry: entry.position)
+        return version, entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _add(self, snapshot, position=None):
+        if not snapshot['in_stock']:
+            return None
+        if position is None:
+            position = next(self._positions)
+        entry = CatalogEntry(snapshot['id'], position,
+                             snapshot['name'], snapshot['price'],
+                             snapshot['category'], snapshot['tags'])
+        self._entries[entry.id] = entry
+        for key in substrings(entry.text):
+            self._postings.setdefault(key, set()).add(entry.id)
+        for tag in entry.tag_set:
+            self._tag_postings.setdefault(tag, set()).add(entry.id)
+        for token in text_tokens(entry.text):
+            posting = self._token_postings.get(token)
+            if posting is None:
+                posting = self._token_postings[token] = set()
+                self._trigrams.add(token)
+            posting.add(entry.id)
+        return entry
+
+    def _remove(self, product_id):
+        entry = self._entries.pop(product_id, None)
+        if entry is None:
+            return None
+        for key in substrings(entry.text):
+            posting = self._postings.get(key)
+            if posting is not None:
+                posting.discard(product_id)
+                if not posting:
+                    del self._postings[key]
+        for tag in entry.tag_set:
+            posting = self._tag_postings.get(tag)
+            if posting is not None:
+                posting.discard(product_id)
+                if not posting:
+                    del self._tag_postings[tag]
+        for token in text_tokens(entry.text):
+            posting = self._token_postings.get(token)
+            if posting is not None:
+                posting.discard(product_id)
+                if not posting:
+                    del self._token_postings[token]
+                    self._trigrams.remove(token)
+        return entry
+
+
+def _snapshot(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'category': product.category,
+        'tags': parse_tags(product.tags),
+        'in_stock': product.in_stock,
+    }
+
+
+catalog_index = CatalogIndex()
+
+_version_lock = threading.Lock()
+_fingerprint = None
+_checked_at = None
+
+
+def catalog_fingerprint():
+    """(row count, latest updated_at) of the products table; changes when
+    any process inserts, deletes or updates products through the ORM"""
+    count, last_modified = db.session.query(
+        func.count(Product.id), func.max(Product.updated_at)).one()
+    return count, last_modified
+
+
+def sync_catalog():
+    """Current products table fingerprint, read at most every
+    CATALOG_RECHECK_SECONDS and at once after a commit in this process.
+
+    When it has moved, the index is rebuilt on next use. Commits in this
+    process have already patched the index, which that rebuild repeats.
+    """
+    global _fingerprint, _checked_at
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < CATALOG_RECHECK_SECONDS:
+        return _fingerprint
+
+    with _version_lock:
+        if _checked_at is not None and now - _checked_at < CATALOG_RECHECK_SECONDS:
+            return _fingerprint
+        fingerprint = catalog_fingerprint()
+        if _fingerprint is not None and fingerprint != _fingerprint:
+            catalog_index.invalidate()
+        _fingerprint, _checked_at = fingerprint, now
+        return fingerprint
+
+
+def fingerprint_version(fingerprint):
+    """Catalog version string of a products table fingerprint"""
+    count, last_modified = fingerprint
+    return f"{count}@{last_modified}"
+
+
+def catalog_version():
+    """Version of the committed catalog, derived from the products table
+    rather than counted per process, so every worker moves to the same
+    new version within CATALOG_RECHECK_SECONDS of a write"""
+    return fingerprint_version(sync_catalog())
+
+
+def refresh_catalog_version():
+    """Re-read the fingerprint on next use, after a commit in this process"""
+    global _checked_at
+    with _version_lock:
+        _checked_at = None
+
+
+def get_catalog_index():
+    """Return the process-wide index, building it from the database if needed"""
+    sync_catalog()
+    if not catalog_index.built:
+        catalog_index.build(Product.query.all())
+    return catalog_index
+
+
+# Keep the index in sync with committed Product changes. Row values are
+# captured at flush time because the session cannot load expired attributes
+# once the transaction has committed.
+@event.listens_for(Session, 'after_flush')
+def _collect_product_changes(session, flush_context):
+    changes = session.info.setdefault('catalog_changes', {})
+    deleted = session.info.setdefault('catalog_deleted', set())
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Product):
+            changes[obj.id] = _snapshot(obj)
+            deleted.discard(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            changes.pop(obj.id, None)
+            deleted.add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_product_changes(session):
+    changes = session.info.pop('catalog_changes', None)
+    deleted = session.info.pop('catalog_deleted', None)
+    if changes or deleted:
+        refresh_catalog_version()
+        catalog_index.apply(list((changes or {}).values()), deleted or ())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_product_changes(session):
+    session.info.pop('catalog_changes', None)
+    session.info.pop('catalog_deleted', None)
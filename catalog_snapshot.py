@@ -0,0 +1,115 @@
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from catalog_index import fingerprint_version, parse_tags, sync_catalog
+from models import Product
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Writes that bypass Product.updated_at (raw SQL) are caught by rebuilding
+# at least this often; an unchanged body keeps its ETag
+SNAPSHOT_MAX_AGE = 300
+
+
+# Fields of the public product shape, in response order
+PRODUCT_FIELDS = ('id', 'name', 'price', 'category', 'tags', 'description',
+                  'image_url', 'in_stock')
+
+
+def product_to_dict(product, fields=PRODUCT_FIELDS):
+    """Public JSON shape of a product (or projected row), as served by
+    /api/products"""
+    data = {}
+    for field in fields:
+        value = getattr(product, field)
+        if field == 'price':
+            value = float(value)
+        elif field == 'tags':
+            value = parse_tags(value)
+        data[field] = value
+    return data
+
+
+class CatalogSnapshot:
+    """Pre-serialized /api/products body with pre-compressed variants.
+
+    The ETag is a digest of the body, so workers that have built their
+    snapshot from the same rows hand out the same validator.
+    `fingerprint` is the (count, max(updated_at)) of the products table it
+    was built from.
+    """
+
+    def __init__(self, fingerprint, body):
+        self.fingerprint = fingerprint
+        self.body = body
+        self.last_modified = fingerprint[1]
+        self.built_at = time.monotonic()
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.encoded = {'gzip': gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            self.encoded['br'] = brotli.compress(body)
+
+    def encodings(self):
+        """Content codings this snapshot can be served with, best first"""
+        return [coding for coding in ('br', 'gzip') if coding in self.encoded]
+
+    def representation(self, coding):
+        """(body, etag) for a content coding, or the identity body for None"""
+        if coding in self.encoded:
+            return self.encoded[coding], f"{self.etag}-{coding}"
+        return self.body, self.etag
+
+
+_snapshot_lock = threading.Lock()
+_snapshot = None
+
+
+def get_catalog_snapshot():
+    """Current catalog snapshot.
+
+    Rebuilt whenever the products table fingerprint moves, which
+    catalog_index notices at once after a write in this process and within
+    CATALOG_RECHECK_SECONDS of a write by another, and at least every
+    SNAPSHOT_MAX_AGE seconds otherwise.
+    """
+    global _snapshot
+    fingerprint = sync_catalog()
+    snapshot = _snapshot
+    now = time.monotonic()
+    if snapshot is not None and snapshot.fingerprint == fingerprint and \
+            now - snapshot.built_at < SNAPSHOT_MAX_AGE:
+        return snapshot
+
+    with _snapshot_lock:
+        snapshot = _snapshot
+        if snapshot is not None and snapshot.fingerprint == fingerprint and \
+                now - snapshot.built_at < SNAPSHOT_MAX_AGE:
+            return snapshot
+
+        rebuilt = _build_snapshot(fingerprint)
+        if snapshot is not None and rebuilt.etag == snapshot.etag:
+            # Same body: keep the old object so its compressed variants
+            # are not thrown away, but restart its clock
+            snapshot.fingerprint = fingerprint
+            snapshot.last_modified = fingerprint[1]
+            snapshot.built_at = now
+        else:
+            _snapshot = rebuilt
+        return _snapshot
+
+
+def _build_snapshot(fingerprint):
+    products = [product_to_dict(product)
+                for product in Product.query.order_by(Product.id)]
+    body = json.dumps({'success': True, 'products': products},
+                      separators=(',', ':'), sort_keys=True).encode('utf-8')
+    logging.info(f"Built catalog snapshot {fingerprint_version(fingerprint)}: "
+                 f"{len(products)} products, {len(body)} bytes")
+    return CatalogSnapshot(fingerprint, body)
@@ -0,0 +1,54 @@
+import heapq
+
+from catalog_index import normalize_tag
+
+# Shopping contexts and the tags a product needs to fit them; a context
+# term matches products carrying any of its tags
+CONTEXT_TAGS = {
+    'biryani': frozenset(['rice', 'spices', 'chicken', 'saffron', 'yogurt']),
+    'wedding': frozenset(['sweets', 'decorations', 'flowers', 'snacks', 'juice']),
+    'keto': frozenset(['keto', 'almonds', 'avocados', 'eggs', 'cheese', 'spinach']),
+    'party': frozenset(['chips', 'soda', 'cake', 'cups', 'snacks']),
+    'high protein': frozenset(['high protein', 'protein']),
+    'low sugar': frozenset(['low sugar', 'sugar free']),
+    'low sodium': frozenset(['low sodium']),
+}
+
+
+def context_tags(term):
+    """Tags a context name stands for; any other term is a single tag"""
+    term = normalize_tag(term)
+    return CONTEXT_TAGS.get(term, frozenset([term]) if term else frozenset())
+
+
+def match_terms(index, terms, match_all=False):
+    """Ids of products fitting all (or any) of the terms, and the tags
+    that count towards their rank.
+
+    Each term is the union of its tags' posting lists in the catalog
+    index; terms are then intersected smallest first, or unioned.
+    """
+    tag_sets = [context_tags(term) for term in terms]
+    if not tag_sets:
+        return set(), set()
+    id_sets = sorted((index.tagged(tags) for tags in tag_sets), key=len)
+    if match_all:
+        ids = id_sets[0].intersection(*id_sets[1:])
+    else:
+        ids = set().union(*id_sets)
+    return ids, set().union(*tag_sets)
+
+
+def rank_matches(index, ids, wanted, budget=0, offset=0, limit=12):
+    """One page of (entry, score) pairs plus the total match count.
+
+    The score is the number of wanted tags a product carries; ties go to
+    the cheaper product, then catalog order.
+    """
+    keyed = [
+        (-len(entry.tag_set & wanted), entry.price, entry.position, entry)
+        for entry in index.lookup(ids)
+        if not (budget > 0 and entry.price > budget)
+    ]
+    page = heapq.nsmallest(offset + limit, keyed, key=lambda item: item[:3])
+    return [(entry, -score) for score, _, _, entry in page[offset:]], len(keyed)
@@ -0,0 +1,13 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db
+
+
+def dialect_insert(model):
+    """INSERT construct supporting ON CONFLICT for the configured database"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model)
+    if dialect == 'sqlite':
+        return sqlite.insert(model)
+    raise NotImplementedError(f"Upserts are not supported on {dialect}")
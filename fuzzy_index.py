@@ -0,0 +1,82 @@
+from collections import Counter
+
+# Trigram Jaccard similarity a catalog token needs to count as a spelling
+# of a query keyword, as pg_trgm's default ("tomatoe" ~ "tomato" is 0.67,
+# the transposed "noodels" ~ "noodles" 0.33)
+FUZZY_THRESHOLD = 0.3
+
+# Closest catalog tokens kept per query keyword, and how far below the
+# best one's similarity they may fall; weak alternatives of a clear
+# correction only add candidates that rank below it anyway
+MAX_ALTERNATIVES = 3
+SIMILARITY_WINDOW = 0.2
+
+
+def trigrams(word):
+    """Character trigrams of a word padded like pg_trgm, so short words and
+    word starts carry extra weight"""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Trigram -> token posting lists over the distinct catalog tokens.
+
+    Products share most of their vocabulary, so the index grows with the
+    number of distinct words rather than products.
+    """
+
+    def __init__(self):
+        self._sizes = {}
+        self._postings = {}
+
+    def add(self, token):
+        if token in self._sizes:
+            return
+        grams = trigrams(token)
+        self._sizes[token] = len(grams)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(token)
+
+    def remove(self, token):
+        if self._sizes.pop(token, None) is None:
+            return
+        for gram in trigrams(token):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(token)
+                if not posting:
+                    del self._postings[gram]
+
+    def similar(self, word, threshold=FUZZY_THRESHOLD, limit=MAX_ALTERNATIVES):
+        """Best (token, similarity) pairs for a word, most similar first,
+        within SIMILARITY_WINDOW of the closest token.
+
+        Overlaps are counted only over tokens sharing a trigram with the
+        word, and tokens whose trigram count alone rules out reaching the
+        threshold are skipped before computing similarity.
+        """
+        grams = trigrams(word)
+        overlaps = Counter()
+        for gram in grams:
+            overlaps.update(self._postings.get(gram, ()))
+
+        # Jaccard >= t needs t*|A| <= |B| <= |A|/t and overlap >= t*|A|
+        smallest = threshold * len(grams)
+        largest = len(grams) / threshold
+        matches = []
+        for token, overlap in overlaps.items():
+            if overlap < smallest:
+                continue
+            size = self._sizes[token]
+            if size < smallest or size > largest:
+                continue
+            similarity = overlap / (len(grams) + size - overlap)
+            if similarity >= threshold:
+                matches.append((token, similarity))
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return [(token, similarity) for token, similarity in matches[:limit]
+                if similarity >= matches[0][1] - SIMILARITY_WINDOW]
+
+    def __len__(self):
+        return len(self._sizes)
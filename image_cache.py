@@ -0,0 +1,119 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from ttl_cache import TTLCache
+
+# Found images change rarely; "no image" answers are retried sooner
+POSITIVE_TTL = 7 * 24 * 3600
+NEGATIVE_TTL = 3600
+
+
+def normalize_image_query(query):
+    """Cache key for an image lookup: lower-cased, single-spaced"""
+    return ' '.join(query.lower().split())
+
+
+class ImageCache:
+    """Two-tier cache of image lookups keyed on the normalized query.
+
+    Tier one is an in-process LRU. Tier two is a SQLite file shared by every
+    gunicorn worker on the host, so a lookup answered by one worker is not
+    repeated by the others or after a restart. An empty string is a cached
+    "no image found" and lives for the shorter negative TTL.
+    """
+
+    def __init__(self, path, memory_size=4096, positive_ttl=POSITIVE_TTL,
+                 negative_ttl=NEGATIVE_TTL):
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.memory = TTLCache(maxsize=memory_size, ttl=positive_ttl)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.disk_errors = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS image_cache ('
+                ' query TEXT PRIMARY KEY,'
+                ' image_url TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL)')
+            self._local.connection = connection
+        return connection
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key):
+        """Cached image URL ("" for a cached miss), or None if unknown"""
+        image_url = self.memory.get(key)
+        if image_url is not None:
+            return image_url
+
+        try:
+            row = self._connection().execute(
+                'SELECT image_url, expires_at FROM image_cache WHERE query = ?',
+                (key,)).fetchone()
+        except sqlite3.Error as e:
+            self._count('disk_errors')
+            logging.error(f"Image cache read failed: {str(e)}")
+            return None
+
+        remaining = row[1] - time.time() if row else 0
+        if remaining <= 0:
+            self._count('disk_misses')
+            return None
+
+        self._count('disk_hits')
+        # Promote without outliving the persisted expiry
+        self.memory.set(key, row[0], ttl=remaining)
+        return row[0]
+
+    def set(self, key, image_url):
+        ttl = self.positive_ttl if image_url else self.negative_ttl
+        self.memory.set(key, image_url, ttl=ttl)
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO image_cache (query, image_url, expires_at)'
+                    ' VALUES (?, ?, ?)', (key, image_url, time.time() + ttl))
+        except sqlite3.Error as e:
+            self._count('disk_errors')
+            logging.error(f"Image cache write failed: {str(e)}")
+
+    def purge_expired(self):
+        """Delete expired rows from the disk tier; returns how many"""
+        connection = self._connection()
+        with connection:
+            return connection.execute(
+                'DELETE FROM image_cache WHERE expires_at <= ?',
+                (time.time(),)).rowcount
+
+    def stats(self):
+        memory = self.memory.stats()
+        with self._stats_lock:
+            hits = memory['hits'] + self.disk_hits
+            lookups = memory['hits'] + memory['misses']
+            return {
+                'memory': memory,
+                'disk': {
+                    'hits': self.disk_hits,
+                    'misses': self.disk_misses,
+                    'errors': self.disk_errors,
+                },
+                'hits': hits,
+                'misses': lookups - hits,
+                'hit_rate': hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from image_cache import normalize_image_query
+from models import db, Product
+from resilience import DependencyUnavailable
+from walmart_images import load_image, walmart_dependency
+
+# Seconds between checks of whether image lookups are available again
+# while the breaker is open or every lookup slot is taken
+PAUSE_INTERVAL = 1
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` acquisitions per second on average"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class PrewarmStats:
+    """Counters of a pre-warming run; persisted in the checkpoint"""
+
+    FIELDS = ('processed', 'cached', 'fetched', 'found', 'not_found',
+              'failed', 'retried', 'paused_seconds', 'products_updated')
+
+    def __init__(self, saved=None):
+        self._lock = threading.Lock()
+        for field in self.FIELDS:
+            setattr(self, field, (saved or {}).get(field, 0))
+
+    def add(self, **counts):
+        with self._lock:
+            for field, value in counts.items():
+                setattr(self, field, getattr(self, field) + value)
+
+    def as_dict(self):
+        with self._lock:
+            return {field: getattr(self, field) for field in self.FIELDS}
+
+
+def _load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_checkpoint(path, last_id, failed_ids, stats):
+    if not path:
+        return
+    # Write then rename so an interrupted run never leaves a torn file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'last_id': last_id, 'failed_ids': failed_ids,
+                   'stats': stats.as_dict()}, f)
+    os.replace(tmp_path, path)
+
+
+def _wait_until_available(max_pause):
+    """Sleep while image lookups are rejected, up to max_pause seconds;
+    returns the seconds waited"""
+    waited = 0
+    while waited < max_pause:
+        time.sleep(PAUSE_INTERVAL)
+        waited += PAUSE_INTERVAL
+        if walmart_dependency.available():
+            break
+    return waited
+
+
+def prewarm_images(cache, checkpoint_path=None, concurrency=8, rate=5.0,
+                   batch_size=100, only_missing=False, update_products=False,
+                   restart=False, max_pause=300, report=logging.info):
+    """Resolve product images ahead of user traffic.
+
+    Walks products in id order. Lookups already fresh in the image cache
+    cost nothing; the rest are fetched upstream through the same path as
+    /walmart-image, at most `concurrency` at a time and `rate` per second.
+    While the image breaker is open (or every lookup slot is taken) the
+    run pauses, for at most `max_pause` seconds per lookup, instead of
+    skipping products. Progress is checkpointed after every batch together
+    with the ids of failed lookups, and the next run retries those first;
+    a run that ends with failures keeps its checkpoint for that reason.
+    With update_products, found images are also written to products that
+    have no image_url.
+    """
+    checkpoint = None if restart else _load_checkpoint(checkpoint_path)
+    last_id = checkpoint['last_id'] if checkpoint else None
+    retry_ids = checkpoint.get('failed_ids', []) if checkpoint else []
+    stats = PrewarmStats(checkpoint['stats'] if checkpoint else None)
+    if checkpoint:
+        report(f"Resuming image pre-warm after product {last_id}, "
+               f"retrying {len(retry_ids)} failed product(s) first")
+
+    limiter = RateLimiter(rate)
+    started = time.monotonic()
+    processed_at_start = stats.processed
+    failed_ids = []
+
+    def resolve(name):
+        """Image URL ("" for none found), or None if the lookup failed"""
+        key = normalize_image_query(name)
+        cached = cache.get(key)
+        if cached is not None:
+            stats.add(cached=1)
+            return cached
+
+        paused = 0
+        while True:
+            limiter.acquire()
+            try:
+                image_url = load_image(name, cache, key)
+                break
+            except DependencyUnavailable as e:
+                if paused >= max_pause:
+                    logging.error(f"Pre-warm gave up on {name}: {str(e)}")
+                    stats.add(failed=1)
+                    return None
+                waited = _wait_until_available(max_pause - paused)
+                paused += waited
+                stats.add(paused_seconds=waited)
+            except Exception as e:
+                logging.error(f"Pre-warm failed for {name}: {str(e)}")
+                stats.add(failed=1)
+                return None
+
+        stats.add(fetched=1, found=1 if image_url else 0,
+                  not_found=0 if image_url else 1)
+        return image_url
+
+    def process(pool, products):
+        """Resolve a batch; returns the ids whose lookup failed"""
+        images = list(pool.map(resolve, [p.name for p in products]))
+
+        if update_products:
+            updated = 0
+            for product, image_url in zip(products, images):
+                if image_url and not product.image_url:
+                    product.image_url = image_url
+                    updated += 1
+            db.session.commit()
+            stats.add(products_updated=updated)
+
+        return [product.id for product, image_url in zip(products, images)
+                if image_url is None]
+
+    def progress():
+        elapsed = time.monotonic() - started
+        counts = stats.as_dict()
+        report(f"Pre-warmed {counts['processed']} products "
+               f"({(counts['processed'] - processed_at_start) / elapsed:.1f}/s): "
+               f"{counts['cached']} cached, {counts['fetched']} fetched, "
+               f"{counts['failed']} failed, {counts['retried']} retried, "
+               f"paused {counts['paused_seconds']}s")
+
+    with ThreadPoolExecutor(max_workers=concurrency,
+                            thread_name_prefix='image-prewarm') as pool:
+        # Products whose lookup failed in an earlier run
+        for start in range(0, len(retry_ids), batch_size):
+            products = Product.query.filter(
+                Product.id.in_(retry_ids[start:start + batch_size])).order_by(
+                    Product.id).all()
+            failed_ids.extend(process(pool, products))
+            stats.add(retried=len(products))
+            _save_checkpoint(checkpoint_path, last_id,
+                             failed_ids + retry_ids[start + batch_size:], stats)
+            progress()
+
+        while True:
+            query = Product.query.order_by(Product.id)
+            if last_id is not None:
+                query = query.filter(Product.id > last_id)
+            if only_missing:
+                query = query.filter(
+                    (Product.image_url.is_(None)) | (Product.image_url == ''))
+            products = query.limit(batch_size).all()
+            if not products:
+                break
+
+            failed_ids.extend(process(pool, products))
+            last_id = products[-1].id
+            stats.add(processed=len(products))
+            _save_checkpoint(checkpoint_path, last_id, failed_ids, stats)
+            progress()
+
+    if failed_ids:
+        # Keep the checkpoint so the next run retries just these
+        _save_checkpoint(checkpoint_path, last_id, failed_ids, stats)
+        report(f"{len(failed_ids)} product(s) failed; run again to retry them")
+    elif checkpoint_path and os.path.exists(checkpoint_path):
+        # A finished run starts from the beginning next time
+        os.remove(checkpoint_path)
+
+    summary = stats.as_dict()
+    elapsed = time.monotonic() - started
+    summary['failed_ids'] = len(failed_ids)
+    summary['seconds'] = round(elapsed, 2)
+    summary['per_second'] = round(
+        (summary['processed'] - processed_at_start) / elapsed, 1) if elapsed else 0
+    return summary
@@ -1,15 +1,110 @@
+import hashlib
+import json
+import os
 
-import requests
+from http_client import SingleFlight, http_session
+from resilience import CircuitBreaker, Dependency
+from ttl_cache import TTLCache
 
-def get_mistral_recipes(prompt, mistral_api_key="#api key
-"):
-    url = "https://api.mistral.ai/v1/chat/completions"
-    headers = {
+MISTRAL_API_URL = os.environ.get("MISTRAL_API_URL", "https://api.mistral.ai/v1/chat/completions")
+MISTRAL_MODEL = os.environ.get("MISTRAL_MODEL", "mistral-medium")
+MISTRAL_TEMPERATURE = 0.7
+
+# (connect, read) seconds; a generation that stalls longer is abandoned
+MISTRAL_TIMEOUT = (5, float(os.environ.get("MISTRAL_READ_TIMEOUT", 60)))
+
+# Caps blocked threads per process across recipe jobs and streams, and
+# stops calling Mistral for a while after repeated failures
+mistral_dependency = Dependency(
+    'mistral',
+    timeout=MISTRAL_TIMEOUT,
+    max_concurrent=int(os.environ.get("MISTRAL_MAX_CONCURRENT", 8)),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get("MISTRAL_BREAKER_FAILURES", 3)),
+        reset_timeout=int(os.environ.get("MISTRAL_BREAKER_RESET", 60))))
+
+# Identical prompts requested at the same moment share one completion
+recipe_requests = SingleFlight()
+
+# Completed recipes keyed on the normalized prompt and model parameters
+recipe_cache = TTLCache(
+    maxsize=int(os.environ.get("RECIPE_CACHE_SIZE", 512)),
+    ttl=int(os.environ.get("RECIPE_CACHE_TTL", 6 * 3600)))
+
+
+def recipe_cache_key(prompt, model=MISTRAL_MODEL, temperature=MISTRAL_TEMPERATURE):
+    """Content address of a recipe request: sha256 of the lower-cased,
+    single-spaced prompt and the model parameters"""
+    normalized = ' '.join(prompt.lower().split())
+    payload = json.dumps([normalized, model, temperature])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_mistral_recipes(prompt, mistral_api_key=None):
+    mistral_api_key = mistral_api_key or os.environ.get("MISTRAL_API_KEY", "")
+    key = recipe_cache_key(prompt)
+    recipe = recipe_cache.get(key)
+    if recipe is not None:
+        return recipe
+
+    def load():
+        recipe = _request_mistral_recipes(prompt, mistral_api_key)
+        recipe_cache.set(key, recipe)
+        return recipe
+
+    return recipe_requests.do(key, load)
+
+
+def stream_mistral_recipes(prompt, mistral_api_key=None):
+    """Yield the recipe as text chunks while Mistral generates it.
+
+    Uses the chat completions stream mode. Closing the generator closes
+    the upstream response, so an abandoned stream stops the generation.
+    The full text is cached once the stream completes. The stream holds
+    one Mistral concurrency slot until it ends.
+    """
+    mistral_api_key = mistral_api_key or os.environ.get("MISTRAL_API_KEY", "")
+    key = recipe_cache_key(prompt)
+    recipe = recipe_cache.get(key)
+    if recipe is not None:
+        yield recipe
+        return
+
+    with mistral_dependency.guard():
+        response = http_session().post(MISTRAL_API_URL,
+                                       headers=_request_headers(mistral_api_key),
+                                       json=_request_body(prompt, stream=True),
+                                       timeout=mistral_dependency.timeout,
+                                       stream=True)
+        try:
+            response.raise_for_status()
+            parts = []
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                delta = json.loads(data)['choices'][0].get('delta', {})
+                text = delta.get('content')
+                if text:
+                    parts.append(text)
+                    yield text
+            recipe_cache.set(key, ''.join(parts))
+        finally:
+            response.close()
+
+
+def _request_headers(mistral_api_key):
+    return {
         "Authorization": f"Bearer {mistral_api_key}",
         "Content-Type": "application/json"
     }
+
+
+def _request_body(prompt, stream=False):
     data = {
-        "model": "mistral-medium",
+        "model": MISTRAL_MODEL,
         "messages": [
             {
                 "role": "system",
@@ -20,10 +115,19 @@ def get_mistral_recipes(prompt, mistral_api_key="#api key
                 "content": f"Give me some easy recipes using items related to: {prompt}"
             }
         ],
-        "temperature": 0.7
+        "temperature": MISTRAL_TEMPERATURE
     }
+    if stream:
+        data["stream"] = True
+    return data
+
 
-    response = requests.post(url, headers=headers, json=data)
-    response.raise_for_status()
-    result = response.json()
-    return result['choices'][0]['message']['content']
+def _request_mistral_recipes(prompt, mistral_api_key):
+    with mistral_dependency.guard():
+        response = http_session().post(MISTRAL_API_URL,
+                                       headers=_request_headers(mistral_api_key),
+                                       json=_request_body(prompt),
+                                       timeout=mistral_dependency.timeout)
+        response.raise_for_status()
+        result = response.json()
+        return result['choices'][0]['message']['content']
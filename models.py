@@ -48,18 +48,47 @@ class Product(db.Model):
     
     id = db.Column(db.String(50), primary_key=True)  # Product ID from catalog
     name = db.Column(db.String(255), nullable=False)
-    price = db.Column(db.Numeric(10, 2), nullable=False)
+    price = db.Column(db.Numeric(10, 2), nullable=False, index=True)
     category = db.Column(db.String(50), nullable=False)
     tags = db.Column(db.Text)  # JSON string of tags array
     description = db.Column(db.Text)
     image_url = db.Column(db.String(500))
-    in_stock = db.Column(db.Boolean, default=True)
+    in_stock = db.Column(db.Boolean, default=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Indexed so the catalog snapshot can cheaply poll max(updated_at)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           index=True)
+    
+    # Category pages are paginated by id, so (category, id) lets a page be
+    # read as a single index range scan
+    __table_args__ = (db.Index('ix_products_category_id', 'category', 'id'),)
     
     def __repr__(self):
         return f'<Product {self.name}>'
 
+class Tag(db.Model):
+    """Normalized product tag"""
+    __tablename__ = 'tags'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<Tag {self.name}>'
+
+class ProductTag(db.Model):
+    """Product-to-tag membership, derived from Product.tags"""
+    __tablename__ = 'product_tags'
+    
+    # Primary key leads with tag_id so "products with tag X" is a range scan
+    tag_id = db.Column(db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+    product_id = db.Column(db.String(50), db.ForeignKey('products.id'), primary_key=True)
+    
+    __table_args__ = (db.Index('ix_product_tags_product_id', 'product_id'),)
+    
+    def __repr__(self):
+        return f'<ProductTag {self.product_id}: {self.tag_id}>'
+
 class CartItem(db.Model):
     """Personal cart items"""
     __tablename__ = 'cart_items'
@@ -85,6 +114,7 @@ class SharedCartSession(db.Model):
     created_by_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    revision = db.Column(db.Integer, default=0, nullable=False)  # Revision of the latest change event
     
     # Relationships
     created_by = db.relationship('User', backref='hosted_carts')
@@ -102,15 +132,73 @@ class SharedCartItem(db.Model):
     product_id = db.Column(db.String(50), db.ForeignKey('products.id'), nullable=False)
     added_by_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     quantity = db.Column(db.Integer, default=1, nullable=False)
+    unit_price = db.Column(db.Numeric(10, 2), nullable=False)  # Product price when first added; totals charge this
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     product = db.relationship('Product', backref='shared_cart_items')
     added_by = db.relationship('User', backref='shared_cart_contributions')
     
+    # One row per product per contributor; repeat adds merge into quantity.
+    # A unique index rather than a constraint so it can be added to an
+    # existing table.
+    __table_args__ = (db.Index('uq_shared_cart_items_session_product_user',
+                               'session_id', 'product_id', 'added_by_user_id', unique=True),)
+    
     def __repr__(self):
         return f'<SharedCartItem {self.product_id} in {self.session_id}>'
 
+class SharedCartTotal(db.Model):
+    """Materialized bill-split totals per contributor of a shared cart session"""
+    __tablename__ = 'shared_cart_totals'
+    
+    session_id = db.Column(db.String(8), db.ForeignKey('shared_cart_sessions.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    item_count = db.Column(db.Integer, default=0, nullable=False)
+    quantity = db.Column(db.Integer, default=0, nullable=False)
+    amount = db.Column(db.Numeric(12, 2), default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SharedCartTotal {self.session_id}/{self.user_id}: {self.amount}>'
+
+class SharedCartEvent(db.Model):
+    """Append-only change feed of shared cart sessions"""
+    __tablename__ = 'shared_cart_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(8), db.ForeignKey('shared_cart_sessions.id'), nullable=False)
+    revision = db.Column(db.Integer, nullable=False)  # 1, 2, ... per session, in commit order
+    event_type = db.Column(db.String(32), nullable=False)  # item_added, item_removed, quantity_changed
+    payload = db.Column(db.Text, nullable=False)  # JSON string of event data
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Subscribers read "events of this session after revision N"
+    __table_args__ = (db.Index('uq_shared_cart_events_session_revision',
+                               'session_id', 'revision', unique=True),)
+    
+    def __repr__(self):
+        return f'<SharedCartEvent {self.revision} {self.event_type} in {self.session_id}>'
+
+class RecipeJob(db.Model):
+    """Recipe generation run off the request thread; polled by job id"""
+    __tablename__ = 'recipe_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    cache_key = db.Column(db.String(64), nullable=False)  # sha256 of normalized prompt and model params
+    prompt = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(16), nullable=False)  # pending, running, done, failed
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    # Identical requests from any worker find the newest job for their key
+    __table_args__ = (db.Index('ix_recipe_jobs_cache_key_created_at', 'cache_key', 'created_at'),)
+    
+    def __repr__(self):
+        return f'<RecipeJob {self.id} {self.status}>'
+
 class RecommendationLog(db.Model):
     """Log of recommendation requests for analytics"""
     __tablename__ = 'recommendation_logs'
@@ -120,10 +208,38 @@ class RecommendationLog(db.Model):
     search_prompt = db.Column(db.String(255), nullable=False)
     budget_amount = db.Column(db.Numeric(10, 2))
     results_count = db.Column(db.Integer, default=0)
+    latency_ms = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship
     user = db.relationship('User', backref='recommendation_logs')
     
     def __repr__(self):
-        return f'<RecommendationLog "{self.search_prompt}" -> {self.results_count} results>'
\ No newline at end of file
+        return f'<RecommendationLog "{self.search_prompt}" -> {self.results_count} results>'
+
+class SearchRollup(db.Model):
+    """Recommendation searches pre-aggregated per time bucket, normalized
+    prompt and budget band; maintained from recommendation_logs"""
+    __tablename__ = 'search_rollups'
+    
+    granularity = db.Column(db.String(8), primary_key=True)  # hour, day
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    prompt = db.Column(db.String(255), primary_key=True)
+    budget_band = db.Column(db.Integer, primary_key=True)  # see search_analytics.BUDGET_BAND_EDGES
+    searches = db.Column(db.Integer, default=0, nullable=False)
+    zero_results = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SearchRollup {self.granularity} {self.bucket_start} "{self.prompt}": {self.searches}>'
+
+class RollupWatermark(db.Model):
+    """Highest source row id already folded into a rollup"""
+    __tablename__ = 'rollup_watermarks'
+    
+    name = db.Column(db.String(64), primary_key=True)
+    last_id = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<RollupWatermark {self.name}: {self.last_id}>'
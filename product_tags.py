@@ -0,0 +1,116 @@
+import logging
+
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from catalog_index import normalize_tag, parse_tags
+from db_utils import dialect_insert
+from models import db, Product, ProductTag, Tag
+
+# Ids per IN list when syncing product_tags
+SYNC_CHUNK_SIZE = 500
+
+
+def product_tag_names(raw_tags):
+    """Distinct normalized tag names of a Product.tags JSON value"""
+    return {name for name in map(normalize_tag, parse_tags(raw_tags)) if name}
+
+
+def _replace_product_tags(connection, tags_by_product):
+    """Rewrite the product_tags rows of the given products"""
+    product_ids = list(tags_by_product)
+    for start in range(0, len(product_ids), SYNC_CHUNK_SIZE):
+        connection.execute(delete(ProductTag).where(
+            ProductTag.product_id.in_(product_ids[start:start + SYNC_CHUNK_SIZE])))
+
+    names = sorted(set().union(*tags_by_product.values()))
+    if not names:
+        return
+    connection.execute(
+        dialect_insert(Tag).on_conflict_do_nothing(index_elements=['name']),
+        [{'name': name} for name in names])
+
+    tag_ids = {}
+    for start in range(0, len(names), SYNC_CHUNK_SIZE):
+        tag_ids.update(connection.execute(
+            select(Tag.name, Tag.id).where(
+                Tag.name.in_(names[start:start + SYNC_CHUNK_SIZE]))).all())
+
+    rows = [{'tag_id': tag_ids[name], 'product_id': product_id}
+            for product_id, product_names in tags_by_product.items()
+            for name in product_names]
+    if rows:
+        connection.execute(dialect_insert(ProductTag).on_conflict_do_nothing(), rows)
+
+
+def backfill_product_tags(batch_size=1000):
+    """Rebuild tags and product_tags from the Product.tags JSON column.
+
+    Products are read in id-keyed pages and the whole rebuild commits as
+    one transaction, so readers see either the old or the new membership.
+    Returns (products, links) written.
+    """
+    connection = db.session.connection()
+    connection.execute(delete(ProductTag))
+
+    products = 0
+    last_id = None
+    while True:
+        statement = select(Product.id, Product.tags).order_by(Product.id).limit(batch_size)
+        if last_id is not None:
+            statement = statement.where(Product.id > last_id)
+        rows = connection.execute(statement).all()
+        if not rows:
+            break
+        _replace_product_tags(connection, {
+            product_id: product_tag_names(raw_tags) for product_id, raw_tags in rows
+        })
+        products += len(rows)
+        last_id = rows[-1][0]
+
+    links = connection.execute(select(func.count()).select_from(ProductTag)).scalar()
+    db.session.commit()
+    logging.info(f"Backfilled {links} tag links for {products} products")
+    return products, links
+
+
+def tagged_product_ids(names, match_all=True):
+    """SELECT of ids of products carrying all (or any) of the tag names.
+
+    Served from the (tag_id, product_id) primary key, so the cost follows
+    the number of matching products rather than the catalog size.
+    """
+    names = sorted({normalize_tag(name) for name in names if normalize_tag(name)})
+    statement = select(ProductTag.product_id).join(
+        Tag, Tag.id == ProductTag.tag_id).where(Tag.name.in_(names))
+    if match_all and len(names) > 1:
+        statement = statement.group_by(ProductTag.product_id).having(
+            func.count() == len(names))
+    else:
+        statement = statement.distinct()
+    return statement
+
+
+# Keep product_tags in step with ORM writes to Product.tags. Memberships of
+# deleted products go before the products themselves (foreign keys); new
+# and changed products are linked after their rows exist.
+@event.listens_for(Session, 'before_flush')
+def _unlink_deleted_products(session, flush_context, instances):
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Product)]
+    if deleted:
+        session.connection().execute(
+            delete(ProductTag).where(ProductTag.product_id.in_(deleted)))
+
+
+@event.listens_for(Session, 'after_flush')
+def _link_changed_products(session, flush_context):
+    changed = {}
+    for obj in session.new:
+        if isinstance(obj, Product):
+            changed[obj.id] = product_tag_names(obj.tags)
+    for obj in session.dirty:
+        if isinstance(obj, Product) and \
+                inspect(obj).attrs.tags.history.has_changes():
+            changed[obj.id] = product_tag_names(obj.tags)
+    if changed:
+        _replace_product_tags(session.connection(), changed)
@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from mistral_recipe_bot import get_mistral_recipes, recipe_cache, recipe_cache_key
+from models import db, RecipeJob
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+EXPIRED = 'expired'
+
+
+class RecipeJobsBusy(Exception):
+    """Raised when the job queue of this process is full"""
+
+
+def recipe_job_dict(job, stale_after):
+    status = job.status
+    if status in (PENDING, RUNNING) and \
+            job.created_at < datetime.utcnow() - timedelta(seconds=stale_after):
+        # The worker that owned the job went away before finishing it
+        status = EXPIRED
+    data = {
+        'job_id': job.id,
+        'status': status,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if status == DONE:
+        data['recipe'] = job.result
+    elif status == FAILED:
+        data['error'] = job.error
+    return data
+
+
+class RecipeJobRunner:
+    """Runs recipe generations on a bounded pool off the request thread.
+
+    Jobs live in the recipe_jobs table so any gunicorn worker can answer a
+    poll for them. A request whose content address matches a recent
+    finished job, or one still in flight on any worker, gets that job back
+    instead of a new generation. At most `max_pending` jobs wait or run per
+    process; beyond that submit raises RecipeJobsBusy.
+    """
+
+    def __init__(self, workers=4, max_pending=32, result_ttl=6 * 3600,
+                 stale_after=120, poll_interval=0.5):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self._condition = threading.Condition()
+        self._pending = 0
+        self._executor = None
+        self._app = None
+        self._pruned_at = 0
+        self.submitted = 0
+        self.reused = 0
+        self.rejected = 0
+
+    def start(self, app):
+        with self._condition:
+            if self._executor is None:
+                self._app = app
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='recipe-job')
+
+    def cached_recipe(self, prompt):
+        """Recipe already generated for an equivalent prompt, or None"""
+        return recipe_cache.get(recipe_cache_key(prompt))
+
+    def _find_job(self, key):
+        now = datetime.utcnow()
+        job = RecipeJob.query.filter(
+            RecipeJob.cache_key == key,
+            RecipeJob.created_at >= now - timedelta(seconds=self.result_ttl),
+            RecipeJob.status != FAILED).order_by(
+                RecipeJob.created_at.desc()).first()
+        if job is None:
+            return None
+        if job.status == DONE:
+            return job
+        if job.created_at >= now - timedelta(seconds=self.stale_after):
+            return job
+        return None
+
+    def submit(self, prompt, api_key):
+        """Return the job answering this prompt, creating one if needed"""
+        key = recipe_cache_key(prompt)
+        job = self._find_job(key)
+        if job is not None:
+            with self._condition:
+                self.reused += 1
+            if job.status == DONE and recipe_cache.get(key) is None:
+                recipe_cache.set(key, job.result)
+            return job
+
+        with self._condition:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise RecipeJobsBusy()
+            self._pending += 1
+            self.submitted += 1
+
+        try:
+            job = RecipeJob(id=uuid.uuid4().hex, cache_key=key, prompt=prompt,
+                            status=PENDING)
+            db.session.add(job)
+            db.session.commit()
+            self._executor.submit(self._run, job.id, prompt, api_key)
+        except Exception:
+            with self._condition:
+                self._pending -= 1
+            raise
+
+        self._prune()
+        return job
+
+    def _run(self, job_id, prompt, api_key):
+        try:
+            with self._app.app_context():
+                job = db.session.get(RecipeJob, job_id)
+                job.status = RUNNING
+                db.session.commit()
+                try:
+                    job.result = get_mistral_recipes(prompt, api_key)
+                    job.status = DONE
+                except Exception as e:
+                    logging.error(f"Recipe job {job_id} failed: {str(e)}")
+                    job.error = str(e)
+                    job.status = FAILED
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+        except Exception as e:
+            logging.error(f"Recipe job {job_id} could not be recorded: {str(e)}")
+        finally:
+            with self._condition:
+                self._pending -= 1
+                self._condition.notify_all()
+
+    def wait(self, job_id, timeout):
+        """Read a job, blocking up to `timeout` seconds while it is unfinished.
+
+        Jobs of this process wake the waiter as soon as they finish; jobs of
+        other workers are re-read every poll interval.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = db.session.get(RecipeJob, job_id, populate_existing=True)
+            remaining = deadline - time.monotonic()
+            if job is None or job.status in (DONE, FAILED) or remaining <= 0:
+                return job
+            # Do not hold a transaction open while sleeping
+            db.session.rollback()
+            with self._condition:
+                self._condition.wait(min(self.poll_interval, remaining))
+
+    def _prune(self):
+        if time.monotonic() - self._pruned_at < 60:
+            return
+        self._pruned_at = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.result_ttl)
+        try:
+            RecipeJob.query.filter(RecipeJob.created_at < cutoff).delete()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Pruning recipe jobs failed: {str(e)}")
+
+    def stats(self):
+        with self._condition:
+            return {
+                'workers': self.workers,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'submitted': self.submitted,
+                'reused': self.reused,
+                'rejected': self.rejected,
+            }
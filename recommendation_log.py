@@ -0,0 +1,137 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from models import db, RecommendationLog
+
+_STOP = object()
+
+
+class RecommendationLogWriter:
+    """Non-blocking analytics pipeline for /api/recommend.
+
+    Requests only append a row to a bounded in-memory queue; a background
+    thread bulk-inserts rows into recommendation_logs once `batch_size` are
+    waiting or `flush_interval` seconds have passed. When the queue is full
+    new rows are dropped and counted rather than slowing the request down.
+    Pending rows are flushed when the process exits.
+    """
+
+    def __init__(self, max_queue=10000, batch_size=500, flush_interval=2.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._app = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self, app):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run,
+                                            name='recommendation-log-writer',
+                                            daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def log(self, prompt, budget, results_count, latency_ms, user_id=None):
+        """Queue one search for writing; never blocks"""
+        row = {
+            'user_id': user_id,
+            'search_prompt': prompt[:255],
+            'budget_amount': budget,
+            'results_count': results_count,
+            'latency_ms': latency_ms,
+            'created_at': datetime.utcnow(),
+        }
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            if stopping:
+                # Drain whatever was queued before the stop marker
+                while True:
+                    try:
+                        row = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if row is not _STOP:
+                        batch.append(row)
+            for start in range(0, len(batch), self.batch_size):
+                self._flush(batch[start:start + self.batch_size])
+
+    def _flush(self, rows):
+        try:
+            with self._app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(insert(RecommendationLog), rows)
+        except Exception as e:
+            logging.error(f"Writing {len(rows)} recommendation logs failed: {str(e)}")
+            with self._lock:
+                self.failed += len(rows)
+            return
+        with self._lock:
+            self.written += len(rows)
+            self.batches += 1
+
+    def stop(self, timeout=5):
+        """Flush queued rows and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        try:
+            # Waits only while the queue is full and the writer makes room
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logging.warning("Recommendation log writer did not drain before shutdown")
+            return
+        thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'max_queue': self._queue.maxsize,
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'written': self.written,
+                'failed': self.failed,
+                'batches': self.batches,
+            }
@@ -0,0 +1,210 @@
+import logging
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_dependencies = {}
+
+
+class DependencyUnavailable(Exception):
+    """Raised without calling upstream when the breaker is open or the
+    dependency's concurrency limit is reached"""
+
+    def __init__(self, name, reason):
+        super().__init__(f"{name} unavailable: {reason}")
+        self.name = name
+        self.reason = reason
+
+
+class UpstreamError(Exception):
+    """An upstream answer that should count against the breaker"""
+
+
+def raise_for_upstream_error(response):
+    """Raise UpstreamError for throttling and server errors; other status
+    codes are left to the caller"""
+    if response.status_code == 429 or response.status_code >= 500:
+        raise UpstreamError(f"{response.status_code} from {response.url}")
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with half-open probing.
+
+    After `failure_threshold` failures in a row the breaker opens and calls
+    are rejected for `reset_timeout` seconds. It then lets `half_open_calls`
+    probes through: a success closes it, a failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, half_open_calls=1,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._probes = 0
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def allow(self):
+        """Whether a call may go upstream now; reserves a probe when half-open"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            state = self._current_state()
+            if state == HALF_OPEN or (state == CLOSED and
+                                      self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self.opened += 1
+                return True
+            return False
+
+    def release_probe(self):
+        """Give back a half-open probe whose call ended without a verdict"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._current_state(),
+                'consecutive_failures': self._failures,
+                'opened': self.opened,
+            }
+
+
+class Dependency:
+    """Timeouts, a circuit breaker and a bulkhead for one upstream service.
+
+    At most `max_concurrent` calls run at once per process; further callers
+    wait up to `max_wait` seconds for a slot and are then rejected, as are
+    all callers while the breaker is open. Rejections raise
+    DependencyUnavailable immediately so routes can answer with a fallback
+    instead of blocking a worker on a degraded upstream.
+    """
+
+    def __init__(self, name, timeout, max_concurrent=10, max_wait=0,
+                 breaker=None):
+        self.name = name
+        self.timeout = timeout
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected_open = 0
+        self.rejected_full = 0
+        _dependencies[name] = self
+
+    def _count(self, counter, delta=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + delta)
+
+    def available(self):
+        """Cheap pre-check for routes: False while the breaker is open"""
+        return self.breaker.state != OPEN
+
+    def guard(self):
+        """Context manager admitting one call; exceptions inside it count as
+        failures, GeneratorExit (an abandoned stream) does not"""
+        return _Guard(self)
+
+    def call(self, fn, *args, **kwargs):
+        with self.guard():
+            return fn(*args, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.breaker.stats(), **{
+                'max_concurrent': self.max_concurrent,
+                'in_flight': self.in_flight,
+                'calls': self.calls,
+                'successes': self.successes,
+                'failures': self.failures,
+                'rejected_open': self.rejected_open,
+                'rejected_full': self.rejected_full,
+            })
+
+
+class _Guard:
+    __slots__ = ('dependency',)
+
+    def __init__(self, dependency):
+        self.dependency = dependency
+
+    def __enter__(self):
+        dependency = self.dependency
+        if dependency.max_wait:
+            admitted = dependency._slots.acquire(timeout=dependency.max_wait)
+        else:
+            admitted = dependency._slots.acquire(blocking=False)
+        if not admitted:
+            dependency._count('rejected_full')
+            raise DependencyUnavailable(dependency.name, 'too many concurrent calls')
+        if not dependency.breaker.allow():
+            dependency._slots.release()
+            dependency._count('rejected_open')
+            raise DependencyUnavailable(dependency.name, 'circuit open')
+        with dependency._lock:
+            dependency.in_flight += 1
+            dependency.calls += 1
+        return dependency
+
+    def __exit__(self, exc_type, exc, tb):
+        dependency = self.dependency
+        try:
+            if exc_type is None:
+                dependency._count('successes')
+                dependency.breaker.record_success()
+            elif issubclass(exc_type, Exception):
+                dependency._count('failures')
+                if dependency.breaker.record_failure():
+                    logging.warning(f"Circuit for {dependency.name} opened after: {exc}")
+            else:
+                dependency.breaker.release_probe()
+        finally:
+            with dependency._lock:
+                dependency.in_flight -= 1
+            dependency._slots.release()
+        return False
+
+
+def dependency_stats():
+    """Breaker state and call/rejection counters of every dependency"""
+    return {name: dependency.stats() for name, dependency in _dependencies.items()}
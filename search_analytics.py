@@ -0,0 +1,201 @@
+import logging
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, update
+
+from db_utils import dialect_insert
+from models import db, RecommendationLog, RollupWatermark, SearchRollup
+
+HOUR = 'hour'
+DAY = 'day'
+GRANULARITIES = (HOUR, DAY)
+
+WATERMARK = 'search_rollups'
+
+# Upper bounds (rupees) of the budget histogram bands; band 0 is "no
+# budget", band i covers [edge[i-2], edge[i-1]) and the last band is open
+BUDGET_BAND_EDGES = (100, 250, 500, 1000, 2500, 5000)
+
+# Rows newer than this are left for the next run, so rows still being
+# committed by other workers are never skipped over
+COMPACTION_LAG = timedelta(seconds=60)
+
+
+def normalize_prompt(prompt):
+    return ' '.join((prompt or '').lower().split())[:255]
+
+
+def budget_band(budget):
+    if not budget or budget <= 0:
+        return 0
+    return 1 + bisect_right(BUDGET_BAND_EDGES, float(budget))
+
+
+def budget_band_label(band):
+    if band == 0:
+        return 'none'
+    if band == 1:
+        return f'<{BUDGET_BAND_EDGES[0]}'
+    if band > len(BUDGET_BAND_EDGES):
+        return f'{BUDGET_BAND_EDGES[-1]}+'
+    return f'{BUDGET_BAND_EDGES[band - 2]}-{BUDGET_BAND_EDGES[band - 1]}'
+
+
+def bucket_start(moment, granularity):
+    if granularity == HOUR:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _watermark():
+    watermark = db.session.get(RollupWatermark, WATERMARK)
+    if watermark is None:
+        watermark = RollupWatermark(name=WATERMARK, last_id=0)
+        db.session.add(watermark)
+        db.session.commit()
+    return watermark.last_id
+
+
+def _fold(rows):
+    counts = defaultdict(lambda: [0, 0])
+    for prompt, budget, results_count, created_at in rows:
+        prompt = normalize_prompt(prompt)
+        band = budget_band(budget)
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(created_at, granularity), prompt, band)
+            counts[key][0] += 1
+            if not results_count:
+                counts[key][1] += 1
+    return [{
+        'granularity': granularity,
+        'bucket_start': start,
+        'prompt': prompt,
+        'budget_band': band,
+        'searches': searches,
+        'zero_results': zero_results,
+    } for (granularity, start, prompt, band), (searches, zero_results) in counts.items()]
+
+
+def compact_search_logs(batch_size=10000, now=None):
+    """Fold new recommendation_logs rows into the hourly and daily rollups.
+
+    Rows are taken in id order after the watermark, up to the first one
+    younger than COMPACTION_LAG. Each batch increments the rollups and
+    advances the watermark in one transaction, and the watermark only moves
+    if no other run moved it first, so every row is counted exactly once.
+    Returns the number of rows folded.
+    """
+    cutoff = (now or datetime.utcnow()) - COMPACTION_LAG
+    folded = 0
+    while True:
+        last_id = _watermark()
+        rows = db.session.query(
+            RecommendationLog.id, RecommendationLog.search_prompt,
+            RecommendationLog.budget_amount, RecommendationLog.results_count,
+            RecommendationLog.created_at).filter(
+                RecommendationLog.id > last_id).order_by(
+                    RecommendationLog.id).limit(batch_size).all()
+
+        settled = []
+        for row in rows:
+            if row.created_at >= cutoff:
+                break
+            settled.append(row)
+        if not settled:
+            db.session.rollback()
+            return folded
+
+        insert = dialect_insert(SearchRollup)
+        db.session.execute(insert.on_conflict_do_update(
+            index_elements=['granularity', 'bucket_start', 'prompt', 'budget_band'],
+            set_={
+                'searches': SearchRollup.searches + insert.excluded.searches,
+                'zero_results': SearchRollup.zero_results + insert.excluded.zero_results,
+                'updated_at': func.now(),
+            }), _fold(row[1:] for row in settled))
+
+        moved = db.session.execute(
+            update(RollupWatermark).where(
+                RollupWatermark.name == WATERMARK,
+                RollupWatermark.last_id == last_id).values(
+                    last_id=settled[-1].id, updated_at=func.now())).rowcount
+        if moved != 1:
+            db.session.rollback()
+            logging.warning("Search rollup watermark moved concurrently; stopping")
+            return folded
+
+        db.session.commit()
+        folded += len(settled)
+        if len(settled) < len(rows) or len(rows) < batch_size:
+            return folded
+
+
+def prune_search_logs(raw_days=30, hourly_days=90, now=None):
+    """Delete raw logs already folded into the rollups and older than
+    raw_days, and hourly rollups older than hourly_days (daily rollups are
+    kept). Returns (raw rows deleted, hourly rollups deleted)."""
+    now = now or datetime.utcnow()
+    last_id = _watermark()
+    raw = RecommendationLog.query.filter(
+        RecommendationLog.id <= last_id,
+        RecommendationLog.created_at < now - timedelta(days=raw_days)).delete(
+            synchronize_session=False)
+    hourly = SearchRollup.query.filter(
+        SearchRollup.granularity == HOUR,
+        SearchRollup.bucket_start < now - timedelta(days=hourly_days)).delete(
+            synchronize_session=False)
+    db.session.commit()
+    return raw, hourly
+
+
+def search_analytics(start, end, granularity=DAY, limit=20):
+    """Dashboard figures for [start, end) read from the rollups only"""
+    in_range = (SearchRollup.granularity == granularity,
+                SearchRollup.bucket_start >= bucket_start(start, granularity),
+                SearchRollup.bucket_start < end)
+    searches = func.sum(SearchRollup.searches)
+    zero_results = func.sum(SearchRollup.zero_results)
+
+    top_prompts = db.session.query(
+        SearchRollup.prompt, searches, zero_results).filter(*in_range).group_by(
+            SearchRollup.prompt).order_by(searches.desc(), SearchRollup.prompt).limit(limit)
+
+    zero_result_prompts = db.session.query(
+        SearchRollup.prompt, zero_results).filter(
+            *in_range, SearchRollup.zero_results > 0).group_by(
+                SearchRollup.prompt).order_by(
+                    zero_results.desc(), SearchRollup.prompt).limit(limit)
+
+    bands = dict(db.session.query(SearchRollup.budget_band, searches).filter(
+        *in_range).group_by(SearchRollup.budget_band).all())
+
+    timeline = db.session.query(
+        SearchRollup.bucket_start, searches, zero_results).filter(
+            *in_range).group_by(SearchRollup.bucket_start).order_by(
+                SearchRollup.bucket_start).all()
+
+    return {
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'total_searches': sum(row[1] for row in timeline),
+        'zero_result_searches': sum(row[2] for row in timeline),
+        'top_prompts': [
+            {'prompt': prompt, 'searches': count, 'zero_results': zero}
+            for prompt, count, zero in top_prompts
+        ],
+        'zero_result_prompts': [
+            {'prompt': prompt, 'searches': count}
+            for prompt, count in zero_result_prompts
+        ],
+        'budget_distribution': [
+            {'band': budget_band_label(band), 'searches': bands.get(band, 0)}
+            for band in range(len(BUDGET_BAND_EDGES) + 2)
+        ],
+        'timeline': [
+            {'bucket_start': moment.isoformat(), 'searches': count, 'zero_results': zero}
+            for moment, count, zero in timeline
+        ],
+    }
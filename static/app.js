@@ -23,6 +23,8 @@ let currentBudget = 0;
 let personalCart = [];
 let sharedCart = [];
 let currentSharedSession = null;
+let sharedCartState = null;
+let sharedCartEvents = null;
 let allProducts = [];
 let filteredProducts = [];
 
@@ -65,6 +67,7 @@ function setupEventListeners() {
 
     // Recommendation handlers
     document.getElementById('getRecommendationsBtn').addEventListener('click', getRecommendations);
+    document.getElementById('recommendationPrompt').addEventListener('input', suggestPrompts);
 
     // Shared cart handlers
     document.getElementById('createSharedCartBtn').addEventListener('click', createSharedCart);
@@ -376,6 +379,43 @@ async function getRecommendations() {
     }
 }
 
+// Type-ahead for the recommendation prompt: asks /api/suggest after a
+// short pause in typing and cancels requests for superseded keystrokes
+let suggestTimer = null;
+let suggestController = null;
+
+function suggestPrompts() {
+    clearTimeout(suggestTimer);
+    suggestTimer = setTimeout(async () => {
+        const query = document.getElementById('recommendationPrompt').value;
+        const list = document.getElementById('recommendationSuggestions');
+        if (suggestController) {
+            suggestController.abort();
+        }
+        if (!query.trim()) {
+            list.replaceChildren();
+            return;
+        }
+
+        suggestController = new AbortController();
+        try {
+            const response = await fetch('/api/suggest?q=' + encodeURIComponent(query), {
+                signal: suggestController.signal
+            });
+            const data = await response.json();
+            list.replaceChildren(...(data.suggestions || []).map(suggestion => {
+                const option = document.createElement('option');
+                option.value = suggestion.text;
+                return option;
+            }));
+        } catch (error) {
+            if (error.name !== 'AbortError') {
+                console.error('Error loading suggestions:', error);
+            }
+        }
+    }, 120);
+}
+
 function displayRecommendations(products) {
     const container = document.getElementById('recommendationsResults');
 
@@ -584,10 +624,40 @@ function showAlert(message, type) {
     }, 5000);
 }
 
-// Product image loading functionality with better error handling
+// Resolve every product image still missing a source in one batch request
+// Matches MAX_IMAGE_BATCH_QUERIES on the server
+const IMAGE_BATCH_SIZE = 60;
+
 async function loadProductImages() {
-    // You can actually remove this entire function since we're handling images directly
-// in the templates with the onerror handler
+    const images = [...document.querySelectorAll('img.product-image')]
+        .filter(img => !img.getAttribute('src') && img.dataset.product);
+    if (images.length === 0) return;
+
+    // Send the names in server-sized batches and fill each batch's images
+    // as soon as it resolves
+    const names = [...new Set(images.map(img => img.dataset.product))];
+    for (let start = 0; start < names.length; start += IMAGE_BATCH_SIZE) {
+        const queries = names.slice(start, start + IMAGE_BATCH_SIZE);
+        let resolved = {};
+        try {
+            const response = await fetch('/walmart-image/batch', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ queries })
+            });
+            const data = await response.json();
+            resolved = data.images || {};
+        } catch (error) {
+            console.error('Failed to load product images:', error);
+        }
+
+        const batch = new Set(queries);
+        images.filter(img => batch.has(img.dataset.product)).forEach(img => {
+            img.src = resolved[img.dataset.product] || createPlaceholderImage(img.dataset.product);
+        });
+    }
 }
 
 // Create a better placeholder image with product info
@@ -675,7 +745,9 @@ async function joinSharedCart() {
 }
 
 function leaveSharedCart() {
+    unsubscribeFromSharedCart();
     currentSharedSession = null;
+    sharedCartState = null;
     updateSharedSessionUI();
 
     // Clear shared cart display
@@ -712,13 +784,62 @@ async function loadSharedCartItems() {
         const data = await response.json();
 
         if (data.success) {
+            sharedCartState = data;
             updateSharedCartDisplay(data);
+            subscribeToSharedCart(data.revision);
         }
     } catch (error) {
         console.error('Failed to load shared cart items:', error);
     }
 }
 
+// Apply item changes pushed by the server instead of reloading the cart
+function subscribeToSharedCart(revision) {
+    unsubscribeFromSharedCart();
+    if (!currentSharedSession || !window.EventSource) return;
+
+    sharedCartEvents = new EventSource(
+        `/api/shared-cart/${currentSharedSession.id}/events?since=${revision}`);
+    ['item_added', 'item_removed', 'quantity_changed'].forEach(type => {
+        sharedCartEvents.addEventListener(type, (e) => {
+            applySharedCartEvent(JSON.parse(e.data));
+        });
+    });
+}
+
+function unsubscribeFromSharedCart() {
+    if (sharedCartEvents) {
+        sharedCartEvents.close();
+        sharedCartEvents = null;
+    }
+}
+
+function applySharedCartEvent(event) {
+    if (!sharedCartState || event.revision <= sharedCartState.revision) return;
+
+    const items = sharedCartState.items;
+    if (event.type === 'item_added') {
+        items.push(event.data);
+    } else if (event.type === 'item_removed') {
+        sharedCartState.items = items.filter(item => item.id !== event.data.id);
+    } else if (event.type === 'quantity_changed') {
+        const item = items.find(item => item.id === event.data.id);
+        if (item) item.quantity = event.data.quantity;
+    }
+
+    sharedCartState.user_totals = {};
+    sharedCartState.grand_total = 0;
+    sharedCartState.items.forEach(item => {
+        const amount = item.unit_price * item.quantity;
+        sharedCartState.user_totals[item.added_by] =
+            (sharedCartState.user_totals[item.added_by] || 0) + amount;
+        sharedCartState.grand_total += amount;
+    });
+    sharedCartState.revision = event.revision;
+
+    updateSharedCartDisplay(sharedCartState);
+}
+
 async function addToSharedCartSession(product) {
     if (!currentSharedSession) {
         showAlert('Please join a shared cart session first', 'warning');
@@ -741,7 +862,8 @@ async function addToSharedCartSession(product) {
         const data = await response.json();
 
         if (data.success) {
-            loadSharedCartItems();
+            // The event stream delivers the new item; reload only without it
+            if (!sharedCartEvents) loadSharedCartItems();
             showAlert('Item added to shared cart!', 'success');
         } else {
             showAlert(data.error || 'Failed to add to shared cart', 'danger');
@@ -781,7 +903,7 @@ function updateSharedCartDisplay(data) {
 
     // Display items grouped by user
     container.innerHTML = Object.entries(itemsByUser).map(([userEmail, items]) => {
-        const userTotal = items.reduce((sum, item) => sum + item.product.price * item.quantity, 0);
+        const userTotal = items.reduce((sum, item) => sum + item.unit_price * item.quantity, 0);
         const isOverBudget = userTotal > 2000; // Budget threshold in rupees
 
         return `
@@ -805,7 +927,7 @@ function updateSharedCartDisplay(data) {
                                     <small class="text-muted">${item.product.tags.join(', ')}</small>
                                 </div>
                             </div>
-                            <span class="fw-bold text-success">₹${Math.round(item.product.price)} x${item.quantity}</span>
+                            <span class="fw-bold text-success">₹${Math.round(item.unit_price)} x${item.quantity}</span>
                         </div>
                     `).join('')}
                 </div>
@@ -991,37 +1113,6 @@ document.getElementById("filterNutritionBtn")?.addEventListener("click", () => {
   });
 });
 
-// 🔍 Smart Search Recommendations
-document.getElementById("getRecommendationsBtn")?.addEventListener("click", () => {
-  const prompt = document.getElementById("recommendationPrompt").value.trim().toLowerCase();
-  const resultsContainer = document.getElementById("recommendationsResults");
-  resultsContainer.innerHTML = "<p class='text-muted'>Fetching recommendations...</p>";
-
-  fetch("/recommend-smart", {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ keyword: prompt })
-  })
-  .then(res => res.json())
-  .then(products => {
-    resultsContainer.innerHTML = "";
-    if (products.length === 0) {
-      resultsContainer.innerHTML = "<p class='text-danger'>No smart recommendations found for '" + prompt + "'</p>";
-    } else {
-      products.forEach(product => {
-        const card = document.createElement("div");
-        card.className = "card mb-2 p-2";
-        card.innerHTML = `
-          <h6>${product.name}</h6>
-          <p>₹${product.price}</p>
-          <small>${product.category}</small>
-        `;
-        resultsContainer.appendChild(card);
-      });
-    }
-  });
-});
-
 // 🥦 Nutrition Filter (NutriBasket)
 document.getElementById("filterNutritionBtn")?.addEventListener("click", () => {
   const preferences = [];
@@ -1039,7 +1130,8 @@ document.getElementById("filterNutritionBtn")?.addEventListener("click", () => {
     body: JSON.stringify({ preferences })
   })
   .then(res => res.json())
-  .then(products => {
+  .then(data => {
+    const products = data.products || [];
     resultsContainer.innerHTML = "";
     if (products.length === 0) {
       resultsContainer.innerHTML = "<p class='text-danger'>No matching nutrition-based products found.</p>";
@@ -1057,6 +1149,94 @@ document.getElementById("filterNutritionBtn")?.addEventListener("click", () => {
     }
   });
 });
+// Ask the recipe bot; a 202 means the recipe is still being generated,
+// so long-poll its job until it finishes
+async function fetchRecipe(prompt) {
+    const response = await fetch('/api/recipe-bot', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ prompt })
+    });
+    let data = await response.json();
+    if (response.status !== 202) {
+        return data;
+    }
+
+    while (data.status === 'pending' || data.status === 'running') {
+        const poll = await fetch(`${data.status_url}?wait=25`);
+        data = await poll.json();
+        if (!poll.ok) {
+            return data;
+        }
+    }
+    if (data.status === 'done') {
+        return { success: true, recipe: data.recipe };
+    }
+    return { error: data.error || 'Recipe generation timed out' };
+}
+
+// Stream a recipe from the bot's SSE relay, calling onText with the text
+// so far after every chunk. Aborting the signal cancels the request, which
+// also stops the upstream generation.
+async function streamRecipe(prompt, onText, signal) {
+    const response = await fetch('/api/recipe-bot/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ prompt }),
+        signal
+    });
+    if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.error || 'Failed to get recipe');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let recipe = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            return recipe;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+
+            if (event === 'chunk') {
+                recipe += JSON.parse(data).text;
+                onText(recipe);
+            } else if (event === 'error') {
+                throw new Error(JSON.parse(data).error);
+            } else if (event === 'done') {
+                return recipe;
+            }
+        }
+    }
+}
+
+// Format a recipe with line breaks and bold headings
+function formatRecipe(recipe) {
+    return recipe
+        .replace(/\n\n/g, '\n')
+        .replace(/\n/g, '<br>')
+        .replace(/(Ingredients:|Method:|Instructions:|Steps:)/g, '<strong>$1</strong>');
+}
+
 document.addEventListener('DOMContentLoaded', function() {
     // Recipe Bot Functionality
     const recipeBotToggle = document.getElementById('recipeBotToggle');
@@ -1065,6 +1245,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const botSendBtn = document.getElementById('botSendBtn');
     const botPrompt = document.getElementById('botPrompt');
     const botRecipeOutput = document.getElementById('botRecipeOutput');
+    let recipeStream = null;
 
     // Toggle recipe bot visibility
     if (recipeBotToggle && recipeBotBox) {
@@ -1077,6 +1258,7 @@ document.addEventListener('DOMContentLoaded', function() {
     if (closeRecipeBot && recipeBotBox) {
         closeRecipeBot.addEventListener('click', () => {
             recipeBotBox.classList.add('d-none');
+            if (recipeStream) recipeStream.abort();
         });
     }
 
@@ -1092,31 +1274,25 @@ document.addEventListener('DOMContentLoaded', function() {
             botRecipeOutput.innerHTML = '<div class="bot-typing">Thinking of delicious recipes...</div>';
             botSendBtn.disabled = true;
 
+            if (recipeStream) recipeStream.abort();
+            const controller = recipeStream = new AbortController();
+
             try {
-                const response = await fetch('/api/recipe-bot', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({ prompt })
-                });
-
-                const data = await response.json();
-                
-                if (data.success) {
-                    // Format the recipe with line breaks and bold headings
-                    const formattedRecipe = data.recipe
-                        .replace(/\n\n/g, '\n')
-                        .replace(/\n/g, '<br>')
-                        .replace(/(Ingredients:|Method:|Instructions:|Steps:)/g, '<strong>$1</strong>');
-                    
-                    botRecipeOutput.innerHTML = formattedRecipe;
-                } else {
-                    botRecipeOutput.innerHTML = `<div class="text-danger">Error: ${data.error || 'Failed to get recipe'}</div>`;
-                }
+                await streamRecipe(prompt, recipe => {
+                    botRecipeOutput.innerHTML = formatRecipe(recipe);
+                }, controller.signal);
             } catch (error) {
-                botRecipeOutput.innerHTML = `<div class="text-danger">Network error: ${error.message}</div>`;
+                if (error.name !== 'AbortError') {
+                    // Fall back to the buffered endpoint
+                    const data = await fetchRecipe(prompt).catch(e => ({ error: e.message }));
+                    if (data.success) {
+                        botRecipeOutput.innerHTML = formatRecipe(data.recipe);
+                    } else {
+                        botRecipeOutput.innerHTML = `<div class="text-danger">Error: ${data.error || 'Failed to get recipe'}</div>`;
+                    }
+                }
             } finally {
+                if (recipeStream === controller) recipeStream = null;
                 botSendBtn.disabled = false;
             }
         });
@@ -1151,13 +1327,14 @@ document.getElementById("getRecommendationsBtn").addEventListener("click", async
     });
 
     const data = await response.json();
+    const products = data.products || [];
 
-    if (data.length === 0) {
+    if (products.length === 0) {
       resultsDiv.innerHTML = "<p class='text-muted'>No recommendations found for your search.</p>";
       return;
     }
 
-    resultsDiv.innerHTML = data.map(p => `
+    resultsDiv.innerHTML = products.map(p => `
       <div class="card mb-2">
         <div class="card-body d-flex justify-content-between align-items-center">
           <div>
@@ -1178,29 +1355,12 @@ document.getElementById("getRecommendationsBtn").addEventListener("click", async
 
 
 
-// Floating Recipe Bot toggle and fetch
+// Floating Recipe Bot toggle
 document.getElementById("recipeBotToggle").addEventListener("click", () => {
   const box = document.getElementById("recipeBotBox");
   box.classList.toggle("d-none");
 });
 
-document.getElementById("botSendBtn").addEventListener("click", async () => {
-  const prompt = document.getElementById("botPrompt").value.trim();
-  const output = document.getElementById("botRecipeOutput");
-  output.innerHTML = "Loading...";
-  const res = await fetch("/api/recipe-bot", {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ prompt })
-  });
-  const data = await res.json();
-  if (data.success) {
-    output.innerHTML = data.recipe.replace(/\n/g, "<br>");
-  } else {
-    output.innerHTML = "⚠️ " + (data.error || "Failed to fetch.");
-  }
-});
-
 
 // Ensure the Recipe Bot Toggle works after DOM content is fully loaded
 document.addEventListener("DOMContentLoaded", () => {
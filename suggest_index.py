@@ -0,0 +1,265 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from catalog_index import catalog_index, normalize_tag
+from models import db, SearchRollup
+from search_analytics import DAY, bucket_start
+
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 20
+
+# Prefixes with more completions than this keep a precomputed top list;
+# rarer prefixes are answered by scanning their bisected range
+HEAVY_PREFIX = 64
+
+# Days of searches counted for popularity, and seconds between re-reads
+POPULARITY_DAYS = 30
+POPULARITY_REFRESH = 300
+
+# One past search weighs as much as this many products carrying the term
+SEARCH_WEIGHT = 5
+
+# Past prompts that are not catalog terms need this many searches (with
+# results) to be suggested themselves
+MIN_PROMPT_SEARCHES = 3
+
+
+def entry_terms(entry):
+    """Suggestable terms of a catalog entry: its name, category and tags"""
+    return ({normalize_tag(entry.name), normalize_tag(entry.category)} |
+            entry.tag_set) - {''}
+
+
+def _after(prefix):
+    """Smallest string sorting after every string that starts with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class _Completions:
+    """Sorted terms plus top lists of heavy prefixes for one set of
+    product and search counts"""
+
+    def __init__(self, products, searches):
+        self.products = products
+        self.searches = searches
+        self.terms = sorted(term for term in set(products) | set(searches)
+                            if self.listed(term))
+        self.top = {}
+        self._index_prefixes()
+
+    def rank(self, term):
+        return (-self.products.get(term, 0) - SEARCH_WEIGHT * self.searches.get(term, 0),
+                term)
+
+    def listed(self, term):
+        return (self.products.get(term, 0) > 0 or
+                self.searches.get(term, 0) >= MIN_PROMPT_SEARCHES)
+
+    def _range(self, prefix):
+        lo = bisect.bisect_left(self.terms, prefix)
+        return lo, bisect.bisect_left(self.terms, _after(prefix), lo)
+
+    def _best(self, lo, hi, limit=MAX_SUGGESTIONS):
+        return heapq.nsmallest(limit, self.terms[lo:hi], key=self.rank)
+
+    def _index_prefixes(self):
+        # Walk the implicit trie over the sorted list: each range shares a
+        # prefix of `depth` characters and splits by the next character
+        terms = self.terms
+        stack = [(0, len(terms), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= HEAVY_PREFIX:
+                continue
+            if depth:
+                self.top[terms[lo][:depth]] = self._best(lo, hi)
+            start = lo
+            while start < hi and len(terms[start]) == depth:
+                start += 1
+            while start < hi:
+                end = bisect.bisect_left(terms, _after(terms[start][:depth + 1]), start, hi)
+                stack.append((start, end, depth + 1))
+                start = end
+
+    def patch(self, term, delta):
+        """Apply a change in the number of products carrying a term"""
+        was_listed = self.listed(term)
+        old_rank = self.rank(term)
+        count = self.products.get(term, 0) + delta
+        if count > 0:
+            self.products[term] = count
+        else:
+            self.products.pop(term, None)
+        listed = self.listed(term)
+        rank = self.rank(term)
+
+        if listed and not was_listed:
+            bisect.insort(self.terms, term)
+        elif was_listed and not listed:
+            del self.terms[bisect.bisect_left(self.terms, term)]
+
+        for length in range(1, len(term) + 1):
+            prefix = term[:length]
+            top = self.top.get(prefix)
+            if top is None:
+                continue
+            if term in top:
+                top.remove(term)
+                # Every term outside the list ranks behind every term in
+                # it, so the term keeps its place unless it fell behind
+                # the rest of the list; then an outside term may replace it
+                if listed and (rank <= old_rank or (top and rank < self.rank(top[-1]))):
+                    bisect.insort(top, term, key=self.rank)
+                else:
+                    top[:] = self._best(*self._range(prefix))
+                continue
+            if listed and (len(top) < MAX_SUGGESTIONS or rank < self.rank(top[-1])):
+                bisect.insort(top, term, key=self.rank)
+                del top[MAX_SUGGESTIONS:]
+
+    def complete(self, prefix, limit):
+        top = self.top.get(prefix)
+        if top is not None:
+            return top[:limit]
+        return self._best(*self._range(prefix), limit)
+
+
+class SuggestionIndex:
+    """Type-ahead completions over product names, categories, tags and
+    popular past searches.
+
+    Terms live in one sorted list, so the completions of a prefix are the
+    contiguous range found by two bisects. Prefixes with more than
+    HEAVY_PREFIX completions also keep their best MAX_SUGGESTIONS terms,
+    so short, broad prefixes never scan their range. Terms are weighted by
+    how many in-stock products carry them plus recent searches for them,
+    read from the daily search rollups. Catalog patches update the counts, the sorted
+    list and the affected top lists in place; popularity reloads rebuild
+    everything off the request path and swap it in.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._completions = _Completions(Counter(), {})
+        self._journal = None
+        self._refreshing = False
+        self.popularity_loaded_at = None
+        self.rebuilds = 0
+        self.patches = 0
+
+    def catalog_built(self, entries):
+        products = Counter()
+        for entry in entries:
+            products.update(entry_terms(entry))
+        with self._rebuild_lock:
+            self._rebuild(products=products)
+
+    def catalog_changed(self, removed, added):
+        deltas = Counter()
+        for entry in removed:
+            deltas.subtract(entry_terms(entry))
+        for entry in added:
+            deltas.update(entry_terms(entry))
+        deltas = [(term, delta) for term, delta in deltas.items() if delta]
+        with self._lock:
+            for term, delta in deltas:
+                self._completions.patch(term, delta)
+            if self._journal is not None:
+                self._journal.extend(deltas)
+            self.patches += 1
+
+    def _rebuild(self, products=None, searches=None):
+        """Build new completions outside the lock and swap them in,
+        replaying catalog patches that arrived in the meantime"""
+        with self._lock:
+            self._journal = []
+            if products is None:
+                products = Counter(self._completions.products)
+            if searches is None:
+                searches = self._completions.searches
+        completions = _Completions(products, searches)
+        with self._lock:
+            for term, delta in self._journal:
+                completions.patch(term, delta)
+            self._journal = None
+            self._completions = completions
+            self.rebuilds += 1
+
+    def load_popularity(self):
+        """Re-read searches with results per normalized prompt from the
+        daily search rollups; needs an app context"""
+        since = bucket_start(datetime.utcnow() - timedelta(days=POPULARITY_DAYS), DAY)
+        with_results = func.sum(SearchRollup.searches - SearchRollup.zero_results)
+        rows = db.session.query(SearchRollup.prompt, with_results).filter(
+            SearchRollup.granularity == DAY,
+            SearchRollup.bucket_start >= since).group_by(
+                SearchRollup.prompt).having(with_results > 0).all()
+        searches = {prompt: int(count) for prompt, count in rows}
+        with self._rebuild_lock:
+            self._rebuild(searches=searches)
+        self.popularity_loaded_at = time.monotonic()
+
+    def refresh_if_stale(self, app):
+        """Reload popularity on a background thread once it is older than
+        POPULARITY_REFRESH seconds"""
+        with self._lock:
+            loaded = self.popularity_loaded_at
+            if self._refreshing or (loaded is not None and
+                                    time.monotonic() - loaded < POPULARITY_REFRESH):
+                return False
+            self._refreshing = True
+        threading.Thread(target=self._refresh, args=(app,),
+                         name='suggestion-popularity', daemon=True).start()
+        return True
+
+    def _refresh(self, app):
+        try:
+            with app.app_context():
+                self.load_popularity()
+        except Exception as e:
+            logging.error(f"Refreshing suggestion popularity failed: {str(e)}")
+            # Back off for a full interval before trying again
+            self.popularity_loaded_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def suggest(self, query, limit=DEFAULT_SUGGESTIONS):
+        """Best completions of a typed prefix, most popular first"""
+        prefix = normalize_tag(query)
+        if not prefix:
+            return []
+        if query[-1].isspace():
+            # "fresh " completes the next word, not "freshener"
+            prefix += ' '
+        with self._lock:
+            completions = self._completions
+            return [{
+                'text': term,
+                'products': completions.products.get(term, 0),
+                'searches': completions.searches.get(term, 0),
+            } for term in completions.complete(prefix, limit)]
+
+    def stats(self):
+        with self._lock:
+            loaded = self.popularity_loaded_at
+            return {
+                'terms': len(self._completions.terms),
+                'heavy_prefixes': len(self._completions.top),
+                'rebuilds': self.rebuilds,
+                'patches': self.patches,
+                'popularity_age_seconds': None if loaded is None
+                else round(time.monotonic() - loaded, 1),
+            }
+
+
+suggestion_index = SuggestionIndex()
+catalog_index.listeners.append(suggestion_index)
@@ -0,0 +1,165 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from http_client import SingleFlight, http_session
+from image_cache import normalize_image_query
+from resilience import CircuitBreaker, Dependency, raise_for_upstream_error
+
+# Upstream search pages; overridable so lookups can be pointed at a stub
+IMAGE_SEARCH_URL = os.environ.get(
+    "IMAGE_SEARCH_URL", "https://www.google.com/search?q={query}+walmart&tbm=isch")
+WALMART_SEARCH_URL = os.environ.get(
+    "WALMART_SEARCH_URL", "https://www.walmart.com/search?q={query}")
+
+HEADERS = {
+    "User-Agent":
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# Image URLs in image search results
+IMAGE_PATTERNS = [
+    re.compile(r'https://i5\.walmartimages\.com/[^"&]+'),
+    re.compile(r'https://i5\.wimg\.com/[^"&]+'),
+    re.compile(r'https://walmart\.com/[^"]*\.jpg'),
+    re.compile(r'https://walmart\.com/[^"]*\.jpeg'),
+    re.compile(r'https://walmart\.com/[^"]*\.png')
+]
+
+# Image fields embedded in Walmart's own search page
+WALMART_PATTERNS = [
+    re.compile(r'"image":\s*"(https://i5\.walmartimages\.com/[^"]+)"'),
+    re.compile(r'"thumbnail":\s*"(https://i5\.walmartimages\.com/[^"]+)"')
+]
+
+
+# Upstream lookups a batch request may run at once, across all batches
+IMAGE_BATCH_CONCURRENCY = int(os.environ.get("IMAGE_BATCH_CONCURRENCY", 40))
+
+# (connect, read) timeouts, concurrency cap and breaker of image lookups;
+# the cap leaves room for single /walmart-image lookups next to a full
+# batch pool
+walmart_dependency = Dependency(
+    'walmart_image',
+    timeout=(3, float(os.environ.get("IMAGE_READ_TIMEOUT", 6))),
+    max_concurrent=int(os.environ.get("IMAGE_MAX_CONCURRENT",
+                                      IMAGE_BATCH_CONCURRENCY + 8)),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get("IMAGE_BREAKER_FAILURES", 5)),
+        reset_timeout=int(os.environ.get("IMAGE_BREAKER_RESET", 30))))
+
+
+def extract_search_image(html):
+    """First plausible Walmart image URL in image search results, or None"""
+    for pattern in IMAGE_PATTERNS:
+        # Filter out very small images and select the first good one
+        for match in pattern.findall(html)[:3]:  # Try first 3 matches
+            if len(match) > 50:  # Basic quality filter
+                return match
+    return None
+
+
+def extract_walmart_image(html):
+    """First product image URL on a Walmart search page, or None"""
+    for pattern in WALMART_PATTERNS:
+        matches = pattern.findall(html)
+        if matches:
+            return matches[0].replace('\\/', '/')
+    return None
+
+
+def fetch_walmart_image(query):
+    """Look up a product image upstream; returns "" when none is found.
+
+    Network errors, throttling and upstream server errors propagate so
+    callers can tell "no image" from "failed".
+    """
+    # Use a search engine approach for better image results
+    session = http_session()
+    timeout = walmart_dependency.timeout
+    response = session.get(IMAGE_SEARCH_URL.format(query=query),
+                           headers=HEADERS, timeout=timeout)
+    raise_for_upstream_error(response)
+    image_url = extract_search_image(response.text)
+    if image_url:
+        logging.info(f"Found image for {query}: {image_url}")
+        return image_url
+
+    # If no images found, try a simple product search
+    response = session.get(WALMART_SEARCH_URL.format(query=query.split()[0]),
+                           headers=HEADERS, timeout=timeout)
+    raise_for_upstream_error(response)
+    image_url = extract_walmart_image(response.text)
+    if image_url:
+        logging.info(f"Found Walmart image for {query}: {image_url}")
+        return image_url
+
+    logging.warning(f"No image found for {query}")
+    return ""
+
+
+# Concurrent lookups of the same normalized query share one upstream fetch
+image_lookups = SingleFlight()
+
+_batch_executor = ThreadPoolExecutor(max_workers=IMAGE_BATCH_CONCURRENCY,
+                                     thread_name_prefix='image-lookup')
+
+
+def load_image(query, cache, key=None):
+    """Fetch a query upstream (coalesced with identical in-flight fetches)
+    and store the answer in the cache.
+
+    Raises DependencyUnavailable at once while image lookups are failing
+    or saturated.
+    """
+    key = key or normalize_image_query(query)
+
+    def load():
+        image_url = walmart_dependency.call(fetch_walmart_image, query)
+        cache.set(key, image_url)
+        return image_url
+
+    return image_lookups.do(key, load)
+
+
+def resolve_image(query, cache):
+    """Image URL for a query via the cache, fetching upstream at most once
+    per normalized query at a time"""
+    key = normalize_image_query(query)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    return load_image(query, cache, key)
+
+
+def resolve_images(queries, cache, timeout):
+    """Resolve many queries concurrently within a deadline.
+
+    Returns (images, pending, failed): images maps each query answered in
+    time to its URL, pending lists queries still in flight at the deadline
+    (they keep running and land in the cache), failed lists upstream errors.
+    """
+    images = {}
+    futures = {}
+    for query in dict.fromkeys(queries):
+        key = normalize_image_query(query)
+        cached = cache.get(key)
+        if cached is not None:
+            images[query] = cached
+        else:
+            futures[_batch_executor.submit(load_image, query, cache, key)] = query
+
+    done, not_done = wait(futures, timeout=timeout)
+
+    failed = []
+    for future in done:
+        query = futures[future]
+        try:
+            images[query] = future.result()
+        except Exception as e:
+            logging.error(f"Error fetching image for {query}: {str(e)}")
+            failed.append(query)
+
+    pending = [futures[future] for future in not_done]
+    return images, pending, failed